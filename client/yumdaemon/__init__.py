@@ -45,14 +45,22 @@ Usage: (Make your own subclass based on :class:`yumdaemon.YumDaemonClient` and o
             # Do your stuff here
             pass
 
+        def on_DownloadProgress(self, frac, read, total, rate, eta, files, total_files):
+            # Do your stuff here
+            pass
+
         def on_TransactionEvent(self,event, data):
             # Do your stuff here
             pass
 
-        def on_RPMProgress(self, package, action, te_current, te_total, ts_current, ts_total):
+        def on_TransactionProgress(self, frac, package, action, ts_current, ts_total, eta):
             # Do your stuff here
             pass
 
+        def on_RPMProgress(self, package, action, te_current, te_total, ts_current, ts_total):
+            # Only send if enabled by SetRPMProgress(True)
+            pass
+
         def on_GPGImport(self, pkg_id, userid, hexkeyid, keyurl,  timestamp ):
            # do stuff here   
            pass
@@ -79,6 +87,7 @@ import json
 import sys
 import re
 import weakref
+import threading
 import logging
 
 logger = logging.getLogger("yumdaemon.client")
@@ -110,6 +119,12 @@ class YumLockedError(YumDaemonError):
 class YumTransactionError(YumDaemonError):
     'The yum transaction failed'
 
+class YumCancelledError(YumDaemonError):
+    'The operation was cancelled'
+
+class YumCursorExpiredError(YumDaemonError):
+    'The package cursor was closed by the daemon'
+
 ###############################################################################
 # Helper Classes
 ###############################################################################
@@ -148,6 +163,20 @@ class WeakMethod:
         return getattr(self.proxy, self.method)(*args)
 
 
+def _from_v2(value):
+    '''
+    convert a value from a variant returned by the v2 interface back to the python value,
+    None values is sent as a struct (the only struct there can be inside a variant)
+    '''
+    if isinstance(value, tuple):
+        return None
+    elif isinstance(value, list):
+        return [_from_v2(elem) for elem in value]
+    elif isinstance(value, dict):
+        return dict([(key, _from_v2(elem)) for key, elem in value.items()])
+    else:
+        return value
+
 # Get the system bus
 system = DBus(Gio.bus_get_sync(Gio.BusType.SYSTEM, None))
 session = DBus(Gio.bus_get_sync(Gio.BusType.SESSION, None))
@@ -156,12 +185,16 @@ session = DBus(Gio.bus_get_sync(Gio.BusType.SESSION, None))
 # Main Client Class
 ###############################################################################
 class YumDaemonBase:
-    def __init__(self, bus, org, interface):
+    def __init__(self, bus, org, interface, use_v2=True):
         self.bus = bus
         self.dbus_org = org
         self.dbus_interface = interface
+        self._send_lock = threading.Lock() # serialize the sending of the DBus calls
         self.daemon = self._get_daemon(bus, org, interface)
         logger.debug("%s daemon loaded - version :  %s" % (interface,self.daemon.GetVersion()))
+        self.daemon_v2 = None
+        if use_v2:
+            self.daemon_v2 = self._get_daemon_v2(bus, org, interface+'.v2')
 
     def _get_daemon(self,bus, org, interface):
         ''' Get the daemon dbus proxy object'''
@@ -173,6 +206,19 @@ class YumDaemonBase:
         except Exception as err:
             self._handle_dbus_error(err)
 
+    def _get_daemon_v2(self,bus, org, interface):
+        '''
+        Get the dbus proxy object for the v2 interface (native DBus types)
+        return None if the daemon dont have the v2 interface
+        '''
+        try:
+            proxy = bus.get( org, "/", interface)
+            proxy.GetVersion() # check if the interface is there
+            return proxy
+        except Exception as err:
+            logger.debug("%s not available : %s" % (interface, err))
+            return None
+
     def _on_g_signal(self, proxy, sender, signal, params):
         '''
         DBUS signal Handler
@@ -196,7 +242,7 @@ class YumDaemonBase:
         :param err:
         :type err:
         '''
-        exc, msg = self._parse_error()
+        exc, msg = self._parse_error(err)
         if exc != "":
             logger.error("Exception   : %s",exc)
             logger.error("   message  : %s",msg)
@@ -206,17 +252,23 @@ class YumDaemonBase:
             raise YumLockedError(msg)
         elif exc == self.dbus_org+'.YumTransactionError':
             raise YumTransactionError(msg)
+        elif exc == self.dbus_org+'.YumCancelledError':
+            raise YumCancelledError(msg)
+        elif exc == self.dbus_org+'.YumCursorExpiredError':
+            raise YumCursorExpiredError(msg)
         elif exc == self.dbus_org+'.YumNotImplementedError':
             raise YumTransactionError(msg)
         else:
             raise YumDaemonError(str(err))
 
-    def _parse_error(self):
+    def _parse_error(self, err=None):
         '''
         parse values from a DBus releated exception
+        :param err: the exception (default = the exception being handled)
         '''
-        (type, value, traceback) = sys.exc_info()
-        res = DBUS_ERR_RE.match(str(value))
+        if err is None:
+            (type, err, traceback) = sys.exc_info()
+        res = DBUS_ERR_RE.match(str(err))
         if res:
             return res.groups()
         return "",""
@@ -251,20 +303,52 @@ class YumDaemonBase:
         else:
             return user_data['result']
 
-    def _run_dbus_async(self, cmd, *args):
+    def _run_dbus_async(self, cmd, *args, **kwargs):
         '''
         Make an async call to a DBus method in the yumdaemon service
         :param cmd: method to run
         :type cmd: string
+        :param deadline: seconds before the method is cancelled in the daemon (keyword)
+        '''
+        return self._run_proxy_async(self.daemon, cmd, *args, **kwargs)
+
+    def _run_dbus_async_v2(self, cmd, *args, **kwargs):
+        '''
+        Make an async call to a DBus method in the v2 interface of the yumdaemon service
+        :param cmd: method to run
+        :type cmd: string
+        :param deadline: seconds before the method is cancelled in the daemon (keyword)
+        '''
+        return self._run_proxy_async(self.daemon_v2, cmd, *args, **kwargs)
+
+    def _run_proxy_async(self, proxy, cmd, *args, **kwargs):
+        '''
+        Make an async call to a DBus method on a given proxy
+        :param proxy: DBus proxy
+        :param cmd: method to run
+        :type cmd: string
+        :param deadline: seconds before the method is cancelled in the daemon (keyword)
+                         the method will raise a YumCancelledError, if it was cancelled
         '''
         main_loop = GObject.MainLoop()
         data = {'main_loop': main_loop}
-        func = getattr(self.daemon,cmd)
-        func(*args, result_handler=self._return_handler, user_data=data, timeout=GObject.G_MAXINT) # timeout = infinite
+        deadline = kwargs.get('deadline')
+        func = getattr(proxy,cmd)
+        with self._send_lock: # the deadline must be send right before the call it is for
+            if deadline:
+                self.daemon.SetDeadline('(sd)', cmd, float(deadline),
+                                        result_handler=self._ignore_reply, user_data=None)
+            func(*args, result_handler=self._return_handler, user_data=data, timeout=GObject.G_MAXINT) # timeout = infinite
         data['main_loop'].run()
         result = self._get_result(data)
         return result
 
+    def _ignore_reply(self, obj, result, user_data):
+        '''
+        Async DBus call, return handler for calls without a result
+        '''
+        if isinstance(result, Exception):
+            logger.error("async call failed : %s" % str(result))
 
     def _run_dbus_sync(self, cmd, *args):
         '''
@@ -288,11 +372,18 @@ class YumDaemonBase:
         else:
             print("downloading : %s %s" % (name,frac))
 
+    def on_DownloadProgress(self, frac, read, total, rate, eta, files, total_files):
+        print("downloaded %i/%i files : %.2f (%i/%i bytes) rate : %.0f bytes/s eta : %.0fs" %
+              (files, total_files, frac, read, total, rate, eta))
+
     def on_TransactionEvent(self,event, data):
         print("TransactionEvent : %s" % event)
         if data:
             print("Data :\n", data)
 
+    def on_TransactionProgress(self, frac, package, action, ts_current, ts_total, eta):
+        print("TransactionProgress : %.2f (%i/%i) %s %s eta : %.0fs" % (frac, ts_current, ts_total, action, package, eta))
+
     def on_RPMProgress(self, package, action, te_current, te_total, ts_current, ts_total):
         print("RPMProgress : %s %s" % (action, package))
 
@@ -336,7 +427,34 @@ class YumDaemonBase:
         except Exception as err:
             self._handle_dbus_error(err)
 
-    def GetPackageWithAttributes(self, pkg_filter, fields):
+    def GetOperations(self):
+        '''
+        Get the running and queued operations started by this client
+
+        :return: list of (handle, method name) pairs
+        :rtype: list
+        '''
+        try:
+            return [tuple(op) for op in self.daemon.GetOperations()]
+        except Exception as err:
+            self._handle_dbus_error(err)
+
+    def Cancel(self, handle):
+        '''
+        Cancel an operation started by this client, the cancelled
+        method will raise a YumCancelledError.
+
+        :param handle: operation handle (from GetOperations)
+        :type handle: integer
+        :return: False if the operation is not found or can't be cancelled
+        :rtype: boolean
+        '''
+        try:
+            return self.daemon.Cancel("(i)",handle)
+        except Exception as err:
+            self._handle_dbus_error(err)
+
+    def GetPackageWithAttributes(self, pkg_filter, fields, deadline=None):
         '''
         Get a list of pkg list for a given package filter
         each pkg list contains [pkg_id, field,....] where field is a atrribute of the package object
@@ -346,10 +464,113 @@ class YumDaemonBase:
         :type pkg_filter: string
         :param fields: yum package objects attributes to get.
         :type fields: list of strings
+        :param deadline: seconds before the call is cancelled (None = no deadline)
+        :type deadline: float
+        '''
+        if self.daemon_v2:
+            return _from_v2(self._run_dbus_async_v2('GetPackageWithAttributes','(sas)',pkg_filter, fields, deadline=deadline))
+        result = self._run_dbus_async('GetPackageWithAttributes','(sas)',pkg_filter, fields, deadline=deadline)
+        return json.loads(result)
+
+    def GetPackageColumns(self, pkg_filter, fields):
+        '''
+        Get the packages for a given filter in a column format, there is a list for
+        each of the 'name','epoch','version','release' columns, the 'arch' & 'repo' columns
+        contains index into the 'arches' & 'repos' lists and the attribute values is in
+        the 'attr:<field>' columns
+
+        :param pkg_filter: package filter ('installed','available','updates','obsoletes','recent','extras')
+        :type pkg_filter: string
+        :param fields: yum package objects attributes to get.
+        :type fields: list of strings
+        :return: dictionary with the columns
+        '''
+        columns = self._run_dbus_async('GetPackageColumns','(sas)',pkg_filter, fields)
+        for field in columns['fields']:
+            columns['attr:%s' % field] = _from_v2(columns['attr:%s' % field])
+        return columns
+
+    @staticmethod
+    def package_columns_to_rows(columns):
+        '''
+        Convert the result from GetPackageColumns to the [pkg_id, field,....] lists
+        returned by GetPackageWithAttributes
+
+        :param columns: result from GetPackageColumns
+        '''
+        rows = []
+        arches = columns['arches']
+        repos = columns['repos']
+        fields = [columns['attr:%s' % field] for field in columns['fields']]
+        for i in range(len(columns['name'])):
+            pkg_id = ",".join((columns['name'][i], columns['epoch'][i], columns['version'][i],
+                               columns['release'][i], arches[columns['arch'][i]], repos[columns['repo'][i]]))
+            rows.append([pkg_id] + [values[i] for values in fields])
+        return rows
+
+    def OpenPackageCursor(self, pkg_filter, fields):
         '''
-        result = self._run_dbus_async('GetPackageWithAttributes','(sas)',pkg_filter, fields)
+        Open a cursor in the daemon for a package list, so the list can be fetched a page at the time
+        Cursors not used for 5 minutes will be closed by the daemon
+
+        :param pkg_filter: package filter ('installed','available','updates','obsoletes','recent','extras')
+        :type pkg_filter: string
+        :param fields: yum package objects attributes to get.
+        :type fields: list of strings
+        :return: (handle, number of packages) pair
+        '''
+        if self.daemon_v2:
+            return list(self._run_dbus_async_v2('OpenPackageCursor','(sas)',pkg_filter, fields))
+        result = self._run_dbus_async('OpenPackageCursor','(sas)',pkg_filter, fields)
         return json.loads(result)
 
+    def FetchCursor(self, handle, offset, limit):
+        '''
+        Get a page of pkg lists from an open cursor
+        each pkg list contains [pkg_id, field,....] like in GetPackageWithAttributes
+
+        :param handle: cursor handle from OpenPackageCursor
+        :param offset: index of the first package to get (a negative offset is handled as 0)
+        :param limit: max number of packages to get (-1 = no limit)
+        :return: list of pkg lists (None if the cursor is not open or owned by another client)
+        :raises YumCursorExpiredError: the cursor was closed by the daemon (not used for 5 minutes or the repos was changed)
+        '''
+        if self.daemon_v2:
+            found, rows = self._run_dbus_async_v2('FetchCursor','(sii)',handle, offset, limit)
+            if not found:
+                return None
+            return _from_v2(rows)
+        result = self._run_dbus_async('FetchCursor','(sii)',handle, offset, limit)
+        return json.loads(result)
+
+    def CloseCursor(self, handle):
+        '''
+        Close an open cursor
+
+        :param handle: cursor handle from OpenPackageCursor
+        :return: True if the cursor was open
+        '''
+        return self._run_dbus_async('CloseCursor','(s)',handle)
+
+    def GetPackageWithAttributesPaged(self, pkg_filter, fields, page_size=500):
+        '''
+        Generator there yield the pkg lists for a given package filter a page at the time
+
+        :param pkg_filter: package filter ('installed','available','updates','obsoletes','recent','extras')
+        :param fields: yum package objects attributes to get.
+        :param page_size: number of packages in each page
+        :raises YumCursorExpiredError: the cursor was closed by the daemon before all the pages was fetched
+        '''
+        handle, total = self.OpenPackageCursor(pkg_filter, fields)
+        try:
+            for offset in range(0, total, page_size):
+                page = self.FetchCursor(handle, offset, page_size)
+                if page is None: # the cursor is not open
+                    break
+                yield page
+        finally:
+            self.CloseCursor(handle)
+
 
     def GetRepositories(self, repo_filter):
         '''
@@ -369,6 +590,11 @@ class YumDaemonBase:
         :param repo_id: repo id to get information from
         :return: dictionary with repo info
         '''
+        if self.daemon_v2:
+            found, result = self._run_dbus_async_v2('GetRepo','(s)',repo_id)
+            if not found:
+                return None
+            return _from_v2(result)
         result = json.loads(self._run_dbus_async('GetRepo','(s)',repo_id))
         return result
 
@@ -389,6 +615,11 @@ class YumDaemonBase:
         :param setting: setting to read
         :type setting: string
         '''
+        if self.daemon_v2:
+            found, result = self._run_dbus_async_v2('GetConfig','(s)',setting)
+            if not found:
+                return None
+            return _from_v2(result)
         result = json.loads(self._run_dbus_async('GetConfig','(s)',setting))
         return result
 
@@ -399,6 +630,11 @@ class YumDaemonBase:
         :param pkg_id: pkg_id to get attribute from
         :param attr: name of attribute to get
         '''
+        if self.daemon_v2:
+            found, result = self._run_dbus_async_v2('GetAttribute','(ss)',pkg_id, attr)
+            if not found:
+                return None
+            return _from_v2(result)
         result = self._run_dbus_async('GetAttribute','(ss)',pkg_id, attr)
         if result == ':none': # illegal attribute
             result = None
@@ -408,25 +644,86 @@ class YumDaemonBase:
             result = json.loads(result)
         return result
 
+    def GetAttributeSlice(self, pkg_id, attr, offset=0, limit=-1):
+        '''
+        Get a part of a list attribute (changelog, filelist etc), only the part asked
+        for is read and send by the daemon
+
+        :param pkg_id: pkg_id to get attribute from
+        :param attr: name of attribute to get
+        :param offset: index of the first item to get
+        :param limit: max number of items to get (-1 = no limit)
+        :return: (total number of items, list of items) or None if the package is not found
+        '''
+        if self.daemon_v2:
+            found, total, items = self._run_dbus_async_v2('GetAttributeSlice','(ssii)',pkg_id, attr, offset, limit)
+            if not found:
+                return None
+            return (total, _from_v2(items))
+        result = json.loads(self._run_dbus_async('GetAttributeSlice','(ssii)',pkg_id, attr, offset, limit))
+        if result is None:
+            return None
+        return tuple(result)
+
+    def GetAttributes(self, pkg_ids, attrs):
+        '''
+        Get a list of yum package attributes for a list of packages in one call
+
+        :param pkg_ids: list of pkg_ids to get attributes from
+        :param attrs: list of attribute names to get (summary, size, action etc.)
+        :return: dictionary with a {attr: value} dictionary for each pkg_id (None if pkg_id is not found)
+        '''
+        if self.daemon_v2:
+            found = self._run_dbus_async_v2('GetAttributes','(asas)',pkg_ids, attrs)
+            result = {}
+            for pkg_id in pkg_ids: # pkg_ids not found & None values is left out by the daemon
+                if pkg_id in found:
+                    result[pkg_id] = dict([(attr, _from_v2(found[pkg_id].get(attr))) for attr in attrs])
+                else:
+                    result[pkg_id] = None
+            return result
+        result = self._run_dbus_async('GetAttributes','(asas)',pkg_ids, attrs)
+        return json.loads(result)
+
     def GetUpdateInfo(self, pkg_id):
         '''
         Get Updateinfo for a package
 
         :param pkg_id: pkg_id to get update info from
         '''
+        if self.daemon_v2:
+            found, result = self._run_dbus_async_v2('GetUpdateInfo','(s)',pkg_id)
+            if not found:
+                return None
+            return _from_v2(result)
         result = self._run_dbus_async('GetUpdateInfo','(s)',pkg_id)
         return json.loads(result)
 
-    def GetPackages(self, pkg_filter):
+    def GetUpdateInfos(self, pkg_ids):
+        '''
+        Get Updateinfo for a list of packages in one call
+
+        :param pkg_ids: list of pkg_ids to get update info from
+        :return: dictionary with a list of notices for each pkg_id (None if pkg_id is not found)
+        '''
+        if self.daemon_v2:
+            found = self._run_dbus_async_v2('GetUpdateInfos','(as)',pkg_ids)
+            return dict([(pkg_id, _from_v2(found.get(pkg_id))) for pkg_id in pkg_ids])
+        result = self._run_dbus_async('GetUpdateInfos','(as)',pkg_ids)
+        return json.loads(result)
+
+    def GetPackages(self, pkg_filter, deadline=None):
         '''
         Get a list of pkg ids for a given filter (installed, updates ..)
 
         :param pkg_filter: package filter ('installed','available','updates','obsoletes','recent','extras')
         :type pkg_filter: string
+        :param deadline: seconds before the call is cancelled (None = no deadline)
+        :type deadline: float
         :return: list of pkg_id's
         :rtype: list of strings
         '''
-        return self._run_dbus_async('GetPackages','(s)',pkg_filter)
+        return self._run_dbus_async('GetPackages','(s)',pkg_filter, deadline=deadline)
 
 
     def GetPackagesByName(self, name, newest_only=True):
@@ -441,11 +738,62 @@ class YumDaemonBase:
         '''
         return self._run_dbus_async('GetPackagesByName','(sb)',name, newest_only)
 
+    def WhatProvides(self, patterns):
+        '''
+        Get a list of pkg ids for the installed & available packages providing
+        some capabilities or files (like yum provides)
+
+        :param patterns: list of capabilities/files (ex. /usr/bin/foo, libssl.so.10()(64bit))
+        :type patterns: list of strings
+        :return: list of pkg_id's
+        '''
+        return self._run_dbus_async('WhatProvides','(as)',patterns)
+
+    def GetRequires(self, pkg_ids):
+        '''
+        Get the packages providing the requirements for a list of packages
+        (installed providers is preferred, else the newest available ones)
+
+        :param pkg_ids: list of pkg_ids
+        :return: dictionary with a list of pkg_ids for each pkg_id (None if pkg_id is not found)
+        '''
+        if self.daemon_v2:
+            found = self._run_dbus_async_v2('GetRequires','(as)',pkg_ids)
+            return dict([(pkg_id, found.get(pkg_id)) for pkg_id in pkg_ids])
+        return json.loads(self._run_dbus_async('GetRequires','(as)',pkg_ids))
+
+    def GetRequiredBy(self, pkg_ids):
+        '''
+        Get the installed packages requiring a list of packages
+
+        :param pkg_ids: list of pkg_ids
+        :return: dictionary with a list of pkg_ids for each pkg_id (None if pkg_id is not found)
+        '''
+        if self.daemon_v2:
+            found = self._run_dbus_async_v2('GetRequiredBy','(as)',pkg_ids)
+            return dict([(pkg_id, found.get(pkg_id)) for pkg_id in pkg_ids])
+        return json.loads(self._run_dbus_async('GetRequiredBy','(as)',pkg_ids))
+
+    def GetDependencyClosure(self, pkg_ids, reverse=False):
+        '''
+        Get all the packages needed by a list of packages (all levels) or if reverse is True,
+        the installed packages there need them (what a remove will remove too)
+        The depsolver is not used, so the transaction is not changed
+
+        :param pkg_ids: list of pkg_ids
+        :param reverse: get the installed packages there need them
+        :return: list of pkg_ids
+        '''
+        return self._run_dbus_async('GetDependencyClosure','(asb)',pkg_ids, reverse)
+
 
     def GetGroups(self):
         '''
         Get list of Groups
         '''
+        if self.daemon_v2:
+            result = self._run_dbus_async_v2('GetGroups')
+            return [[list(cat), [list(grp) for grp in grps]] for cat, grps in result]
         return json.loads(self._run_dbus_async('GetGroups'))
 
     def GetGroupPackages(self, grp_id, grp_flt):
@@ -457,8 +805,21 @@ class YumDaemonBase:
         '''
         return self._run_dbus_async('GetGroupPackages', '(ss)', grp_id, grp_flt)
 
+    def GetGroupsPackages(self, grp_ids, grp_flt):
+        '''
+        Get packages for a list of groups in one call
+
+        :param grp_ids: the group ids to get packages for
+        :param grp_flt: the filter ('all' = all packages ,'default' = packages to be installed, before the group is installed)
+        :return: dictionary with a list of pkg_ids for each group id
+        '''
+        if self.daemon_v2:
+            return self._run_dbus_async_v2('GetGroupsPackages', '(ass)', grp_ids, grp_flt)
+        result = self._run_dbus_async('GetGroupsPackages', '(ass)', grp_ids, grp_flt)
+        return json.loads(result)
+
 
-    def Search(self, fields, keys, match_all, newest_only, tags):
+    def Search(self, fields, keys, match_all, newest_only, tags, deadline=None):
         '''
         Search for packages where keys is matched in fields
 
@@ -472,10 +833,33 @@ class YumDaemonBase:
         :type newest_only: boolean
         :param tags: search pkgtags
         :type tags: boolean
+        :param deadline: seconds before the call is cancelled (None = no deadline)
+        :type deadline: float
         :return: list of pkg_id's
 
         '''
-        return self._run_dbus_async('Search','(asasbbb)',fields, keys, match_all, newest_only, tags)
+        return self._run_dbus_async('Search','(asasbbb)',fields, keys, match_all, newest_only, tags, deadline=deadline)
+
+    def GetSearchCacheStats(self):
+        '''
+        Get the counters of the search result cache in the daemon (for tuning)
+
+        :return: dictionary with hits, misses, narrowed, size & max_size
+        '''
+        if self.daemon_v2:
+            return _from_v2(self._run_dbus_async_v2('GetSearchCacheStats'))
+        return json.loads(self._run_dbus_async('GetSearchCacheStats'))
+
+    def GetProgressStats(self):
+        '''
+        Get the progress signal counters in the daemon, the number of signals
+        send and suppressed by the rate limit (for tuning)
+
+        :return: dictionary with max_rate, sent & suppressed
+        '''
+        if self.daemon_v2:
+            return _from_v2(self._run_dbus_async_v2('GetProgressStats'))
+        return json.loads(self._run_dbus_async('GetProgressStats'))
 
     def Exit(self):
         ''' 
@@ -504,8 +888,8 @@ class YumDaemonReadOnlyClient(YumDaemonBase):
     A class to communicate with the yumdaemon DBus services in a easy way
     '''
 
-    def __init__(self):
-        YumDaemonBase.__init__(self, session,ORG_READONLY,INTERFACE_READONLY)
+    def __init__(self, use_v2=True):
+        YumDaemonBase.__init__(self, session,ORG_READONLY,INTERFACE_READONLY, use_v2)
 
     def handle_dbus_signals(self, proxy, sender, signal, args):
         '''
@@ -522,8 +906,8 @@ class YumDaemonClient(YumDaemonBase):
     A class to communicate with the yumdaemon DBus services in a easy way
     '''
 
-    def __init__(self):
-        YumDaemonBase.__init__(self, system,ORG,INTERFACE)
+    def __init__(self, use_v2=True):
+        YumDaemonBase.__init__(self, system,ORG,INTERFACE, use_v2)
 
     def handle_dbus_signals(self, proxy, sender, signal, args):
         '''
@@ -531,8 +915,12 @@ class YumDaemonClient(YumDaemonBase):
         '''
         if signal == "UpdateProgress":
             self.on_UpdateProgress(*args)
+        elif signal == "DownloadProgress":
+            self.on_DownloadProgress(*args)
         elif signal == "TransactionEvent":
             self.on_TransactionEvent(*args)
+        elif signal == "TransactionProgress":
+            self.on_TransactionProgress(*args)
         elif signal == "RPMProgress":
             self.on_RPMProgress(*args)
         elif signal == "GPGImport":
@@ -544,6 +932,19 @@ class YumDaemonClient(YumDaemonBase):
 # API Methods
 ###############################################################################
 
+    def SetRPMProgress(self, state):
+        '''
+        Enable the raw RPMProgress signals for every rpm callback (default disabled)
+        the TransactionProgress signals with the progress for the whole transaction is always send
+
+        :param state: True = RPMProgress signals enabled, False = disabled
+        :type state: boolean (b)
+        '''
+        try:
+            self.daemon.SetRPMProgress("(b)",state)
+        except Exception as err:
+            self._handle_dbus_error(err)
+
     def SetConfig(self, setting, value):
         '''
         set a yum config setting
@@ -591,6 +992,9 @@ class YumDaemonClient(YumDaemonBase):
         :param pattern: package pattern to install
         :type pattern: string
        '''
+        if self.daemon_v2:
+            rc, output = self._run_dbus_async_v2('Install','(s)',pattern)
+            return [rc, _from_v2(output)]
         return json.loads(self._run_dbus_async('Install','(s)',pattern))
 
 
@@ -601,6 +1005,9 @@ class YumDaemonClient(YumDaemonBase):
         :param pattern: package pattern to remove
         :type pattern: string
         '''
+        if self.daemon_v2:
+            rc, output = self._run_dbus_async_v2('Remove','(s)',pattern)
+            return [rc, _from_v2(output)]
         return json.loads(self._run_dbus_async('Remove','(s)',pattern))
 
 
@@ -612,6 +1019,9 @@ class YumDaemonClient(YumDaemonBase):
         :type pattern: string
 
         '''
+        if self.daemon_v2:
+            rc, output = self._run_dbus_async_v2('Update','(s)',pattern)
+            return [rc, _from_v2(output)]
         return json.loads(self._run_dbus_async('Update','(s)',pattern))
 
 
@@ -623,6 +1033,9 @@ class YumDaemonClient(YumDaemonBase):
         :type pattern: string
 
         '''
+        if self.daemon_v2:
+            rc, output = self._run_dbus_async_v2('Reinstall','(s)',pattern)
+            return [rc, _from_v2(output)]
         return json.loads(self._run_dbus_async('Reinstall','(s)',pattern))
 
 
@@ -633,22 +1046,35 @@ class YumDaemonClient(YumDaemonBase):
         :param pattern: package pattern to downgrade
         :type pattern: string
         '''
+        if self.daemon_v2:
+            rc, output = self._run_dbus_async_v2('Downgrade','(s)',pattern)
+            return [rc, _from_v2(output)]
         return json.loads(self._run_dbus_async('Downgrade','(s)',pattern))
 
 
 
-    def BuildTransaction(self):
+    def BuildTransaction(self, deadline=None):
         '''
         Get a list of pkg ids for the current availabe updates
+
+        :param deadline: seconds before the call is cancelled (None = no deadline)
+        :type deadline: float
         '''
-        return json.loads(self._run_dbus_async('BuildTransaction'))
+        if self.daemon_v2:
+            rc, output = self._run_dbus_async_v2('BuildTransaction', deadline=deadline)
+            return [rc, _from_v2(output)]
+        return json.loads(self._run_dbus_async('BuildTransaction', deadline=deadline))
 
 
-    def RunTransaction(self):
+    def RunTransaction(self, deadline=None):
         '''
         Get a list of pkg ids for the current availabe updates
+
+        :param deadline: seconds before the call is cancelled (None = no deadline),
+                         the transaction can't be cancelled, when the rpm transaction is started
+        :type deadline: float
         '''
-        return self._run_dbus_async('RunTransaction')
+        return self._run_dbus_async('RunTransaction', deadline=deadline)
 
 
     def GetHistoryByDays(self, start_days, end_days):
@@ -662,9 +1088,32 @@ class YumDaemonClient(YumDaemonBase):
         :return: a list of (transaction is, date-time) pairs
         :type sender: json encoded string
         '''
+        if self.daemon_v2:
+            value = self._run_dbus_async_v2('GetHistoryByDays','(ii)', start_days, end_days)
+            return [list(elem) for elem in value]
         value = self._run_dbus_async('GetHistoryByDays','(ii)', start_days, end_days)
         return json.loads(value)
 
+    def GetHistoryByDaysPaged(self, start_days, end_days, offset=0, limit=-1):
+        '''
+        Get a page of the History transaction in a interval of days from today (newest first)
+
+        :param start_days: start of interval in days from now (0 = today)
+        :type start_days: integer
+        :param end_days:end of interval in days from now
+        :type end_days: integer
+        :param offset: number of transactions to skip
+        :type offset: integer
+        :param limit: max number of transactions (-1 = no limit)
+        :type limit: integer
+        :return: a list of (transaction is, date-time) pairs
+        '''
+        if self.daemon_v2:
+            value = self._run_dbus_async_v2('GetHistoryByDaysPaged','(iiii)', start_days, end_days, offset, limit)
+            return [list(elem) for elem in value]
+        value = self._run_dbus_async('GetHistoryByDaysPaged','(iiii)', start_days, end_days, offset, limit)
+        return json.loads(value)
+
     def HistorySearch(self, pattern):
         '''
         Search the history for transaction matching a pattern
@@ -674,6 +1123,9 @@ class YumDaemonClient(YumDaemonBase):
         :return: list of (tid,isodates)
         :type sender: json encoded string
         '''
+        if self.daemon_v2:
+            value = self._run_dbus_async_v2('HistorySearch','(as)', pattern)
+            return [list(elem) for elem in value]
         value = self._run_dbus_async('HistorySearch','(as)', pattern)
         return json.loads(value)
 
@@ -686,9 +1138,26 @@ class YumDaemonClient(YumDaemonBase):
         :return: list of (pkg_id, state, installed) pairs
         :rtype: list
         '''
+        if self.daemon_v2:
+            return _from_v2(self._run_dbus_async_v2('GetHistoryPackages','(i)',tid))
         value = self._run_dbus_async('GetHistoryPackages','(i)',tid)
         return json.loads(value)
 
+    def GetHistoryTransactionsPackages(self, tids):
+        '''
+        Get packages from a list of yum history transaction ids
+
+        :param tids: history transaction ids
+        :type tids: list (integers)
+        :return: {tid : [(pkg_id, state, installed),...]} dict
+        :rtype: dict
+        '''
+        if self.daemon_v2:
+            value = self._run_dbus_async_v2('GetHistoryTransactionsPackages','(ai)',tids)
+            return dict([(int(tid), _from_v2(pkgs)) for tid, pkgs in value.items()])
+        value = self._run_dbus_async('GetHistoryTransactionsPackages','(ai)',tids)
+        return dict([(int(tid), pkgs) for tid, pkgs in json.loads(value).items()])
+
     def ConfirmGPGImport(self, hexkeyid, confirmed):
         '''
         Confirm import of at GPG Key by yum
@@ -134,10 +134,18 @@ class TestBase(unittest.TestCase, YumDaemonClient):
         self._signals.append("UpdateProgress")
         pass
 
+    def on_DownloadProgress(self, frac, read, total, rate, eta, files, total_files):
+        self._signals.append("DownloadProgress")
+        pass
+
     def on_TransactionEvent(self,event, data):
         self._signals.append("TransactionEvent")
         pass
 
+    def on_TransactionProgress(self, frac, package, action, ts_current, ts_total, eta):
+        self._signals.append("TransactionProgress")
+        pass
+
     def on_RPMProgress(self, package, action, te_current, te_total, ts_current, ts_total):
         self._signals.append("RPMProgress")
         pass
@@ -0,0 +1,209 @@
+import sys, os
+import shutil
+import tempfile
+import unittest
+sys.path.insert(0,os.path.abspath('yumdaemon'))
+from common import DependencyGraph, ProgressThrottle, TransactionProgress, MultiDownloadCallback, DownloadCallback, WorkQueue
+from yum.constants import TS_INSTALL, TS_UPDATE, TS_UPDATED
+try:
+    from urlgrabber.grabber import urlgrab, parallel_wait
+except ImportError: # urlgrabber without parallel downloads
+    parallel_wait = None
+
+"""
+Unit tests for the helper classes in yumdaemon/common.py, there don't need a running daemon
+
+use 'nosetests -v test/test-common.py' to run the tests
+"""
+
+###############################################################################
+# Fake yum objects & daemon
+###############################################################################
+
+class FakePackage:
+    '''
+    Package with the fields used by the dependency graph & the transaction progress model
+    provides & requires is lists of (name, flag, evr)
+    '''
+    def __init__(self, name, provides=[], requires=[], files=[], repoid='installed', size=0):
+        self.name = name
+        self.size = size
+        self.pkgtup = (name, 'noarch', '0', '1', '1')
+        self.repoid = repoid
+        self.provides = [(name, 'EQ', ('0', '1', '1'))] + [(prov, None, (None, None, None)) for prov in provides]
+        self.requires = [(req, None, (None, None, None)) for req in requires]
+        self.filelist = files
+        self.dirlist = []
+
+    def checkPrco(self, prcotype, req):
+        return req[0] in [prov[0] for prov in self.provides]
+
+    def returnFileEntries(self, ftype='file', primary_only=False):
+        if ftype != 'file':
+            return []
+        if primary_only:
+            return [name for name in self.filelist if name.startswith('/etc/') or 'bin/' in name]
+        return self.filelist
+
+    def __repr__(self):
+        return self.name
+
+class FakeRpmdb:
+    def __init__(self, pkgs):
+        self.pkgs = pkgs
+
+    def getProvides(self, name, flag=None, evr=None):
+        return dict([(po, []) for po in self.pkgs if po.checkPrco('provides', (name, flag, evr))])
+
+    def searchFiles(self, name):
+        return [po for po in self.pkgs if name in po.filelist]
+
+class FakeYumBase:
+    def __init__(self, pkgs):
+        self.rpmdb = FakeRpmdb(pkgs)
+
+class FakeTxmbr:
+    def __init__(self, name, size, state):
+        self.po = FakePackage(name, size=size)
+        self.output_state = state
+
+class FakeTsInfo:
+    def __init__(self, members):
+        self.members = members
+
+    def getMembers(self):
+        return self.members
+
+class ProgressRecorder:
+    '''
+    Daemon with the progress signals used by the download callbacks
+    '''
+    def __init__(self):
+        self._worker = WorkQueue()
+        self._progress_throttle = ProgressThrottle()
+        self.files = {}
+        self.totals = []
+
+    def UpdateProgress(self, name, frac, fread, ftime):
+        self.files.setdefault(name, []).append(frac)
+
+    def DownloadProgress(self, frac, read, total, rate, eta, files, total_files):
+        self.totals.append((frac, read, total, files, total_files))
+
+###############################################################################
+# Tests
+###############################################################################
+
+class TestDependencyGraph(unittest.TestCase):
+
+    def _graph(self, pkgs):
+        return DependencyGraph(FakeYumBase(pkgs), dict([(po.pkgtup, po) for po in pkgs]))
+
+    def test_RemoveClosure(self):
+        '''
+        Common: reverse closure only removes packages with no provider left
+        '''
+        mta1 = FakePackage('mta1', provides=['smtp-daemon'])
+        mta2 = FakePackage('mta2', provides=['smtp-daemon'])
+        mail = FakePackage('mail', requires=['smtp-daemon'])
+        libfoo = FakePackage('libfoo', files=['/usr/lib/libfoo.so'])
+        foo = FakePackage('foo', requires=['/usr/lib/libfoo.so', 'mail'])
+        graph = self._graph([mta1, mta2, mail, libfoo, foo])
+        # mail still has mta2 providing smtp-daemon
+        self.assertEqual(graph.required_by(mta1), set([mail]))
+        self.assertEqual(graph.closure([mta1], True), set())
+        # without any provider left, mail and foo (requiring mail) is removed too
+        self.assertEqual(graph.closure([mta1, mta2], True), set([mail, foo]))
+        # file requirements
+        self.assertEqual(graph.closure([libfoo], True), set([foo]))
+
+    def test_RequiredByAvailable(self):
+        '''
+        Common: only the primary files of an available package is checked
+        '''
+        tool = FakePackage('tool', requires=['/usr/bin/foo', '/usr/lib/libfoo.so'])
+        graph = self._graph([tool])
+        foo = FakePackage('foo', files=['/usr/bin/foo', '/usr/lib/libfoo.so'], repoid='updates')
+        self.assertEqual(graph.required_by(foo), set([tool]))
+        self.assertEqual(graph._get_requirers(foo)[tool], [('/usr/bin/foo', None, (None, None, None))])
+
+class TestProgressThrottle(unittest.TestCase):
+
+    def test_RateLimit(self):
+        '''
+        Common: Progress signal rate limit
+        '''
+        throttle = ProgressThrottle(max_rate=10.0)
+        start = 1000.0
+        self.assertTrue(throttle.allow('file1', now=start)) # the first update is always send
+        self.assertTrue(throttle.allow('file2', now=start)) # the files is throttled one by one
+        for i in range(1, 100): # 100 updates pr. second
+            throttle.allow('file1', now=start + i * 0.01)
+        self.assertTrue(throttle.allow('file1', done=True, now=start + 1.0)) # the last update is always send
+        self.assertLessEqual(throttle.sent, 13)
+        self.assertEqual(throttle.sent + throttle.suppressed, 102)
+        self.assertTrue(throttle.allow('file1', now=start + 1.0)) # a new download of the same file
+
+    def test_Forget(self):
+        '''
+        Common: a forgotten file is not counted as a sent signal
+        '''
+        throttle = ProgressThrottle(max_rate=10.0)
+        self.assertTrue(throttle.allow('file1', now=1000.0))
+        throttle.forget('file1') # the download failed, no signal is send
+        self.assertEqual((throttle.sent, throttle.suppressed), (1, 0))
+        self.assertTrue(throttle.allow('file1', now=1000.01)) # a new download of the same file
+
+class TestTransactionProgress(unittest.TestCase):
+
+    def test_Progress(self):
+        '''
+        Common: Transaction progress model
+        '''
+        tsinfo = FakeTsInfo([FakeTxmbr('big', 8000, TS_INSTALL), FakeTxmbr('small', 1000, TS_UPDATE),
+                             FakeTxmbr('small', 10000, TS_UPDATED)]) # cleanup count 10%
+        model = TransactionProgress(tsinfo)
+        self.assertEqual(model.update('big', TS_INSTALL, 0, 100, now=10.0), 0.0)
+        self.assertAlmostEqual(model.update('big', TS_INSTALL, 50, 100, now=14.0), 0.4)
+        self.assertAlmostEqual(model.eta(now=14.0), 6.0)
+        self.assertAlmostEqual(model.update('big', TS_INSTALL, 100, 100, now=18.0), 0.8)
+        self.assertAlmostEqual(model.update('small', TS_UPDATE, 100, 100, now=19.0), 0.9)
+        self.assertAlmostEqual(model.update('small', TS_UPDATED, 100, 100, now=20.0), 1.0)
+        self.assertEqual(model.eta(now=20.0), 0.0)
+
+@unittest.skipIf(parallel_wait is None, 'urlgrabber without parallel downloads')
+class TestParallelDownload(unittest.TestCase):
+
+    def test_ParallelDownload(self):
+        '''
+        Common: Parallel download progress (local file:// repo)
+        '''
+        src = tempfile.mkdtemp()
+        dst = tempfile.mkdtemp()
+        try:
+            size = 1024 * 1024
+            names = ['pkg-%i.rpm' % i for i in range(5)]
+            for name in names:
+                open(os.path.join(src, name), 'wb').write(os.urandom(size))
+            base = ProgressRecorder()
+            single = DownloadCallback(base)
+            multi = MultiDownloadCallback(base)
+            for name in names:
+                urlgrab('file://' + os.path.join(src, name), os.path.join(dst, name), text=name, size=size,
+                        progress_obj=single, multi_progress_obj=multi, **{'async': ('local', 3)})
+            parallel_wait()
+            for name in names:
+                self.assertEqual(os.path.getsize(os.path.join(dst, name)), size)
+                self.assertEqual(base.files[name][-1], 1.0) # last update for each file is 1.0
+            self.assertTrue(base.totals)
+            frac, read, total, files, total_files = base.totals[-1]
+            self.assertEqual(total, size * len(names))
+            self.assertEqual(read, total)
+            self.assertEqual(frac, 1.0)
+            self.assertEqual((files, total_files), (len(names), len(names)))
+        finally:
+            shutil.rmtree(src)
+            shutil.rmtree(dst)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,12 @@
 import sys, os
+import json
+import time
 sys.path.insert(0,os.path.abspath('client'))
 from base import TestBaseReadonly as TestBase
-from yumdaemon import YumLockedError
+from yumdaemon import YumLockedError, YumCancelledError, YumCursorExpiredError, YumDaemonReadOnlyClient
 from nose.exc import SkipTest
+from gi.repository import GObject
+from subprocess import check_output, Popen, PIPE
 
 
 class TestAPI(TestBase):
@@ -25,6 +29,57 @@ class TestAPI(TestBase):
         self.Lock()
 
 
+    def test_SharedLock(self):
+        '''
+        Session: Lock shared by more clients
+        '''
+        print
+        # we are holding the lock (grabbed by setUp), a client in another process
+        # should be able to get the lock and read packages at the same time
+        script = ("import sys; sys.path.insert(0, 'client')\n"
+                  "from yumdaemon import YumDaemonReadOnlyClient\n"
+                  "cli = YumDaemonReadOnlyClient()\n"
+                  "if cli.Lock():\n"
+                  "    print(len(cli.GetPackagesByName('yum', True)))\n"
+                  "    cli.Unlock()\n")
+        output = check_output([sys.executable, '-c', script])
+        print("  other client got %s packages" % output.strip())
+        self.assertEqual(output.strip(), '1')
+        # the lock is still ours
+        pkgs = self.GetPackagesByName('yum', newest_only=True)
+        self.assertEqual(len(pkgs), 1)
+
+    def test_SharedLockExclusive(self):
+        '''
+        Session: only one client can wait for exclusive access
+        '''
+        print
+        enabled = self.GetRepositories('enabled')
+        # another client get the lock and wait for exclusive access in SetEnabledRepos
+        script = ("import sys; sys.path.insert(0, 'client')\n"
+                  "from yumdaemon import YumDaemonReadOnlyClient\n"
+                  "cli = YumDaemonReadOnlyClient()\n"
+                  "cli.Lock()\n"
+                  "print('locked'); sys.stdout.flush()\n"
+                  "cli.SetEnabledRepos(sys.argv[1:])\n"
+                  "print('exclusive')\n"
+                  "cli.Unlock()\n")
+        proc = Popen([sys.executable, '-c', script] + enabled, stdout=PIPE)
+        self.assertEqual(proc.stdout.readline().strip(), 'locked')
+        time.sleep(1) # let the SetEnabledRepos call reach the daemon
+        # we can't wait for exclusive access too, it would deadlock
+        self.assertRaises(YumLockedError, self.SetEnabledRepos, enabled)
+        # new clients can't get the lock, while a client is waiting
+        other = YumDaemonReadOnlyClient()
+        self.assertFalse(other.Lock())
+        # release our lock, so the other client get exclusive access
+        self.Unlock()
+        self.assertEqual(proc.stdout.readline().strip(), 'exclusive')
+        self.assertEqual(proc.wait(), 0)
+        # get the Lock again, else tearDown will fail
+        self.Lock()
+        self.assertEqual(sorted(self.GetRepositories('enabled')), sorted(enabled))
+
     def test_GetPackagesByName(self):
         '''
         Session: GetPackagesByName
@@ -89,6 +144,249 @@ class TestAPI(TestBase):
             self.assertEqual(len(pkgs),0) # the should be notting
             print('  packages found : %s ' % len(pkgs))
 
+    def test_GetAttributes(self):
+        '''
+        Session: GetAttributes
+        '''
+        print
+        pkgs = self.GetPackagesByName('yum', newest_only=False)
+        self.assertGreater(len(pkgs),0)
+        attrs = ['summary','size','action','notfound']
+        result = self.GetAttributes(pkgs + ['not,0,1,1,noarch,notfound'], attrs)
+        self.assertIsInstance(result, dict)
+        for pkg_id in pkgs:
+            values = result[pkg_id]
+            self.assertIsInstance(values, dict)
+            print "  %s : %s" % (pkg_id, values)
+            self.assertEqual(values['summary'], self.GetAttribute(pkg_id, 'summary'))
+            self.assertEqual(values['action'], self.GetAttribute(pkg_id, 'action'))
+            self.assertIsNone(values['notfound'])
+        self.assertIsNone(result['not,0,1,1,noarch,notfound'])
+        # a package in an enabled repo, but with an unknown repo id is not found
+        for pkg_id in pkgs:
+            (n, e, v, r, a, repo_id) = self.to_pkg_tuple(pkg_id)
+            self.assertIsNone(self.GetAttribute(",".join((n, e, v, r, a, 'notfound-repo')), 'summary'))
+
+    def test_WhatProvides(self):
+        '''
+        Session: WhatProvides
+        '''
+        print
+        pkgs = self.WhatProvides(['/usr/bin/yum'])
+        print "  /usr/bin/yum : %s" % pkgs
+        self.assertGreater(len(pkgs), 0)
+        for pkg_id in pkgs:
+            self.assertEqual(self.to_pkg_tuple(pkg_id)[0], 'yum')
+        self.assertEqual(pkgs, self.WhatProvides(['/usr/bin/yum'])) # cached
+        pkgs = self.WhatProvides(['yum', '/usr/bin/yum'])
+        self.assertGreater(len(pkgs), 0)
+        self.assertEqual(self.WhatProvides(['/not/found/zzzzddddsss']), [])
+
+    def test_Dependencies(self):
+        '''
+        Session: GetRequires, GetRequiredBy & GetDependencyClosure
+        '''
+        print
+        pkgs = self.GetPackagesByName('yum', newest_only=True)
+        requires = self.GetRequires(pkgs + ['not,0,1,1,noarch,notfound'])
+        self.assertIsNone(requires['not,0,1,1,noarch,notfound'])
+        for pkg_id in pkgs:
+            print "  %s requires : %s" % (pkg_id, requires[pkg_id])
+            self.assertGreater(len(requires[pkg_id]), 0) # yum needs python
+            self.assertNotIn(pkg_id, requires[pkg_id])
+        closure = self.GetDependencyClosure(pkgs)
+        for pkg_id in requires[pkgs[0]]:
+            self.assertIn(pkg_id, closure)
+        python = [pkg_id for pkg_id in self.GetPackages('installed') if self.to_pkg_tuple(pkg_id)[0] == 'python']
+        self.assertEqual(len(python), 1)
+        required_by = self.GetRequiredBy(python)[python[0]]
+        print "  %s required by %i packages" % (python[0], len(required_by))
+        installed_yum = [pkg_id for pkg_id in required_by if self.to_pkg_tuple(pkg_id)[0] == 'yum']
+        self.assertEqual(len(installed_yum), 1) # yum is installed and need python
+        removed = self.GetDependencyClosure(python, True)
+        self.assertIn(installed_yum[0], removed)
+        for pkg_id in removed:
+            self.assertNotIn(pkg_id, python)
+
+    def test_GetAttributeSlice(self):
+        '''
+        Session: GetAttributeSlice
+        '''
+        print
+        pkgs = self.GetPackagesByName('yum', newest_only=False)
+        for pkg_id in pkgs:
+            for attr in ['changelog','filelist','dirlist']:
+                total, items = self.GetAttributeSlice(pkg_id, attr, 0, 3)
+                print "  %s %s : %i of %i" % (pkg_id, attr, len(items), total)
+                self.assertEqual(len(items), min(3, total))
+                total2, rest = self.GetAttributeSlice(pkg_id, attr, 3, -1)
+                self.assertEqual(len(items) + len(rest), total)
+                # get the full list last, so the slices are read without the list loaded
+                full = self.GetAttribute(pkg_id, attr)
+                self.assertEqual(total, len(full))
+                if attr != 'changelog':
+                    self.assertEqual(items + rest, full)
+            total, items = self.GetAttributeSlice(pkg_id, 'changelog', 0, 3)
+            self.show_changelog(items)
+        self.assertIsNone(self.GetAttributeSlice('not,0,1,1,noarch,notfound', 'changelog', 0, 3))
+
+    def test_VersionLadder(self):
+        '''
+        Session: GetAttributes with newer, older & downgrades
+        '''
+        print
+        pkgs = self.GetPackagesByName('yum', newest_only=False)
+        result = self.GetAttributes(pkgs, ['newer','older','downgrades'])
+        for pkg_id in pkgs:
+            values = result[pkg_id]
+            print "  %s : %s" % (pkg_id, values)
+            (n, e, v, r, a, repo_id) = self.to_pkg_tuple(pkg_id)
+            for other in values['newer'] + values['older']:
+                self.assertEqual(self.to_pkg_tuple(other)[0], n)
+                self.assertNotIn(other, [pkg_id])
+            for other in values['downgrades']:
+                if repo_id == 'installed':
+                    self.assertIn(other, values['older'])
+        newest = self.GetPackagesByName('yum', newest_only=True)
+        self.assertEqual(self.GetAttribute(newest[0], 'newer'), [])
+
+    def test_PkgTags(self):
+        '''
+        Session: pkgtags attribute
+        '''
+        print
+        pkgs = self.Search(['name'], ['retro'], True, True, True) # retro should match some pkgtags
+        result = self.GetAttributes(pkgs, ['pkgtags'])
+        for pkg_id in pkgs:
+            tags = result[pkg_id]['pkgtags']
+            print "  %s : %s" % (pkg_id, tags)
+            self.assertIsInstance(tags, list)
+            self.assertEqual(tags, self.GetAttribute(pkg_id, 'pkgtags'))
+
+    def test_GetUpdateInfos(self):
+        '''
+        Session: GetUpdateInfos
+        '''
+        print
+        pkgs = self.GetPackages('updates')[:10]
+        result = self.GetUpdateInfos(pkgs + ['not,0,1,1,noarch,notfound'])
+        self.assertIsInstance(result, dict)
+        for pkg_id in pkgs:
+            print "  %s : %i notices" % (pkg_id, len(result[pkg_id]))
+            self.assertEqual(result[pkg_id], self.GetUpdateInfo(pkg_id))
+        self.assertIsNone(result['not,0,1,1,noarch,notfound'])
+
+    def test_ProgressStats(self):
+        '''
+        Session: GetProgressStats
+        '''
+        print
+        stats = self.GetProgressStats()
+        print("  progress stats : %s" % stats)
+        for key in ('max_rate', 'sent', 'suppressed'):
+            self.assertIn(key, stats)
+
+    def test_Cancel(self):
+        '''
+        Session: Cancel operations
+        '''
+        print
+        self.assertEqual(self.GetOperations(), [])
+        self.assertFalse(self.Cancel(-1)) # unknown handle
+        # start a heavy query and a query queued after it
+        self.Unlock()
+        self.Lock()
+        replies = []
+        for flt in ('available', 'installed'):
+            reply = {'main_loop': GObject.MainLoop()}
+            self.daemon.GetPackages('(s)', flt, result_handler=self._return_handler,
+                                    user_data=reply, timeout=GObject.G_MAXINT)
+            replies.append(reply)
+        ops = self.GetOperations()
+        print("  operations : %s" % ops)
+        cancelled = False
+        if ops:
+            handle, name = ops[-1]
+            self.assertEqual(name, 'GetPackages')
+            cancelled = self.Cancel(handle)
+        context = GObject.MainContext.default()
+        while not all(['error' in done for done in replies]): # wait for both replies
+            context.iteration(True)
+        self.assertIsInstance(self._get_result(replies[0]), list)
+        if cancelled:
+            self.assertRaises(YumCancelledError, self._get_result, replies[1])
+        self.assertEqual(self.GetOperations(), [])
+        # a deadline, the call is either done or cancelled in time
+        try:
+            pkgs = self.Search(['name','summary'], ['yum'], False, True, False, deadline=0.001)
+            self.assertIsInstance(pkgs, list)
+        except YumCancelledError:
+            print("  Search was cancelled")
+
+    def test_MainloopLatency(self):
+        '''
+        Session: Mainloop latency while a heavy query is running
+        '''
+        print
+        # get a new YumBase, so the metadata has to be loaded again
+        self.Unlock()
+        self.Lock()
+        main_loop = GObject.MainLoop()
+        data = {'main_loop': main_loop}
+        start = time.time()
+        self.daemon.GetPackageWithAttributes('(sas)', 'available', ['summary', 'size'], result_handler=self._return_handler,
+                                              user_data=data, timeout=GObject.G_MAXINT)
+        latency = []
+        for i in range(10):
+            t = time.time()
+            self.assertIsInstance(self.daemon.GetVersion(), int)
+            latency.append(time.time() - t)
+        # the heavy query must still be running, else the latency is not measured while it works
+        self.assertIn('GetPackageWithAttributes', [name for handle, name in self.GetOperations()])
+        main_loop.run()
+        used = time.time() - start
+        pkgs = json.loads(self._get_result(data))
+        self.assertIsInstance(pkgs, list)
+        self.assertTrue(pkgs)
+        print("  heavy query : %.3fs  GetVersion max latency : %.3fs" % (used, max(latency)))
+        self.assertLess(max(latency), 0.5)
+
+    def test_InterfaceV2(self):
+        '''
+        Session: v2 interface (native DBus types) returns the same as the JSON interface
+        '''
+        print
+        self.assertIsNotNone(self.daemon_v2)
+        v1 = YumDaemonReadOnlyClient(use_v2=False)
+        self.assertIsNone(v1.daemon_v2)
+        pkgs = self.GetPackagesByName('yum', newest_only=False)
+        attrs = ['summary','size','action','notfound']
+        self.assertEqual(self.GetAttributes(pkgs + ['not,0,1,1,noarch,notfound'], attrs),
+                         v1.GetAttributes(pkgs + ['not,0,1,1,noarch,notfound'], attrs))
+        self.assertEqual(self.GetAttribute(pkgs[0], 'summary'), v1.GetAttribute(pkgs[0], 'summary'))
+        self.assertIsNone(self.GetAttribute('not,0,1,1,noarch,notfound', 'summary'))
+        self.assertEqual(self.GetConfig('kernelpkgnames'), v1.GetConfig('kernelpkgnames'))
+        self.assertIsNone(self.GetConfig('not_found'))
+        self.assertIsNone(self.GetRepo('XYZCYZ'))
+        # None values inside the result must come back as None
+        all_conf = self.GetConfig('*')
+        self.assertEqual(all_conf, v1.GetConfig('*'))
+        self.assertIn(None, all_conf.values())
+        for repo_id in self.GetRepositories('enabled'):
+            self.assertEqual(self.GetRepo(repo_id), v1.GetRepo(repo_id))
+        self.assertEqual(self.GetUpdateInfos(pkgs), v1.GetUpdateInfos(pkgs))
+        self.assertEqual(self.GetGroups(), v1.GetGroups())
+        rows = self.GetPackageWithAttributes('installed', ['summary','size'])
+        self.assertEqual(sorted(rows), sorted(v1.GetPackageWithAttributes('installed', ['summary','size'])))
+        # the clients share the bus connection, so v1 can use the cursor opened with v2
+        handle, total = self.OpenPackageCursor('installed', ['summary','size'])
+        self.assertEqual(total, len(rows))
+        self.assertEqual(self.FetchCursor(handle, 0, 10), v1.FetchCursor(handle, 0, 10))
+        self.assertTrue(self.CloseCursor(handle))
+        self.assertIsNone(self.FetchCursor(handle, 0, 10))
+        self.assertEqual(sorted(self.GetSearchCacheStats()), sorted(v1.GetSearchCacheStats()))
+        self.assertEqual(sorted(self.GetProgressStats()), sorted(v1.GetProgressStats()))
+
     def test_GetConfig(self):
         '''
         Session: GetConfig
@@ -172,6 +470,24 @@ class TestAPI(TestBase):
         print "found %i packages" % len(pkgs)
         self.assertGreater(len(pkgs), 0) # we should find some matches
 
+    def test_SearchCache(self):
+        '''
+        Session: Search result cache
+        '''
+        fields = ['name','summary']
+        stats = self.GetSearchCacheStats()
+        self.assertIsInstance(stats, dict)
+        pkgs = self.Search(fields, ['yu'], True, False, False)
+        pkgs2 = self.Search(fields, ['yum'], True, False, False) # narrowed from 'yu'
+        after = self.GetSearchCacheStats()
+        print(after)
+        self.assertGreater(after['narrowed'], stats['narrowed'])
+        for p in pkgs2:
+            self.assertIn(p, pkgs)
+        pkgs3 = self.Search(fields, ['yum'], True, False, False) # cached
+        self.assertEqual(sorted(pkgs2), sorted(pkgs3))
+        self.assertGreater(self.GetSearchCacheStats()['hits'], after['hits'])
+
     def test_Groups(self):
         """
         Session: Groups (GetGroups & GetGroupPackages)
@@ -198,6 +514,84 @@ class TestAPI(TestBase):
                 self.assertIsInstance(pkgs, list) # cat is a list
                 print "       # of Default Packages in group : ",len(pkgs)
 
+    def test_GroupsCache(self):
+        '''
+        Session: GetGroups & GetGroupPackages from the groups cache
+        '''
+        result = self.GetGroups()
+        self.assertEqual(result, self.GetGroups()) # from cache
+        for cat, grps in result[:2]:
+            for grp in grps[:2]:
+                pkgs = self.GetGroupPackages(grp[0], 'all')
+                self.assertEqual(sorted(pkgs), sorted(self.GetGroupPackages(grp[0], 'all')))
+
+    def test_GetGroupsPackages(self):
+        '''
+        Session: GetGroupsPackages
+        '''
+        grp_ids = []
+        for cat, grps in self.GetGroups()[:3]:
+            grp_ids.extend([grp[0] for grp in grps])
+        result = self.GetGroupsPackages(grp_ids + ['notfound'], 'default')
+        self.assertIsInstance(result, dict)
+        for grp_id in grp_ids:
+            print "  %s : %i packages" % (grp_id, len(result[grp_id]))
+            self.assertEqual(sorted(result[grp_id]), sorted(self.GetGroupPackages(grp_id, 'default')))
+        self.assertEqual(result['notfound'], [])
+
+    def test_GetPackageColumns(self):
+        '''
+        Session: GetPackageColumns
+        '''
+        print
+        fields = ['summary','size']
+        rows = self.GetPackageWithAttributes('installed', fields)
+        columns = self.GetPackageColumns('installed', fields)
+        self.assertIsInstance(columns, dict)
+        self.assertEqual(len(columns['name']), len(rows))
+        self.assertEqual(columns['fields'], fields)
+        print("  arches : %s repos : %s" % (columns['arches'], columns['repos']))
+        self.assertEqual(sorted(self.package_columns_to_rows(columns)), sorted(rows))
+
+    def test_PackageCursor(self):
+        '''
+        Session: OpenPackageCursor, FetchCursor & CloseCursor
+        '''
+        print
+        all_pkgs = self.GetPackageWithAttributes('installed', ['summary','size'])
+        handle, total = self.OpenPackageCursor('installed', ['summary','size'])
+        self.assertEqual(total, len(all_pkgs))
+        page = self.FetchCursor(handle, 0, 10)
+        self.assertIsInstance(page, list)
+        self.assertEqual(len(page), min(10, total))
+        self.assertEqual(len(page[0]),3)
+        page = self.FetchCursor(handle, total, 10) # past the end
+        self.assertEqual(len(page), 0)
+        page = self.FetchCursor(handle, -1, -1) # -1 = no limit
+        self.assertEqual(sorted(page), sorted(all_pkgs))
+        # the cursor is owned by this client, another client can't use it
+        script = ("import sys; sys.path.insert(0, 'client')\n"
+                  "from yumdaemon import YumDaemonReadOnlyClient\n"
+                  "cli = YumDaemonReadOnlyClient()\n"
+                  "print(cli.FetchCursor(sys.argv[1], 0, 10))\n"
+                  "print(cli.CloseCursor(sys.argv[1]))\n")
+        output = check_output([sys.executable, '-c', script, handle])
+        self.assertEqual(output.split(), ['None', 'False'])
+        self.assertTrue(self.CloseCursor(handle))
+        self.assertIsNone(self.FetchCursor(handle, 0, 10)) # cursor is closed
+        self.assertFalse(self.CloseCursor(handle))
+        paged = []
+        for page in self.GetPackageWithAttributesPaged('installed', ['summary','size'], page_size=100):
+            paged.extend(page)
+        print("  Got %i packages in pages" % len(paged))
+        self.assertEqual(sorted(paged), sorted(all_pkgs))
+        # the cursors is closed by the daemon, when the repos is changed
+        handle, total = self.OpenPackageCursor('installed', ['summary','size'])
+        self.SetEnabledRepos(self.GetRepositories('enabled'))
+        self.assertRaises(YumCursorExpiredError, self.FetchCursor, handle, 0, 10)
+        self.assertFalse(self.CloseCursor(handle))
+        self.assertIsNone(self.FetchCursor(handle, 0, 10)) # the expired cursor is closed by the client
+
     def test_GetPackageWithAttributes(self):
         """
         Session: GetPackageWithAttributes
@@ -1,8 +1,11 @@
 import sys, os
+import json
+import time
 sys.path.insert(0,os.path.abspath('client'))
 from base import TestBase
-from yumdaemon import YumLockedError
+from yumdaemon import YumLockedError, YumCancelledError, YumDaemonClient
 from nose.exc import SkipTest
+from gi.repository import GObject
 from subprocess import check_output, call
 
 
@@ -238,6 +241,304 @@ class TestAPI(TestBase):
             self.assertEqual(len(pkgs),0) # the should be notting
             print('  packages found : %s ' % len(pkgs))
 
+    def test_GetAttributes(self):
+        '''
+        System: GetAttributes
+        '''
+        print
+        pkgs = self.GetPackagesByName('yum', newest_only=False)
+        self.assertGreater(len(pkgs),0)
+        attrs = ['summary','size','action','notfound']
+        result = self.GetAttributes(pkgs + ['not,0,1,1,noarch,notfound'], attrs)
+        self.assertIsInstance(result, dict)
+        for pkg_id in pkgs:
+            values = result[pkg_id]
+            self.assertIsInstance(values, dict)
+            print "  %s : %s" % (pkg_id, values)
+            self.assertEqual(values['summary'], self.GetAttribute(pkg_id, 'summary'))
+            self.assertEqual(values['action'], self.GetAttribute(pkg_id, 'action'))
+            self.assertIsNone(values['notfound'])
+        self.assertIsNone(result['not,0,1,1,noarch,notfound'])
+        # a package in an enabled repo, but with an unknown repo id is not found
+        for pkg_id in pkgs:
+            (n, e, v, r, a, repo_id) = self.to_pkg_tuple(pkg_id)
+            self.assertIsNone(self.GetAttribute(",".join((n, e, v, r, a, 'notfound-repo')), 'summary'))
+
+    def test_WhatProvides(self):
+        '''
+        System: WhatProvides
+        '''
+        print
+        pkgs = self.WhatProvides(['/usr/bin/yum'])
+        print "  /usr/bin/yum : %s" % pkgs
+        self.assertGreater(len(pkgs), 0)
+        for pkg_id in pkgs:
+            self.assertEqual(self.to_pkg_tuple(pkg_id)[0], 'yum')
+        self.assertEqual(pkgs, self.WhatProvides(['/usr/bin/yum'])) # cached
+        pkgs = self.WhatProvides(['yum', '/usr/bin/yum'])
+        self.assertGreater(len(pkgs), 0)
+        self.assertEqual(self.WhatProvides(['/not/found/zzzzddddsss']), [])
+
+    def test_Dependencies(self):
+        '''
+        System: GetRequires, GetRequiredBy & GetDependencyClosure
+        '''
+        print
+        pkgs = self.GetPackagesByName('yum', newest_only=True)
+        requires = self.GetRequires(pkgs + ['not,0,1,1,noarch,notfound'])
+        self.assertIsNone(requires['not,0,1,1,noarch,notfound'])
+        for pkg_id in pkgs:
+            print "  %s requires : %s" % (pkg_id, requires[pkg_id])
+            self.assertGreater(len(requires[pkg_id]), 0) # yum needs python
+            self.assertNotIn(pkg_id, requires[pkg_id])
+        closure = self.GetDependencyClosure(pkgs)
+        for pkg_id in requires[pkgs[0]]:
+            self.assertIn(pkg_id, closure)
+        python = [pkg_id for pkg_id in self.GetPackages('installed') if self.to_pkg_tuple(pkg_id)[0] == 'python']
+        self.assertEqual(len(python), 1)
+        required_by = self.GetRequiredBy(python)[python[0]]
+        print "  %s required by %i packages" % (python[0], len(required_by))
+        installed_yum = [pkg_id for pkg_id in required_by if self.to_pkg_tuple(pkg_id)[0] == 'yum']
+        self.assertEqual(len(installed_yum), 1) # yum is installed and need python
+        removed = self.GetDependencyClosure(python, True)
+        self.assertIn(installed_yum[0], removed)
+        for pkg_id in removed:
+            self.assertNotIn(pkg_id, python)
+
+    def test_DependenciesLock(self):
+        '''
+        System: GetRequires, GetRequiredBy & GetDependencyClosure need the lock
+        '''
+        print
+        pkgs = self.GetPackagesByName('yum', newest_only=True)
+        self.Unlock()
+        try:
+            self.assertRaises(YumLockedError, self.GetRequires, pkgs)
+            self.assertRaises(YumLockedError, self.GetRequiredBy, pkgs)
+            self.assertRaises(YumLockedError, self.GetDependencyClosure, pkgs)
+        finally:
+            self.Lock() # get the Lock again, else tearDown will fail
+
+    def test_GetAttributeSlice(self):
+        '''
+        System: GetAttributeSlice
+        '''
+        print
+        pkgs = self.GetPackagesByName('yum', newest_only=False)
+        for pkg_id in pkgs:
+            for attr in ['changelog','filelist','dirlist']:
+                total, items = self.GetAttributeSlice(pkg_id, attr, 0, 3)
+                print "  %s %s : %i of %i" % (pkg_id, attr, len(items), total)
+                self.assertEqual(len(items), min(3, total))
+                total2, rest = self.GetAttributeSlice(pkg_id, attr, 3, -1)
+                self.assertEqual(len(items) + len(rest), total)
+                # get the full list last, so the slices are read without the list loaded
+                full = self.GetAttribute(pkg_id, attr)
+                self.assertEqual(total, len(full))
+                if attr != 'changelog':
+                    self.assertEqual(items + rest, full)
+            total, items = self.GetAttributeSlice(pkg_id, 'changelog', 0, 3)
+            self.show_changelog(items)
+        self.assertIsNone(self.GetAttributeSlice('not,0,1,1,noarch,notfound', 'changelog', 0, 3))
+
+    def test_VersionLadder(self):
+        '''
+        System: GetAttributes with newer, older & downgrades
+        '''
+        print
+        pkgs = self.GetPackagesByName('yum', newest_only=False)
+        result = self.GetAttributes(pkgs, ['newer','older','downgrades'])
+        for pkg_id in pkgs:
+            values = result[pkg_id]
+            print "  %s : %s" % (pkg_id, values)
+            (n, e, v, r, a, repo_id) = self.to_pkg_tuple(pkg_id)
+            for other in values['newer'] + values['older']:
+                self.assertEqual(self.to_pkg_tuple(other)[0], n)
+                self.assertNotIn(other, [pkg_id])
+            for other in values['downgrades']:
+                if repo_id == 'installed':
+                    self.assertIn(other, values['older'])
+        newest = self.GetPackagesByName('yum', newest_only=True)
+        self.assertEqual(self.GetAttribute(newest[0], 'newer'), [])
+
+    def test_PkgTags(self):
+        '''
+        System: pkgtags attribute
+        '''
+        print
+        pkgs = self.Search(['name'], ['retro'], True, True, True) # retro should match some pkgtags
+        result = self.GetAttributes(pkgs, ['pkgtags'])
+        for pkg_id in pkgs:
+            tags = result[pkg_id]['pkgtags']
+            print "  %s : %s" % (pkg_id, tags)
+            self.assertIsInstance(tags, list)
+            self.assertEqual(tags, self.GetAttribute(pkg_id, 'pkgtags'))
+
+    def test_GetUpdateInfos(self):
+        '''
+        System: GetUpdateInfos
+        '''
+        print
+        pkgs = self.GetPackages('updates')[:10]
+        result = self.GetUpdateInfos(pkgs + ['not,0,1,1,noarch,notfound'])
+        self.assertIsInstance(result, dict)
+        for pkg_id in pkgs:
+            print "  %s : %i notices" % (pkg_id, len(result[pkg_id]))
+            self.assertEqual(result[pkg_id], self.GetUpdateInfo(pkg_id))
+        self.assertIsNone(result['not,0,1,1,noarch,notfound'])
+
+    def test_TransactionProgress(self):
+        '''
+        System: TransactionProgress & RPMProgress signals
+        '''
+        print
+        # install & remove a package, to get the signals from real transactions
+        rc, output = self.Remove('0xFFFF')
+        if rc == 2:
+            self.RunTransaction()
+        self.reset_signals()
+        rc, output = self.Install('0xFFFF')
+        self.assertEqual(rc, 2)
+        self.RunTransaction()
+        self.assertTrue(self.check_signal('TransactionProgress'))
+        self.assertFalse(self.check_signal('RPMProgress')) # raw rpm progress is opt-in
+        self.SetRPMProgress(True)
+        self.reset_signals()
+        rc, output = self.Remove('0xFFFF')
+        self.assertEqual(rc, 2)
+        self.RunTransaction()
+        self.assertTrue(self.check_signal('RPMProgress'))
+        self.SetRPMProgress(False)
+        # a client leaving the bus with the raw rpm progress enabled, don't keep it enabled
+        script = ("import sys; sys.path.insert(0, 'client')\n"
+                  "from yumdaemon import YumDaemonClient\n"
+                  "cli = YumDaemonClient()\n"
+                  "cli.SetRPMProgress(True)\n")
+        self.assertEqual(call([sys.executable, '-c', script]), 0)
+        time.sleep(1) # let the daemon see the client leave the bus
+        self.reset_signals()
+        rc, output = self.Install('0xFFFF')
+        self.assertEqual(rc, 2)
+        self.RunTransaction()
+        self.assertFalse(self.check_signal('RPMProgress'))
+        rc, output = self.Remove('0xFFFF') # cleanup
+        self.assertEqual(rc, 2)
+        self.RunTransaction()
+
+    def test_ProgressStats(self):
+        '''
+        System: GetProgressStats
+        '''
+        print
+        stats = self.GetProgressStats()
+        print("  progress stats : %s" % stats)
+        for key in ('max_rate', 'sent', 'suppressed'):
+            self.assertIn(key, stats)
+
+    def test_Cancel(self):
+        '''
+        System: Cancel operations
+        '''
+        print
+        self.assertEqual(self.GetOperations(), [])
+        self.assertFalse(self.Cancel(-1)) # unknown handle
+        # get a new YumBase, so the metadata has to be loaded again by the first call
+        self.Unlock()
+        self.Lock()
+        # start a heavy query and a query queued behind it
+        replies = []
+        for flt in ('available', 'installed'):
+            reply = {'main_loop': GObject.MainLoop()}
+            self.daemon.GetPackages('(s)', flt, result_handler=self._return_handler,
+                                    user_data=reply, timeout=GObject.G_MAXINT)
+            replies.append(reply)
+        ops = self.GetOperations()
+        print("  operations : %s" % ops)
+        self.assertEqual([name for handle, name in ops], ['GetPackages', 'GetPackages'])
+        self.assertTrue(self.Cancel(ops[1][0]))
+        self.assertFalse(self.Cancel(ops[1][0])) # already cancelled
+        context = GObject.MainContext.default()
+        while not all(['error' in done for done in replies]): # wait for both replies
+            context.iteration(True)
+        self.assertIsInstance(self._get_result(replies[0]), list)
+        self.assertRaises(YumCancelledError, self._get_result, replies[1])
+        self.assertEqual(self.GetOperations(), [])
+        # a call with a deadline queued behind a heavy call of the same method, is cancelled when the deadline is reached
+        self.Unlock()
+        self.Lock()
+        heavy = {'main_loop': GObject.MainLoop()}
+        self.daemon.GetPackages('(s)', 'available', result_handler=self._return_handler,
+                                user_data=heavy, timeout=GObject.G_MAXINT)
+        self.assertRaises(YumCancelledError, self.GetPackages, 'installed', deadline=0.001)
+        while not 'error' in heavy:
+            context.iteration(True)
+        self.assertIsInstance(self._get_result(heavy), list) # only the call with the deadline is cancelled
+        self.assertEqual(self.GetOperations(), [])
+
+    def test_MainloopLatency(self):
+        '''
+        System: Mainloop latency while a heavy query is running
+        '''
+        print
+        # get a new YumBase, so the metadata has to be loaded again
+        self.Unlock()
+        self.Lock()
+        main_loop = GObject.MainLoop()
+        data = {'main_loop': main_loop}
+        start = time.time()
+        self.daemon.GetPackageWithAttributes('(sas)', 'available', ['summary', 'size'], result_handler=self._return_handler,
+                                              user_data=data, timeout=GObject.G_MAXINT)
+        latency = []
+        for i in range(10):
+            t = time.time()
+            self.assertIsInstance(self.daemon.GetVersion(), int)
+            latency.append(time.time() - t)
+        # the heavy query must still be running, else the latency is not measured while it works
+        self.assertIn('GetPackageWithAttributes', [name for handle, name in self.GetOperations()])
+        main_loop.run()
+        used = time.time() - start
+        pkgs = json.loads(self._get_result(data))
+        self.assertIsInstance(pkgs, list)
+        self.assertTrue(pkgs)
+        print("  heavy query : %.3fs  GetVersion max latency : %.3fs" % (used, max(latency)))
+        self.assertLess(max(latency), 0.5)
+
+    def test_InterfaceV2(self):
+        '''
+        System: v2 interface (native DBus types) returns the same as the JSON interface
+        '''
+        print
+        self.assertIsNotNone(self.daemon_v2)
+        v1 = YumDaemonClient(use_v2=False)
+        self.assertIsNone(v1.daemon_v2)
+        pkgs = self.GetPackagesByName('yum', newest_only=False)
+        attrs = ['summary','size','action','notfound']
+        self.assertEqual(self.GetAttributes(pkgs + ['not,0,1,1,noarch,notfound'], attrs),
+                         v1.GetAttributes(pkgs + ['not,0,1,1,noarch,notfound'], attrs))
+        self.assertEqual(self.GetAttribute(pkgs[0], 'summary'), v1.GetAttribute(pkgs[0], 'summary'))
+        self.assertIsNone(self.GetAttribute('not,0,1,1,noarch,notfound', 'summary'))
+        self.assertEqual(self.GetConfig('kernelpkgnames'), v1.GetConfig('kernelpkgnames'))
+        self.assertIsNone(self.GetConfig('not_found'))
+        self.assertIsNone(self.GetRepo('XYZCYZ'))
+        # None values inside the result must come back as None
+        all_conf = self.GetConfig('*')
+        self.assertEqual(all_conf, v1.GetConfig('*'))
+        self.assertIn(None, all_conf.values())
+        for repo_id in self.GetRepositories('enabled'):
+            self.assertEqual(self.GetRepo(repo_id), v1.GetRepo(repo_id))
+        self.assertEqual(self.GetUpdateInfos(pkgs), v1.GetUpdateInfos(pkgs))
+        self.assertEqual(self.GetGroups(), v1.GetGroups())
+        rows = self.GetPackageWithAttributes('installed', ['summary','size'])
+        self.assertEqual(sorted(rows), sorted(v1.GetPackageWithAttributes('installed', ['summary','size'])))
+        # the clients share the bus connection, so v1 can use the cursor opened with v2
+        handle, total = self.OpenPackageCursor('installed', ['summary','size'])
+        self.assertEqual(total, len(rows))
+        self.assertEqual(self.FetchCursor(handle, 0, 10), v1.FetchCursor(handle, 0, 10))
+        self.assertTrue(self.CloseCursor(handle))
+        self.assertIsNone(self.FetchCursor(handle, 0, 10))
+        self.assertEqual(sorted(self.GetSearchCacheStats()), sorted(v1.GetSearchCacheStats()))
+        self.assertEqual(sorted(self.GetProgressStats()), sorted(v1.GetProgressStats()))
+
     def test_GetConfig(self):
         '''
         System: GetConfig & SetConfig
@@ -329,6 +630,24 @@ class TestAPI(TestBase):
         self.assertGreater(len(pkgs), 0) # we should find some matches
         
 
+    def test_SearchCache(self):
+        '''
+        System: Search result cache
+        '''
+        fields = ['name','summary']
+        stats = self.GetSearchCacheStats()
+        self.assertIsInstance(stats, dict)
+        pkgs = self.Search(fields, ['yu'], True, False, False)
+        pkgs2 = self.Search(fields, ['yum'], True, False, False) # narrowed from 'yu'
+        after = self.GetSearchCacheStats()
+        print(after)
+        self.assertGreater(after['narrowed'], stats['narrowed'])
+        for p in pkgs2:
+            self.assertIn(p, pkgs)
+        pkgs3 = self.Search(fields, ['yum'], True, False, False) # cached
+        self.assertEqual(sorted(pkgs2), sorted(pkgs3))
+        self.assertGreater(self.GetSearchCacheStats()['hits'], after['hits'])
+
     def test_Groups(self):
         """
         System: Groups (GetGroups & GetGroupPackages)
@@ -357,6 +676,78 @@ class TestAPI(TestBase):
 
 
 
+    def test_GroupsCache(self):
+        '''
+        System: GetGroups & GetGroupPackages from the groups cache
+        '''
+        result = self.GetGroups()
+        self.assertEqual(result, self.GetGroups()) # from cache
+        for cat, grps in result[:2]:
+            for grp in grps[:2]:
+                pkgs = self.GetGroupPackages(grp[0], 'all')
+                self.assertEqual(sorted(pkgs), sorted(self.GetGroupPackages(grp[0], 'all')))
+
+    def test_GetGroupsPackages(self):
+        '''
+        System: GetGroupsPackages
+        '''
+        grp_ids = []
+        for cat, grps in self.GetGroups()[:3]:
+            grp_ids.extend([grp[0] for grp in grps])
+        result = self.GetGroupsPackages(grp_ids + ['notfound'], 'default')
+        self.assertIsInstance(result, dict)
+        for grp_id in grp_ids:
+            print "  %s : %i packages" % (grp_id, len(result[grp_id]))
+            self.assertEqual(sorted(result[grp_id]), sorted(self.GetGroupPackages(grp_id, 'default')))
+        self.assertEqual(result['notfound'], [])
+
+    def test_GetPackageColumns(self):
+        '''
+        System: GetPackageColumns
+        '''
+        print
+        fields = ['summary','size']
+        rows = self.GetPackageWithAttributes('installed', fields)
+        columns = self.GetPackageColumns('installed', fields)
+        self.assertIsInstance(columns, dict)
+        self.assertEqual(len(columns['name']), len(rows))
+        self.assertEqual(columns['fields'], fields)
+        print("  arches : %s repos : %s" % (columns['arches'], columns['repos']))
+        self.assertEqual(sorted(self.package_columns_to_rows(columns)), sorted(rows))
+
+    def test_PackageCursor(self):
+        '''
+        System: OpenPackageCursor, FetchCursor & CloseCursor
+        '''
+        print
+        all_pkgs = self.GetPackageWithAttributes('installed', ['summary','size'])
+        handle, total = self.OpenPackageCursor('installed', ['summary','size'])
+        self.assertEqual(total, len(all_pkgs))
+        page = self.FetchCursor(handle, 0, 10)
+        self.assertIsInstance(page, list)
+        self.assertEqual(len(page), min(10, total))
+        self.assertEqual(len(page[0]),3)
+        page = self.FetchCursor(handle, total, 10) # past the end
+        self.assertEqual(len(page), 0)
+        page = self.FetchCursor(handle, -1, -1) # -1 = no limit
+        self.assertEqual(sorted(page), sorted(all_pkgs))
+        # the cursor is owned by this client, another client can't use it
+        script = ("import sys; sys.path.insert(0, 'client')\n"
+                  "from yumdaemon import YumDaemonClient\n"
+                  "cli = YumDaemonClient()\n"
+                  "print(cli.FetchCursor(sys.argv[1], 0, 10))\n"
+                  "print(cli.CloseCursor(sys.argv[1]))\n")
+        output = check_output([sys.executable, '-c', script, handle])
+        self.assertEqual(output.split(), ['None', 'False'])
+        self.assertTrue(self.CloseCursor(handle))
+        self.assertIsNone(self.FetchCursor(handle, 0, 10)) # cursor is closed
+        self.assertFalse(self.CloseCursor(handle))
+        paged = []
+        for page in self.GetPackageWithAttributesPaged('installed', ['summary','size'], page_size=100):
+            paged.extend(page)
+        print("  Got %i packages in pages" % len(paged))
+        self.assertEqual(sorted(paged), sorted(all_pkgs))
+
     def test_GetPackageWithAttributes(self):
         '''
         System: GetPackageWithAttributes
@@ -391,6 +782,23 @@ class TestAPI(TestBase):
                 self.assertIsInstance(state, unicode)
                 self.assertIsInstance(is_installed, bool)
                 
+    def test_HistoryPaged(self):
+        '''
+        System: History paging & bulk packages
+        '''
+        result = self.GetHistoryByDays(0, 30)
+        paged = self.GetHistoryByDaysPaged(0, 30, 0, -1)
+        self.assertEqual(result, paged)
+        first = self.GetHistoryByDaysPaged(0, 30, 0, 2)
+        self.assertEqual(first, result[:2])
+        rest = self.GetHistoryByDaysPaged(0, 30, 2, -1)
+        self.assertEqual(rest, result[2:])
+        tids = [tid for tid, dt in first]
+        pkgs = self.GetHistoryTransactionsPackages(tids)
+        self.assertIsInstance(pkgs, dict)
+        for tid in tids:
+            self.assertEqual(pkgs[tid], [list(elem) for elem in self.GetHistoryPackages(tid)])
+
     def test_GPGKeyInstall(self):
         '''
         System: GPG Key installation
@@ -0,0 +1,61 @@
+#!/usr/bin/python
+#
+# Benchmark the yumdaemon session service, JSON (v1) interface vs. native DBus types (v2) interface
+#
+# Usage: tools/benchmark-interfaces.py [--rounds N]
+#
+import sys
+import os.path
+import time
+import argparse
+sys.path.insert(0,os.path.abspath('client'))
+
+from yumdaemon import YumDaemonReadOnlyClient
+
+class BenchClient(YumDaemonReadOnlyClient):
+
+    def __init__(self, use_v2):
+        YumDaemonReadOnlyClient.__init__(self, use_v2)
+
+def bench(func, rounds):
+    '''
+    run a function a number of times and return the best time in ms.
+    '''
+    best = None
+    for i in range(rounds):
+        start = time.time()
+        func()
+        used = (time.time() - start) * 1000
+        if best is None or used < best:
+            best = used
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the yumdaemon JSON (v1) and native (v2) DBus interfaces')
+    parser.add_argument('--rounds', type=int, default=5, help='number of calls for each method (best time is used)')
+    args = parser.parse_args()
+    clients = [('v1', BenchClient(False)), ('v2', BenchClient(True))]
+    if clients[1][1].daemon_v2 is None:
+        print("the running yumdaemon don't have the v2 interface")
+        return 1
+    clients[0][1].Lock()
+    try:
+        installed = clients[0][1].GetPackages('installed')
+        calls = [
+            ('GetPackageWithAttributes(installed)', lambda cli: cli.GetPackageWithAttributes('installed', ['summary','size','action'])),
+            ('GetPackageWithAttributes(available)', lambda cli: cli.GetPackageWithAttributes('available', ['summary','size'])),
+            ('GetAttributes(installed, 3 attrs)', lambda cli: cli.GetAttributes(installed, ['summary','size','description'])),
+            ('GetConfig(*)', lambda cli: cli.GetConfig('*')),
+            ('GetGroups', lambda cli: cli.GetGroups()),
+        ]
+        print("%-40s %10s %10s %8s" % ('method', 'v1 (ms)', 'v2 (ms)', 'v1/v2'))
+        for name, call in calls:
+            call(clients[0][1]) # warm up the daemon caches
+            times = [bench(lambda: call(cli), args.rounds) for label, cli in clients]
+            print("%-40s %10.1f %10.1f %8.2f" % (name, times[0], times[1], times[0] / max(times[1], 0.001)))
+    finally:
+        clients[0][1].Unlock()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -24,7 +24,16 @@ import dbus.glib
 import gobject
 import json
 import logging
+import marshal
+import os
+import time
+import threading
+import Queue
+from bisect import bisect_right
+from itertools import islice
+from collections import OrderedDict
 from datetime import datetime
+import rpm
 import yum
 import yum.Errors as Errors
 from yum.callbacks import *
@@ -32,11 +41,20 @@ from yum.constants import *
 from yum.update_md import UpdateMetadata
 from yum.Errors import *
 from yum.packageSack import packagesNewestByNameArch, packagesNewestByName
+from yum.i18n import to_unicode
+from yum.misc import re_primary_filename
+from urlgrabber.progress import MultiFileMeter, format_number, format_time
 
 from rpmUtils.arch import canCoinstall
 
-FAKE_ATTR = ['downgrades','action','pkgtags']
+FAKE_ATTR = ['downgrades','action','pkgtags','obsoleted','newer','older']
+PKG_FILTERS = ['installed','available','updates','obsoletes','recent','extras']
+NARROW_FILTERS = ['installed','available','extras'] # the filters classified by PackageNarrows
+UPDATE_CACHE_VERSION = 3
+SEARCH_FIELDS = ['name','summary','description']
+FILE_TYPES = {'filelist' : 'f', 'dirlist' : 'd', 'ghostlist' : 'g'} # filelists metadata file types
 NONE = json.dumps(None)
+V2_NONE = dbus.Struct((False,), signature='b') # None value inside a v2 variant
 
 
 #------------------------------------------------------------------------------ Callback handlers
@@ -57,8 +75,208 @@ class DownloadCallback(  DownloadBaseCallback ):
         :param fread: formated string containing BytesRead
         :param ftime : formated string containing remaining or elapsed time
         '''
+        if self.base._worker.cancelled(): # abort the download, urlgrabber handles it like ctrl-c
+            raise KeyboardInterrupt
         # send a DBus signal with progress info
-        self.base.UpdateProgress(name,frac,fread,ftime)
+        if self.base._progress_throttle.allow(name, frac >= 1.0):
+            self.base.UpdateProgress(name,frac,fread,ftime)
+
+
+class ProgressThrottle:
+    '''
+    Limit the rate of progress signals.
+    The progress is coalesced for each file (key), a progress update is only send
+    if the last one for the file was send more than 1/max_rate seconds ago, the updates
+    in between is suppressed (the next update send contains the newest progress).
+    The first update and the last update (done) for a file is always send.
+    '''
+    def __init__(self, max_rate=10.0):
+        self.max_rate = max_rate    # max signals pr. second for each file (0 = no limit)
+        self.sent = 0
+        self.suppressed = 0
+        self._last = {}             # key -> time of last signal send
+
+    def allow(self, key, done=False, now=None):
+        '''
+        Check if a progress signal for a key should be send
+        :param key: the file (or other item) the progress is for
+        :param done: this is the last update for the key (always send)
+        '''
+        if now is None:
+            now = time.time()
+        last = self._last.get(key)
+        if done:
+            self._last.pop(key, None)
+        elif last is not None and self.max_rate > 0 and now - last < 1.0 / self.max_rate:
+            self.suppressed += 1
+            return False
+        else:
+            self._last[key] = now
+        self.sent += 1
+        return True
+
+    def forget(self, key):
+        '''
+        Forget a key without sending a signal (ex. a failed download)
+        '''
+        self._last.pop(key, None)
+
+    def get_stats(self):
+        '''
+        Get the counters (max_rate, sent, suppressed)
+        '''
+        return {'max_rate': self.max_rate, 'sent': self.sent, 'suppressed': self.suppressed}
+
+
+class TransactionProgress:
+    '''
+    Weighted progress model for the whole rpm transaction.
+    Each transaction element is weighted by the size of the package, so a big package
+    count more than a small one. Elements removing a package (erase & cleanup of the
+    updated packages) is weighted by ERASE_WEIGHT of the size, there is no payload to write.
+    '''
+    ERASE_ACTIONS = (TS_ERASE, TS_UPDATED, TS_OBSOLETED, 'repackaging')
+    ERASE_WEIGHT = 0.1
+
+    def __init__(self, tsInfo):
+        self.weights = {}   # (name, erase) -> [weight,...] for the elements not started yet
+        self.total = 0.0
+        for txmbr in tsInfo.getMembers():
+            erase = txmbr.output_state in TransactionProgress.ERASE_ACTIONS
+            weight = self._get_weight(txmbr.po, erase)
+            self.weights.setdefault((txmbr.po.name, erase), []).append(weight)
+            self.total += weight
+        self.frac = 0.0
+        self.start_time = None
+        self._default = self.total / max(len(tsInfo.getMembers()), 1) or 1.0
+        self._done = 0.0            # weight of the finished elements
+        self._current = None        # (name, erase) of the current element
+        self._current_weight = 0.0
+        self._current_done = True
+
+    def _get_weight(self, po, erase):
+        # installedsize for available packages, size is the installed size for installed ones
+        size = float(getattr(po, 'installedsize', None) or po.size or 0) or 1.0
+        if erase:
+            size *= TransactionProgress.ERASE_WEIGHT
+        return size
+
+    def update(self, name, action, te_current, te_total, now=None):
+        '''
+        Update the model with the progress of a transaction element
+        :param name: package name of the element
+        :param action: yum.constant transaction set state (or 'repackaging')
+        :param te_current: bytes processed in the element
+        :param te_total: total bytes in the element
+        :return: the progress fraction for the whole transaction
+        '''
+        if now is None:
+            now = time.time()
+        if self.start_time is None:
+            self.start_time = now
+        if te_total > 0:
+            te_frac = min(float(te_current) / te_total, 1.0)
+        else:
+            te_frac = 0.0
+        key = (name, action in TransactionProgress.ERASE_ACTIONS)
+        if key != self._current or (self._current_done and te_frac < 1.0): # a new element
+            if not self._current_done:
+                self._done += self._current_weight
+            self._current = key
+            self._current_weight = self._pop_weight(key)
+            self._current_done = False
+        if te_frac >= 1.0 and not self._current_done:
+            self._done += self._current_weight
+            self._current_done = True
+        if self._current_done:
+            done = self._done
+        else:
+            done = self._done + self._current_weight * te_frac
+        self.frac = max(self.frac, min(done / self.total, 1.0))
+        return self.frac
+
+    def eta(self, now=None):
+        '''
+        Estimated remaining time in seconds (0.0 if not known yet)
+        '''
+        if now is None:
+            now = time.time()
+        if self.start_time is None or self.frac <= 0.0:
+            return 0.0
+        return (now - self.start_time) * (1.0 - self.frac) / self.frac
+
+    def _pop_weight(self, key):
+        weights = self.weights.get(key)
+        if weights:
+            return weights.pop(0)
+        # element not in the tsInfo, give it the average weight
+        self.total += self._default
+        return self._default
+
+
+class MultiDownloadCallback( MultiFileMeter ):
+    '''
+    Yum parallel download callback handler class (urlgrabber multi file meter)
+    the progress for each file is send with UpdateProgress signals, like the DownloadCallback
+    and the progress for all the files is send with DownloadProgress signals
+    '''
+    def __init__(self,base):
+        MultiFileMeter.__init__(self, threaded=False) # updates is done in the thread running the download
+        self.base = base
+
+    def _do_start_meter(self, meter, now):
+        self._file_progress(meter, 0.0, "", "")
+
+    def _do_update_meter(self, meter, now):
+        if self.base._worker.cancelled(): # abort the downloads, urlgrabber handles it like ctrl-c
+            raise KeyboardInterrupt
+        fread = format_number(meter.last_amount_read)
+        if meter.size is None:
+            self._file_progress(meter, 0.0, fread, format_time(meter.re.elapsed_time()))
+        else:
+            self._file_progress(meter, meter.re.fraction_read() or 0.0, fread, format_time(meter.re.remaining_time()))
+        self._total_progress()
+
+    def _do_end_meter(self, meter, now):
+        self._file_progress(meter, 1.0, format_number(meter.last_amount_read), format_time(meter.re.elapsed_time()))
+        self.re.update(self._amount_read(), now)
+        self._total_progress()
+
+    def _do_failure_meter(self, meter, message, now):
+        self.base._progress_throttle.forget(self._get_name(meter))
+        self._total_progress()
+
+    def _do_end(self, now):
+        if self.finished_files + self.failed_files != self.numfiles: # else the last progress is already send
+            self._total_progress(True)
+
+    def _file_progress(self, meter, frac, fread, ftime):
+        '''
+        send the progress for a file
+        '''
+        name = self._get_name(meter)
+        if self.base._progress_throttle.allow(name, frac >= 1.0):
+            self.base.UpdateProgress(name, frac, fread, ftime)
+
+    def _total_progress(self, done=False):
+        '''
+        send the progress for all the files
+        '''
+        done = done or self.finished_files + self.failed_files == self.numfiles
+        if not self.base._progress_throttle.allow(self, done):
+            return
+        total = self.re.total or 0
+        self.base.DownloadProgress(self.re.fraction_read() or 0.0, self.re.last_amount_read or 0, total,
+                                   self.re.average_rate() or 0.0, self.re.remaining_time() or 0.0,
+                                   self.finished_files, self.numfiles or 0)
+
+    def _get_name(self, meter):
+        '''
+        Get the name of the file being downloaded
+        '''
+        if meter.text and type( meter.text ) == type( "" ):
+            return meter.text
+        return meter.basename
 
 
 logger = logging.getLogger('yumdaemon.service')
@@ -78,6 +296,764 @@ def Logger(func):
     newFunc.__dict__.update(func.__dict__)
     return newFunc
 
+def Worker(func):
+    """
+    This decorator run a DBus method in the worker thread and send the reply from the
+    mainloop when the method is done, so the mainloop can answer other DBus calls
+    and send signals while yum is working.
+    The method get an operation handle, that can be used to cancel it.
+    It must be on top of the @Logger and @dbus.service.method decorators
+    """
+    out_signature = func._dbus_out_signature
+    def job(self, *args, **kwargs):
+        self._rpmdb_generation = None # the rpmdb can have been changed since the last job
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            self._is_working = False
+
+    def newFunc(self, *args, **kwargs):
+        reply_handler = kwargs.pop('reply_handler')
+        error_handler = kwargs.pop('error_handler')
+        if not out_signature: # the DBus method dont return anything
+            handler = reply_handler
+            reply_handler = lambda value: handler()
+        sender = kwargs.get('sender')
+        self._worker.add(job, (self,) + args, kwargs, reply_handler, error_handler,
+                         name=func.__name__, sender=sender,
+                         deadline=self._worker.pop_deadline(sender, func.__name__))
+
+    newFunc.__name__ = func.__name__
+    newFunc.__doc__ = func.__doc__
+    newFunc.__dict__.update(func.__dict__)
+    newFunc._dbus_async_callbacks = ('reply_handler', 'error_handler')
+    return newFunc
+
+#------------------------------------------------------------------------------ Worker thread
+class CancelledError(Exception):
+    '''
+    The operation was cancelled
+    '''
+
+class CursorExpiredError(Exception):
+    '''
+    The package cursor was closed by the daemon (not used for a while or the repos was changed)
+    '''
+
+class WorkQueue:
+    '''
+    Run jobs one at the time in a worker thread, the reply or error handler is
+    called from the mainloop when a job is done.
+    yum is not thread safe, so all work on the YumBase must be done as jobs
+    in the same worker thread, or from the mainloop when there is no jobs pending
+
+    Each job has an operation handle, the job can be cancelled by the sender
+    who started it. A job waiting in the queue is dropped right away, a running job
+    is stopped at the next check_cancelled() call or download progress update.
+    A job can have a deadline, it is cancelled from the mainloop when the deadline is reached.
+    '''
+
+    def __init__(self):
+        self.logger = logging.getLogger('yumdaemon.worker')
+        self.pending = 0    # jobs queued or running, only changed in the mainloop
+        self.current = None # handle of the running job
+        self.cancel_error = CancelledError # exception used for cancelled jobs
+        self._jobs = {}     # handle -> [name, sender, reply_handler, error_handler, cancelled, cancellable]
+        self._count = 0
+        self._deadlines = {} # (sender, name) -> [seconds,...] for the next calls from the sender
+        self._timers = {}   # handle -> deadline timeout source id
+        self._queue = Queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock() # protect the cancelled & cancellable flags of the jobs
+
+    def add(self, func, args, kwargs, reply_handler, error_handler=None, name=None, sender=None, deadline=None):
+        '''
+        Add a job to the queue
+        :param func: function to run in the worker thread
+        :param args: positional arguments for func
+        :param kwargs: keyword arguments for func
+        :param reply_handler: called with the result of func in the mainloop
+        :param error_handler: called with the exception, if func failed
+        :param name: operation name (default = func name)
+        :param sender: the DBus sender, who can cancel the job
+        :param deadline: seconds before the job is cancelled (None = no deadline)
+        :return: the operation handle
+        '''
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='yumdaemon-worker')
+            self._thread.daemon = True
+            self._thread.start()
+        self._count += 1
+        handle = self._count
+        self._jobs[handle] = [name or func.__name__, sender, reply_handler, error_handler, False, True]
+        self.pending += 1
+        if deadline:
+            self._timers[handle] = gobject.timeout_add(int(deadline * 1000), self._on_deadline, handle)
+        self._queue.put((handle, func, args, kwargs))
+        return handle
+
+    def set_deadline(self, sender, name, deadline):
+        '''
+        Set the deadline for the next call of a method from a sender (called from the mainloop)
+        the DBus messages from a sender is received in order, so it is used by the call following it
+        '''
+        self._deadlines.setdefault((sender, name), []).append(deadline)
+
+    def pop_deadline(self, sender, name):
+        '''
+        Get the deadline set for a call of a method from a sender, None if there is no deadline
+        '''
+        deadlines = self._deadlines.get((sender, name))
+        if not deadlines:
+            return None
+        deadline = deadlines.pop(0)
+        if not deadlines:
+            del self._deadlines[(sender, name)]
+        return deadline
+
+    def _on_deadline(self, handle):
+        '''
+        mainloop timeout callback, the deadline for a job is reached
+        '''
+        self._timers.pop(handle, None)
+        job = self._jobs.get(handle)
+        if job:
+            self.logger.debug('deadline reached for %s (%i)' % (job[0], handle))
+            self.cancel(handle, job[1])
+        return False
+
+    def get_operations(self, sender):
+        '''
+        Get the (handle, name) of the queued and running jobs started by a sender
+        '''
+        return [(handle, job[0]) for handle, job in sorted(self._jobs.items()) if job[1] == sender]
+
+    def cancel(self, handle, sender):
+        '''
+        Cancel a job (called from the mainloop)
+        return False, if the job is not found, not started by the sender or can't be cancelled
+        '''
+        with self._lock:
+            job = self._jobs.get(handle)
+            if not job or job[1] != sender or job[4] or not job[5]:
+                return False
+            job[4] = True
+        self.logger.debug('cancel %s (%i)' % (job[0], handle))
+        if handle != self.current: # not started yet, reply now
+            error_handler = job[3]
+            job[2] = job[3] = None
+            if error_handler:
+                error_handler(self.cancel_error('%s was cancelled' % job[0]))
+        return True
+
+    def cancelled(self):
+        '''
+        Check if the running job has been cancelled
+        '''
+        job = self._jobs.get(self.current)
+        return job is not None and job[4]
+
+    def check_cancelled(self):
+        '''
+        raise cancel_error if the running job has been cancelled
+        '''
+        if self.cancelled():
+            raise self.cancel_error('%s was cancelled' % self._jobs[self.current][0])
+
+    def set_cancellable(self, state):
+        '''
+        Set if the running job can be cancelled (ex. False when the rpm transaction starts)
+        raise cancel_error if the job is cancelled before it is set not cancellable
+        '''
+        with self._lock:
+            job = self._jobs.get(self.current)
+            if job is not None:
+                if not state and job[4]:
+                    raise self.cancel_error('%s was cancelled' % job[0])
+                job[5] = state
+
+    def _run(self):
+        '''
+        worker thread main loop
+        '''
+        while True:
+            handle, func, args, kwargs = self._queue.get()
+            job = self._jobs[handle]
+            if job[4]: # cancelled while waiting, the reply is already send
+                gobject.idle_add(self._done, handle, None, None)
+                continue
+            self.current = handle
+            try:
+                value = func(*args, **kwargs)
+                gobject.idle_add(self._done, handle, 2, value)
+            except (Exception, KeyboardInterrupt), e: # KeyboardInterrupt is used to abort urlgrabber downloads
+                if job[4]:
+                    e = self.cancel_error('%s was cancelled' % job[0])
+                else:
+                    self.logger.debug('%s failed : %s' % (job[0], str(e)))
+                gobject.idle_add(self._done, handle, 3, e)
+            self.current = None
+
+    def _done(self, handle, handler, value):
+        '''
+        mainloop callback for a finished job
+        :param handler: index of the handler to call in the job
+        '''
+        self.pending -= 1
+        job = self._jobs.pop(handle)
+        timer = self._timers.pop(handle, None)
+        if timer:
+            gobject.source_remove(timer)
+        if handler and job[handler]:
+            job[handler](value)
+        return False
+
+#------------------------------------------------------------------------------ Shared lock
+class SharedLock:
+    '''
+    Read/write lock for the DBus clients (senders) of a daemon.
+    Many clients can hold the lock shared at the same time, a client holding
+    the lock can get exclusive access, when the other clients has released it.
+    When a client is waiting for exclusive access, new clients can't get the lock,
+    so the waiting client dont starve.
+    Only one client can wait for exclusive access at the time, and the wait is
+    given up after a timeout, so a client holding the lock without doing anything
+    can't block the others forever.
+    '''
+
+    def __init__(self, timeout=60):
+        self.clients = set()    # senders holding the lock
+        self.timeout = timeout  # max seconds to wait for exclusive access
+        self._waiting = None    # (sender, callback, timeout source id) waiting for exclusive access
+
+    def __len__(self):
+        return len(self.clients)
+
+    def __contains__(self, sender):
+        return sender in self.clients
+
+    def acquire(self, sender):
+        '''
+        Get the lock shared, return False if the sender already has it or
+        a client is waiting for exclusive access
+        '''
+        if sender in self.clients or self._waiting:
+            return False
+        self.clients.add(sender)
+        return True
+
+    def release(self, sender):
+        '''
+        Release the lock for a sender
+        '''
+        self.clients.discard(sender)
+        self._grant()
+
+    def acquire_exclusive(self, sender, callback):
+        '''
+        Get exclusive access for a sender holding the lock
+        :param sender: the sender
+        :param callback: called with True when the sender is the only one holding the lock
+                         or with False if the sender release the lock or the timeout is reached
+                         while waiting
+        :return: False if another client is already waiting for exclusive access
+        '''
+        if self._waiting:
+            return False
+        timeout_id = gobject.timeout_add_seconds(self.timeout, self._on_timeout)
+        self._waiting = (sender, callback, timeout_id)
+        self._grant()
+        return True
+
+    def _end_waiting(self, granted, timeout=False):
+        '''
+        Stop waiting for exclusive access and call the callback
+        '''
+        sender, callback, timeout_id = self._waiting
+        self._waiting = None
+        if not timeout:
+            gobject.source_remove(timeout_id)
+        callback(granted)
+
+    def _on_timeout(self):
+        '''
+        timeout for the exclusive access
+        '''
+        self._end_waiting(False, timeout=True)
+        return False
+
+    def _grant(self):
+        '''
+        Give exclusive access to the waiting client, when possible
+        '''
+        if self._waiting:
+            sender = self._waiting[0]
+            if sender not in self.clients: # lock released while waiting
+                self._end_waiting(False)
+            elif len(self.clients) == 1:
+                self._end_waiting(True)
+
+#------------------------------------------------------------------------------ Search index
+class SearchIndex:
+    '''
+    Inverted index of the lowercase tokens in some text fields of a list of items
+    (packages in a sack or package names for pkgtags)
+
+    A key matches the tokens it is a substring of, so the result is the same as a
+    LIKE '%key%' search in the fields, as long the key dont contain whitespace
+    '''
+    VERSION = 1
+
+    def __init__(self, fields, checksum=None):
+        self.fields = fields
+        self.checksum = checksum
+        self.items = []
+        self.tokens = dict([(field,{}) for field in fields])  # field -> {token -> [item index,...]}
+        self._vocab = {}
+
+    def add(self, item, values):
+        '''
+        Add an item to the index
+        :param item: the item (ex. a (n,e,v,r,a) tuple)
+        :param values: {field : text} dict with the field values of the item
+        '''
+        ndx = len(self.items)
+        self.items.append(item)
+        for field in self.fields:
+            text = values.get(field)
+            if not text:
+                continue
+            tokens = self.tokens[field]
+            for token in set(to_unicode(text).lower().split()):
+                tokens.setdefault(token, []).append(ndx)
+
+    def search(self, field, key):
+        '''
+        Get the items where a token in field contains key
+        :param field: field to search in
+        :param key: the key to search for
+        :return: set of item indexes
+        '''
+        return self.get_items(field, self.search_tokens(field, key))
+
+    def search_tokens(self, field, key, tokens=None):
+        '''
+        Get the tokens in field there contains key
+        :param field: field to search in
+        :param key: the key to search for
+        :param tokens: tokens found for a key there is a substring of key, only these is checked
+        :return: list of tokens
+        '''
+        key = to_unicode(key).lower()
+        if tokens is not None: # narrow the tokens found for a shorter key
+            return [token for token in tokens if key in token]
+        return self._matching_tokens(field, key)
+
+    def get_items(self, field, tokens):
+        '''
+        Get the items containing some tokens in field
+        :return: set of item indexes
+        '''
+        result = set()
+        field_tokens = self.tokens[field]
+        for token in tokens:
+            result.update(field_tokens[token])
+        return result
+
+    def _matching_tokens(self, field, key):
+        '''
+        find the tokens containing key, by searching a newline separated string of all
+        the tokens, so the scanning is done by str.find and not in python
+        '''
+        if not field in self._vocab:
+            vocab = self.tokens[field].keys()
+            starts = []
+            pos = 0
+            for token in vocab:
+                starts.append(pos)
+                pos += len(token) + 1
+            self._vocab[field] = (u'\n'.join(vocab), starts, vocab)
+        blob, starts, vocab = self._vocab[field]
+        found = []
+        pos = blob.find(key)
+        while pos != -1:
+            i = bisect_right(starts, pos) - 1
+            found.append(vocab[i])
+            if i + 1 == len(starts):
+                break
+            pos = blob.find(key, starts[i + 1]) # continue in the next token
+        return found
+
+    def save(self, path):
+        '''
+        Save the index to a file
+        '''
+        data = {'version': SearchIndex.VERSION, 'checksum': self.checksum, 'fields': self.fields,
+                'items': self.items, 'tokens': self.tokens}
+        tmp = path + '.tmp'
+        f = open(tmp, 'wb')
+        try:
+            marshal.dump(data, f)
+        finally:
+            f.close()
+        os.rename(tmp, path)
+
+    @staticmethod
+    def load(path, checksum):
+        '''
+        Load an index from a file, return None if the file is missing, invalid or
+        build from other metadata (checksum dont match)
+        '''
+        try:
+            f = open(path, 'rb')
+            try:
+                data = marshal.load(f)
+            finally:
+                f.close()
+            if data['version'] != SearchIndex.VERSION or data['checksum'] != checksum:
+                return None
+            index = SearchIndex(data['fields'], checksum)
+            index.items = data['items']
+            index.tokens = data['tokens']
+            return index
+        except (IOError, OSError, EOFError, ValueError, TypeError, KeyError):
+            return None
+
+def to_dbus_variant(value):
+    '''
+    convert a package attribute value to a DBus type there can be stored in a variant
+    None is converted to the V2_NONE struct, lists & tuples to arrays, so a struct inside
+    a variant is always a None value. dicts with all int keys is stored as a{xv}, other dicts as a{sv}
+    '''
+    if value is None:
+        return V2_NONE
+    elif isinstance(value, bool):
+        return dbus.Boolean(value)
+    elif isinstance(value, (int, long)):
+        return dbus.Int64(value)
+    elif isinstance(value, float):
+        return dbus.Double(value)
+    elif isinstance(value, basestring):
+        return dbus.String(to_unicode(value))
+    elif isinstance(value, (list, tuple, set)):
+        return dbus.Array([to_dbus_variant(elem) for elem in value], signature='v')
+    elif isinstance(value, dict):
+        int_keys = [key for key in value if isinstance(key, (int, long)) and not isinstance(key, bool)]
+        if value and len(int_keys) == len(value):
+            return dbus.Dictionary(dict([(dbus.Int64(key), to_dbus_variant(elem)) for key, elem in value.iteritems()]), signature='xv')
+        return dbus.Dictionary(dict([(to_unicode(str(key)), to_dbus_variant(elem)) for key, elem in value.iteritems()]), signature='sv')
+    else:
+        return dbus.String(to_unicode(str(value)))
+
+def to_dbus_rows(rows):
+    '''
+    convert a list of lists/tuples to a DBus array of variant arrays (aav)
+    '''
+    return dbus.Array([dbus.Array([to_dbus_variant(value) for value in row], signature='v') for row in rows], signature='av')
+
+#------------------------------------------------------------------------------ Package narrows
+class PackageNarrows:
+    '''
+    The packages classified into the package filters there need the whole sack (installed, available, extras)
+    with lists for each filter and pkgtup sets, so a membership test is a dict lookup
+    '''
+    def __init__(self):
+        self.lists = dict([(narrow, []) for narrow in NARROW_FILTERS])
+        self.tups = dict([(narrow, set()) for narrow in NARROW_FILTERS])
+
+    def add(self, narrow, po):
+        self.lists[narrow].append(po)
+        self.tups[narrow].add(po.pkgtup)
+
+    def get(self, narrow):
+        return self.lists.get(narrow, [])
+
+    def contains(self, narrow, po):
+        return po.pkgtup in self.tups[narrow]
+
+#------------------------------------------------------------------------------ Groups cache
+class GroupsCache:
+    '''
+    The compiled comps categories & groups with the installed state of the groups
+    and the group packages, so the comps don't have to be loaded & compiled for each call
+    '''
+    def __init__(self, repos, rpmdb_version, comps, inst_names):
+        self.repos = repos                  # [[repo id, repomd checksum],...] the comps is from
+        self.rpmdb_version = rpmdb_version  # rpmdb version the installed state is from
+        self.categories = []                # [(category_id, name, desc, [group_id,...]),...]
+        self.groups = {}                    # group_id -> (name, desc, mandatory, default, optional, conditional)
+        self.name_groups = {}               # pkg name -> set of group_ids
+        self.installed = {}                 # group_id -> installed
+        self.group_pkgs = {}                # (group_id, group filter) -> [pkg_id,...]
+        for category in comps.get_categories():
+            grp_ids = [comps.return_group(g).groupid for g in category.groups if comps.has_group(g)]
+            self.categories.append((category.categoryid, category.ui_name, category.ui_description, grp_ids))
+        for grp in comps.get_groups():
+            self.groups[grp.groupid] = (grp.ui_name, grp.ui_description,
+                                        grp.mandatory_packages.keys(), grp.default_packages.keys(),
+                                        grp.optional_packages.keys(), grp.conditional_packages.keys())
+            for name in grp.packages:
+                self.name_groups.setdefault(name, set()).add(grp.groupid)
+        self.inst_names = set()
+        self.set_installed(inst_names)
+
+    def set_installed(self, inst_names, changed=None):
+        '''
+        update the installed state of the groups
+        :param inst_names: the installed package names
+        :param changed: the package names there has changed, None to update all groups
+        '''
+        self.inst_names = set(inst_names)
+        if changed is None:
+            grp_ids = self.groups.keys()
+        else:
+            grp_ids = set()
+            for name in changed:
+                grp_ids.update(self.name_groups.get(name, []))
+        for grp_id in grp_ids:
+            self.installed[grp_id] = self.is_installed(grp_id)
+            self.group_pkgs.pop((grp_id, 'all'), None)
+            self.group_pkgs.pop((grp_id, 'default'), None)
+
+    def is_installed(self, grp_id):
+        '''
+        The old way yum groups is installed (like comps.compile)
+        all mandatory packages is installed or if there is no mandatory packages,
+        one of the default, optional or conditional packages is installed
+        '''
+        name, desc, mandatory, default, optional, conditional = self.groups[grp_id]
+        if mandatory:
+            for pkg_name in mandatory:
+                if not pkg_name in self.inst_names:
+                    return False
+            return True
+        else:
+            for pkg_name in default + optional + conditional:
+                if pkg_name in self.inst_names:
+                    return True
+            return False
+
+#------------------------------------------------------------------------------ Dependency graph
+class DependencyGraph:
+    '''
+    The requires/provides graph for the installed & available packages, the edges
+    is found when they are needed and memoized, it is keept for a metadata & rpmdb generation
+    '''
+    def __init__(self, yumbase, installed):
+        self.yumbase = yumbase
+        self.installed = installed  # pkgtup -> installed po
+        self._providers = {}        # (name, flag, evr) -> [po,...]
+        self._installed_providers = {} # (name, flag, evr) -> set of installed pkgtups providing it
+        self._requires = {}         # (repoid, pkgtup) -> set of po's providing the requirements
+        self._required_by = {}      # (repoid, pkgtup) -> {installed po : [requirement,...]} requiring it
+        self._req_index = None      # requirement name -> [(installed po, requirement),...]
+        self._file_reqs = None      # the file requirement names in the index
+        self._primary_file_reqs = None # the file requirement names in the primary metadata (/etc/*, *bin/*)
+
+    def get_providers(self, req):
+        '''
+        Get the packages providing a requirement, installed packages is preferred
+        only the newest available packages is used
+        '''
+        if not req in self._providers:
+            (name, flag, evr) = req
+            pkgs = self.yumbase.rpmdb.getProvides(name, flag, evr).keys()
+            if not pkgs:
+                try:
+                    pkgs = packagesNewestByNameArch(self.yumbase.pkgSack.getProvides(name, flag, evr).keys())
+                except PackageSackError:
+                    pkgs = []
+            self._providers[req] = pkgs
+        return self._providers[req]
+
+    def requires(self, po):
+        '''
+        Get the packages providing the requirements of a package
+        '''
+        key = (po.repoid, po.pkgtup)
+        if not key in self._requires:
+            result = set()
+            for req in po.requires:
+                if req[0].startswith('rpmlib('):
+                    continue
+                for prov in self.get_providers(req):
+                    if prov.pkgtup != po.pkgtup:
+                        result.add(prov)
+            self._requires[key] = result
+        return self._requires[key]
+
+    def get_installed_providers(self, req):
+        '''
+        Get the pkgtups of the installed packages providing a requirement
+        '''
+        if not req in self._installed_providers:
+            (name, flag, evr) = req
+            if name.startswith('/'):
+                pkgs = self.yumbase.rpmdb.searchFiles(name)
+            else:
+                pkgs = self.yumbase.rpmdb.getProvides(name, flag, evr).keys()
+            self._installed_providers[req] = set([po.pkgtup for po in pkgs])
+        return self._installed_providers[req]
+
+    def required_by(self, po):
+        '''
+        Get the installed packages requiring something provided by a package
+        '''
+        return set(self._get_requirers(po))
+
+    def closure(self, pkgs, reverse=False):
+        '''
+        Get the packages needed by a list of packages (all levels) or if reverse is True
+        the installed packages there need them (what a remove would remove too).
+        In the reverse closure a package is only removed, when all the installed providers
+        of one of its requirements is removed.
+        '''
+        if reverse:
+            return self._remove_closure(pkgs)
+        found = set(pkgs)
+        todo = list(pkgs)
+        while todo:
+            po = todo.pop()
+            for dep in self.requires(po):
+                if not dep in found:
+                    found.add(dep)
+                    todo.append(dep)
+        return found - set(pkgs)
+
+    def _remove_closure(self, pkgs):
+        '''
+        Get the installed packages there would be removed with a list of packages
+        '''
+        removed = set([po.pkgtup for po in pkgs])
+        found = set()
+        todo = list(pkgs)
+        while todo:
+            po = todo.pop()
+            for ipo, reqs in self._get_requirers(po).iteritems():
+                if ipo.pkgtup in removed:
+                    continue
+                for req in reqs:
+                    if not self.get_installed_providers(req) - removed: # no provider left
+                        removed.add(ipo.pkgtup)
+                        found.add(ipo)
+                        todo.append(ipo)
+                        break
+        return found
+
+    def _get_requirers(self, po):
+        '''
+        Get the installed packages requiring something provided by a package
+        as a {installed po : [requirement,...]} dict with the requirements the package provides
+        '''
+        key = (po.repoid, po.pkgtup)
+        if not key in self._required_by:
+            index = self._get_req_index()
+            result = {}
+            for (name, flag, evr) in po.provides:
+                for (ipo, req) in index.get(name, []):
+                    if ipo.pkgtup != po.pkgtup and po.checkPrco('provides', req):
+                        result.setdefault(ipo, []).append(req)
+            if po.repoid == 'installed':
+                file_reqs = self._file_reqs
+            else: # only the primary files, so the filelists metadata is not loaded (like yum does)
+                file_reqs = self._primary_file_reqs
+            if file_reqs:
+                if po.repoid == 'installed':
+                    files = set(po.filelist + po.dirlist)
+                else:
+                    files = set(po.returnFileEntries('file', primary_only=True) +
+                                po.returnFileEntries('dir', primary_only=True))
+                for name in file_reqs:
+                    if name in files:
+                        for (ipo, req) in index[name]:
+                            if ipo.pkgtup != po.pkgtup:
+                                result.setdefault(ipo, []).append(req)
+            self._required_by[key] = result
+        return self._required_by[key]
+
+    def _get_req_index(self):
+        '''
+        Get the requirement name -> [(installed po, requirement),...] index
+        '''
+        if self._req_index is None:
+            index = {}
+            for ipo in self.installed.itervalues():
+                for req in ipo.requires:
+                    if not req[0].startswith('rpmlib('):
+                        index.setdefault(req[0], []).append((ipo, req))
+            self._req_index = index
+            self._file_reqs = [name for name in index if name.startswith('/')]
+            self._primary_file_reqs = [name for name in self._file_reqs if re_primary_filename(name)]
+        return self._req_index
+
+class SearchCache:
+    '''
+    Bounded LRU cache for search results
+    the keys is (generation, fields, keys, match_all, newest_only, tags) tuples
+    and the values is (token matches, result) pairs
+    '''
+    def __init__(self, size=100):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.narrowed = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        '''
+        Get a cached value, None if it is not cached
+        '''
+        if key in self._entries:
+            value = self._entries.pop(key)
+            self._entries[key] = value # move to the end (most recent used)
+            self.hits += 1
+            return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        '''
+        Add a value to the cache, remove the least recent used when full
+        '''
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def find_narrowable(self, key):
+        '''
+        Find the token matches of a cached search, there can be narrowed to the search in key,
+        it must be in the same generation, fields and tags and for each search key, the cached
+        key must be a substring (ex. a prefix) of it. The one with the longest keys is used.
+        :return: token matches or None if no cached search can be used
+        '''
+        generation, fields, keys, match_all, newest_only, tags = key
+        keys = [k.lower() for k in keys]
+        best = None
+        best_len = -1
+        for (c_gen, c_fields, c_keys, c_match_all, c_newest, c_tags), (matches, result) in self._entries.iteritems():
+            if matches is None or c_gen != generation or c_fields != fields or c_tags != tags:
+                continue
+            if len(c_keys) != len(keys):
+                continue
+            c_keys = [k.lower() for k in c_keys]
+            if [1 for c_k, k in zip(c_keys, keys) if not c_k in k]:
+                continue
+            c_len = sum([len(k) for k in c_keys])
+            if c_len > best_len:
+                best = matches
+                best_len = c_len
+        if best is not None:
+            self.narrowed += 1
+        return best
+
+    def get_stats(self):
+        '''
+        get the cache counters as a dict
+        '''
+        return {'hits': self.hits, 'misses': self.misses, 'narrowed': self.narrowed,
+                'size': len(self._entries), 'max_size': self.size}
+
 class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
 
     def __init__(self, mainloop):
@@ -87,6 +1063,8 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         self.authorized_sender = set()
         self._lock = None
         self._yumbase = None
+        self._worker = WorkQueue()      # worker thread for the DBus methods using yum
+        self._progress_throttle = ProgressThrottle() # rate limit for the progress signals
         self._can_quit = True
         self._is_working = False
         self._watchdog_count = 0
@@ -94,8 +1072,45 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         self._timeout_idle = 20         # time to daemon is closed when unlocked
         self._timeout_locked = 600      # time to daemon is closed when locked and not working
         self._updateMetadata = None     # Cache for yum UpdateMetadata object
+        self._advisory_index = None     # Cache for pkg name -> [notice metadata,...]
+        self._ladders = None            # Cache for pkg name -> [po,...] sorted by EVR
+        self._ladders_generation = None # generation the version ladders was build in
+        self._coinstall = {}            # Cache for (arch1, arch2) -> canCoinstall
         self._updates_list = None       # Cache for updates
         self._obsoletes_list = None     # Cache for obsoletes
+        self._obsoleted = None          # Cache for obsoleting pkgtup -> [obsoleted installed po,...]
+        self._update_tups = None        # Cache for the pkgtups of the updates
+        self._obsolete_tups = None      # Cache for the pkgtups of the obsoletes
+        self._update_lists_generation = None # generation the updates & obsoletes was loaded in
+        self._narrows = None            # Cache for PackageNarrows
+        self._narrows_generation = None # generation the PackageNarrows was build in
+        self._recent = None             # Cache for the recent packages
+        self._recent_generation = None  # generation the recent packages was found in
+        self._po_index = {}             # Cache for pkg_id -> po lookups, one dict for each repo sack
+        self._installed_index = None    # Cache for (pkgtup -> po, name -> [po,...]) of installed packages
+        self._installed_rpmdb = None    # rpmdb generation the installed index was build from
+        self._rpmdb_generation = None   # rpmdb generation found in the current job
+        self._cursors = {}              # Open package cursors, handle -> [pkgs, fields, last access time, sender]
+        self._cursor_count = 0
+        self._expired_cursors = {}      # handle -> sender for the cursors closed by the daemon
+        self._cursor_lists = {}         # pkg_filter -> sorted list of po's, shared by the cursors
+        self._cursor_lists_generation = None # generation the cursor lists is from
+        self.cursor_error = CursorExpiredError # exception used for cursors closed by the daemon
+        self._cursor_watches = {}       # sender -> NameOwnerChanged watch for the senders with open cursors
+        self._timeout_cursor = 300      # time before a cursor not used is closed
+        self._search_index = {}         # Cache for SearchIndex, one for each sack ('installed' or repo id)
+        self._search_index_rpmdb = None # rpmdb generation the installed SearchIndex was build from
+        self._search_index_restart = None # rpmdb generation the background index build was restarted for
+        self._search_tags = None        # SearchIndex for the pkgtags
+        self._pkgtags_map = None        # Cache for pkg name -> [tag,...] from the pkgtags db
+        self._search_cache = SearchCache()  # LRU cache for search results
+        self._cache_generation = 0      # increased every time the caches is reset
+        self._groups_cache = None       # GroupsCache, it is keept when the YumBase is reset
+        self._provides_cache = {}       # Cache for provide pattern -> set of pkg_ids
+        self._dep_graph = None          # Cache for DependencyGraph
+        self._dep_graph_generation = None # generation the DependencyGraph is build in
+        self._provides_generation = None # generation the provides cache is from
+        self._changed_names = None      # (rpmdb version, pkg names) for the last transaction
 
     @property
     def yumbase(self):
@@ -106,6 +1121,14 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
             self._get_yumbase()
         return self._yumbase
 
+    def check_permission(self, sender):
+        '''
+        Check for senders permission, all senders is allowed by default
+        the system daemon overloads it to check with PolicyKit
+        :param sender:
+        '''
+        pass
+
 #===============================================================================
 # Helper methods for api methods both in system & session
 # Search -> _search etc
@@ -123,18 +1146,248 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         :param newest_only: return only the newest version of a package
         :param tags: seach pkgtags
         '''
-        result = []
-        for found in self.yumbase.searchGenerator(fields, keys, keys=True, searchtags=tags):
-            pkg = found[0]
-            fkeys = found[1]
-            if match_all and not len(fkeys) == len(keys): # skip the result if not all keys matches
-                continue
-            result.append(pkg)
-        pkgs = self._limit_package_list(result, skip_old=not match_all) # remove dupes and optional old ones
-        if newest_only:
-            pkgs = packagesNewestByName(pkgs)
-        result = [self._get_id(pkg) for pkg in pkgs]
-        return result
+        generation = (self._cache_generation, self._get_rpmdb_generation())
+        cache_key = (generation, tuple([unicode(f) for f in fields]), tuple([unicode(k) for k in keys]),
+                     bool(match_all), bool(newest_only), bool(tags))
+        cached = self._search_cache.get(cache_key)
+        if cached:
+            return cached[1]
+        # reuse the matches of a cached search with shorter keys (search as you type)
+        base_matches = self._search_cache.find_narrowable(cache_key)
+        found, token_matches = self._search_from_index(fields, keys, tags, base_matches)
+        if found is None: # the search can't be done by the index
+            found = self.yumbase.searchGenerator(fields, keys, keys=True, searchtags=tags)
+        result = []
+        for pkg, fkeys in found:
+            self._worker.check_cancelled()
+            if match_all and not len(fkeys) == len(keys): # skip the result if not all keys matches
+                continue
+            result.append(pkg)
+        pkgs = self._limit_package_list(result, skip_old=not match_all) # remove dupes and optional old ones
+        if newest_only:
+            pkgs = packagesNewestByName(pkgs)
+        result = [self._get_id(pkg) for pkg in pkgs]
+        self._search_cache.put(cache_key, (token_matches, result))
+        return result
+
+    def _get_progress_stats(self):
+        '''
+        Get the progress signal counters (max_rate, sent, suppressed)
+        it will return a dict
+        '''
+        return self._progress_throttle.get_stats()
+
+    def _get_search_cache_stats(self):
+        '''
+        Get the search cache counters (hits, misses, narrowed, size, max_size)
+        it will return a dict
+        '''
+        return self._search_cache.get_stats()
+
+    def _search_from_index(self, fields, keys, tags, base_matches=None):
+        '''
+        Search for packages using the search indexes there is ready, the sacks without
+        a ready index is searched in the sack (the indexes is only build in the background)
+        return a (found, token matches) pair, found is a list of (po, matched keys) pairs,
+        like yumbase.searchGenerator, or None if the search can't be done by the index
+        (unknown field, key with whitespace or pkgtags index not ready). token matches is a list with a
+        {(sack_id, field) : tokens} dict for each indexed sack and key.
+
+        :param fields: list of fields to search in
+        :param keys: list of keywords to search for
+        :param tags: seach pkgtags
+        :param base_matches: token matches for a search with shorter keys, to narrow
+        '''
+        for field in fields:
+            if not field in SEARCH_FIELDS:
+                return None, None
+        for key in keys:
+            if len(key.split()) != 1:
+                return None, None
+        if tags and self._search_tags is None:
+            return None, None
+        indexes, sacks = self._get_search_sacks()
+        found = {} # (sack id, item index) -> set of matched keys
+        token_matches = []
+        for i, key in enumerate(keys):
+            matches = {}
+            base = base_matches and base_matches[i] or {}
+            for sack_id, index in indexes.items():
+                for field in fields:
+                    tokens = index.search_tokens(field, key, base.get((sack_id, field)))
+                    matches[(sack_id, field)] = tokens
+                    for ndx in index.get_items(field, tokens):
+                        found.setdefault((sack_id, ndx), set()).add(key)
+            if tags:
+                tokens = self._search_tags.search_tokens('tags', key, base.get(('tags', 'tags')))
+                matches[('tags', 'tags')] = tokens
+                tag_names = [self._search_tags.items[ndx].lower() for ndx in self._search_tags.get_items('tags', tokens)]
+                for sack_id, index in indexes.items():
+                    for pkg_ndx in index.get_items('name', [name for name in tag_names if name in index.tokens['name']]):
+                        found.setdefault((sack_id, pkg_ndx), set()).add(key)
+            token_matches.append(matches)
+        installed, names = self._get_installed_index()
+        result = []
+        for (sack_id, ndx), fkeys in found.iteritems():
+            (n, e, v, r, a) = indexes[sack_id].items[ndx]
+            if sack_id == 'installed':
+                po = installed.get((n, a, e, v, r))
+            else:
+                index = self._get_po_index(sack_id)
+                po = index and index.get((n, e, v, r, a))
+            if po:
+                result.append((po, list(fkeys)))
+        for sack in sacks:
+            result.extend(self._search_sack(sack, fields, keys))
+        return result, token_matches
+
+    def _get_search_sacks(self):
+        '''
+        Get the ready SearchIndexes and the sacks without one
+        return a ({sack_id : SearchIndex}, [sack,...]) pair, the background index build
+        is started again, if the installed index is old after the build was done
+        '''
+        indexes = {}
+        sacks = []
+        rpmdb_gen = self._get_rpmdb_generation()
+        if 'installed' in self._search_index and self._search_index_rpmdb == rpmdb_gen:
+            indexes['installed'] = self._search_index['installed']
+        else:
+            sacks.append(self.yumbase.rpmdb)
+            if 'installed' in self._search_index and self._search_index_restart != rpmdb_gen:
+                self._search_index_restart = rpmdb_gen
+                gobject.idle_add(self._start_search_index)
+        for repo in self.yumbase.repos.listEnabled():
+            if repo.id in self._search_index:
+                indexes[repo.id] = self._search_index[repo.id]
+            else:
+                try:
+                    sacks.append(self.yumbase.pkgSack.sacks[repo.id])
+                except KeyError: # the repo has no sack (failed to load)
+                    pass
+        return indexes, sacks
+
+    def _search_sack(self, sack, fields, keys):
+        '''
+        Search a sack without a SearchIndex, the same way as yumbase.searchGenerator
+        return a list of (po, matched keys) pairs
+        '''
+        lkeys = [to_unicode(key).lower() for key in keys]
+        result = []
+        for po, count in sack.searchPrimaryFieldsMultipleStrings(fields, lkeys, lowered=True):
+            self._worker.check_cancelled()
+            fkeys = set()
+            for field in fields:
+                value = getattr(po, field, None)
+                if not value:
+                    continue
+                value = to_unicode(value).lower()
+                for key, lkey in zip(keys, lkeys):
+                    if lkey in value:
+                        fkeys.add(key)
+            if fkeys:
+                result.append((po, list(fkeys)))
+        return result
+
+    def _start_search_index(self):
+        '''
+        Start building the search indexes in the background, when the metadata
+        has been loaded, it is build one sack at the time in the worker thread,
+        when there is no other work to do
+        '''
+        gobject.timeout_add(200, self._search_index_timer, self._yumbase)
+
+    def _search_index_timer(self, yumbase):
+        '''
+        mainloop timer for building the search indexes
+        :param yumbase: the YumBase the indexes should be build for
+        '''
+        if yumbase is not self._yumbase: # the YumBase has been reset, stop
+            return False
+        if self._is_working or self._worker.pending or yumbase._pkgSack is None: # busy or metadata not loaded, try later
+            return True
+        self._worker.add(self._search_index_job, (yumbase,), {}, self._search_index_job_done)
+        return False
+
+    def _search_index_job(self, yumbase):
+        '''
+        Build the search index for the next sack (runs in the worker thread)
+        :param yumbase: the YumBase the indexes should be build for
+        '''
+        if yumbase is not self._yumbase: # the YumBase has been reset, stop
+            return False
+        try:
+            return self._build_search_index_step()
+        except Exception, e:
+            self.logger.debug('search index build failed : %s' % str(e))
+            return False
+
+    def _search_index_job_done(self, more):
+        '''
+        Search index job is done, start the timer again if there is more to do
+        '''
+        if more:
+            self._start_search_index()
+
+    def _build_search_index_step(self):
+        '''
+        Load or build the SearchIndex for the next sack missing one
+        return False when there is no more to do
+        '''
+        rpmdb_gen = self._get_rpmdb_generation()
+        if rpmdb_gen != self._search_index_rpmdb:
+            self._search_index.pop('installed', None)
+            self._search_index_rpmdb = rpmdb_gen
+        if not 'installed' in self._search_index:
+            index = SearchIndex(SEARCH_FIELDS)
+            for po in self.yumbase.rpmdb.returnPackages():
+                index.add((po.name, po.epoch, po.ver, po.rel, po.arch),
+                          {'name': po.name, 'summary': po.summary, 'description': po.description})
+            self._search_index['installed'] = index
+            return True
+        for repo in self.yumbase.repos.listEnabled():
+            if not repo.id in self._search_index:
+                self._search_index[repo.id] = self._get_repo_search_index(repo)
+                return True
+        if self._search_tags is None:
+            index = SearchIndex(['tags'])
+            for name, taglist in self._get_pkgtags_map().iteritems():
+                index.add(name, {'tags': ' '.join(taglist)})
+            self._search_tags = index
+            return True
+        return False
+
+    def _get_repo_search_index(self, repo):
+        '''
+        Get the SearchIndex for a repo, it is loaded from the repo cachedir if it is build from the
+        current metadata, else it is build from the repo sack and saved for the next time.
+        '''
+        sack = self.yumbase.pkgSack.sacks[repo.id] # make sure the repo sack is populated
+        try:
+            checksum = repo.repoXML.getData('primary').checksum[1]
+        except Exception:
+            checksum = None
+        path = os.path.join(repo.cachedir, 'yumdaemon-search.idx')
+        if checksum:
+            index = SearchIndex.load(path, checksum)
+            if index:
+                return index
+        index = SearchIndex(SEARCH_FIELDS, checksum)
+        if hasattr(sack, 'primarydb') and repo in sack.primarydb: # read directly from primary.sqlite, it is a lot faster
+            cur = sack.primarydb[repo].cursor()
+            cur.execute('select name, epoch, version, release, arch, summary, description from packages')
+            for (n, e, v, r, a, summary, description) in cur:
+                index.add((n, e, v, r, a), {'name': n, 'summary': summary, 'description': description})
+        else:
+            for po in sack.returnPackages():
+                index.add((po.name, po.epoch, po.ver, po.rel, po.arch),
+                          {'name': po.name, 'summary': po.summary, 'description': po.description})
+        if checksum:
+            try:
+                index.save(path)
+            except (IOError, OSError), e:
+                self.logger.debug('could not save search index %s : %s' % (path, str(e)))
+        return index
 
 
 
@@ -157,6 +1410,84 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
             pkg_ids = []
         return pkg_ids
 
+    def _what_provides(self, patterns):
+        '''
+        Get a list of the installed & available packages providing some
+        capabilities or files (Helper for WhatProvides)
+        the result for each pattern is cached until the metadata or rpmdb is changed
+
+        :param patterns: list of capabilities/files (ex. /usr/bin/foo, libssl.so.10()(64bit))
+        '''
+        generation = (self._cache_generation, self._get_rpmdb_generation())
+        if self._provides_generation != generation:
+            self._provides_cache = {}
+            self._provides_generation = generation
+        pkg_ids = set()
+        for pattern in patterns:
+            if not pattern in self._provides_cache:
+                pkgs = self.yumbase.rpmdb.searchProvides(pattern)
+                try:
+                    pkgs = pkgs + self.yumbase.pkgSack.searchProvides(pattern)
+                except PackageSackError:
+                    pass
+                self._provides_cache[pattern] = self._to_package_id_list(pkgs)
+            pkg_ids.update(self._provides_cache[pattern])
+        return sorted(pkg_ids)
+
+    def _get_dependency_graph(self):
+        '''
+        Get the DependencyGraph, a new one is made when the metadata or rpmdb is changed
+        '''
+        generation = (self._cache_generation, self._get_rpmdb_generation())
+        if self._dep_graph is None or self._dep_graph_generation != generation:
+            installed, names = self._get_installed_index()
+            self._dep_graph = DependencyGraph(self.yumbase, installed)
+            self._dep_graph_generation = generation
+        return self._dep_graph
+
+    def _get_requires(self, ids):
+        '''
+        Get the packages providing the requirements for a list of yum package ids
+        it will return a {pkg_id : [pkg_id,...]} dict, the value for a pkg_id not found is None
+        :param ids: list of yum package ids
+        '''
+        graph = self._get_dependency_graph()
+        result = {}
+        for id in ids:
+            po = self._get_po(id)
+            if po:
+                result[id] = sorted(self._to_package_id_list(graph.requires(po)))
+            else:
+                result[id] = None
+        return result
+
+    def _get_required_by(self, ids):
+        '''
+        Get the installed packages requiring the packages for a list of yum package ids
+        it will return a {pkg_id : [pkg_id,...]} dict, the value for a pkg_id not found is None
+        :param ids: list of yum package ids
+        '''
+        graph = self._get_dependency_graph()
+        result = {}
+        for id in ids:
+            po = self._get_po(id)
+            if po:
+                result[id] = sorted(self._to_package_id_list(graph.required_by(po)))
+            else:
+                result[id] = None
+        return result
+
+    def _get_dependency_closure(self, ids, reverse):
+        '''
+        Get all the packages needed by a list of yum package ids (all levels)
+        or if reverse is True, the installed packages there need them
+        :param ids: list of yum package ids
+        :param reverse: get the packages there need them
+        '''
+        pkgs = [po for po in [self._get_po(id) for id in ids] if po]
+        graph = self._get_dependency_graph()
+        return sorted(self._to_package_id_list(graph.closure(pkgs, reverse)))
+
     def _get_groups(self):
         '''
         make a list with categoties and there groups
@@ -164,24 +1495,56 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         and the group is installed when all mandatory & default packages is installed.
         '''
         all_groups = []
-        comps = self.yumbase.comps
-        # this is the old way, so grp.installed is set if all mandatory/default packages is installed.
-        comps.compile(self.yumbase.rpmdb.simplePkgList())  
         try:
-            cats = comps.get_categories()
-            for category in cats:
-                cat = (category.categoryid, category.ui_name, category.ui_description)
+            cache = self._get_groups_cache()
+            for (cat_id, cat_name, cat_desc, grp_ids) in cache.categories:
+                cat = (cat_id, cat_name, cat_desc)
                 cat_grps = []
-                grps = [comps.return_group(g) for g in category.groups if comps.has_group(g)]
-                for grp in grps:
-                    elem = (grp.groupid, grp.ui_name, grp.ui_description, grp.installed)
+                for grp_id in grp_ids:
+                    (name, desc) = cache.groups[grp_id][:2]
+                    elem = (grp_id, name, desc, cache.installed[grp_id])
                     cat_grps.append(elem)
                 cat_grps.sort()
                 all_groups.append((cat, cat_grps))
         except Errors.GroupsError, e:
-            print str(e)
+            self.logger.error('could not load the groups : %s' % str(e))
         all_groups.sort()
-        return json.dumps(all_groups)
+        return all_groups
+
+    def _get_groups_cache(self):
+        '''
+        Get the GroupsCache, the comps is only loaded & compiled again if the
+        metadata has changed, if the rpmdb has changed by a transaction, only
+        the groups with the changed packages is updated.
+        '''
+        repos = self._get_repo_checksums()
+        rpmdb_version = str(self.yumbase.rpmdb.simpleVersion(main_only=True)[0])
+        cache = self._groups_cache
+        if cache is None or repos is None or cache.repos != repos:
+            inst_names = [pkgtup[0] for pkgtup in self.yumbase.rpmdb.simplePkgList()]
+            cache = GroupsCache(repos, rpmdb_version, self.yumbase.comps, inst_names)
+            self._groups_cache = cache
+        elif cache.rpmdb_version != rpmdb_version:
+            installed, names = self._get_installed_index()
+            changed = None
+            if self._changed_names and self._changed_names[0] == cache.rpmdb_version:
+                changed = self._changed_names[1] # only a transaction from us has changed the rpmdb
+            cache.set_installed(names.keys(), changed)
+            cache.rpmdb_version = rpmdb_version
+        self._changed_names = None
+        return cache
+
+    def _set_changed_names(self):
+        '''
+        Remember the names of the packages in the current transaction and the
+        rpmdb version before it is run, so the groups cache can be updated incremental.
+        '''
+        try:
+            rpmdb_version = str(self.yumbase.rpmdb.simpleVersion(main_only=True)[0])
+            names = set([txmbr.name for txmbr in self.yumbase.tsInfo.getMembers()])
+            self._changed_names = (rpmdb_version, names)
+        except Exception:
+            self._changed_names = None
 
     def _get_repositories(self, filter):
         '''
@@ -200,31 +1563,29 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
     def _get_config(self, setting):
         '''
         Get the value of a yum config setting
-        it will return a JSON string of the config
+        it will return the value of the config or None if not found
         :param setting: name of setting (debuglevel etc..)
         '''
         if setting == '*': # Return all config
             cfg = self.yumbase.conf
-            all_conf = dict([(c,getattr(cfg,c)) for c in cfg.iterkeys()])
-            value =  json.dumps(all_conf)
+            value = dict([(c,getattr(cfg,c)) for c in cfg.iterkeys()])
         elif hasattr(self.yumbase.conf, setting):
-            value = json.dumps(getattr(self.yumbase.conf, setting))
+            value = getattr(self.yumbase.conf, setting)
         else:
-            value = json.dumps(None)
+            value = None
         return value
     
     def _get_repo(self, repo_id ):
         '''
         Get information about a give repo_id
-        the repo setting will be returned as dictionary in JSON format
+        the repo setting will be returned as dictionary or None if not found
         :param repo_id:
         '''
         try:
             repo = self.yumbase.repos.getRepo(repo_id)
-            repo_conf = dict([(c,getattr(repo,c)) for c in repo.iterkeys()])
-            value = json.dumps(repo_conf)
+            value = dict([(c,getattr(repo,c)) for c in repo.iterkeys()])
         except Errors.RepoError:
-            value = json.dumps(None)
+            value = None
         return value
     
     def _get_packages(self, pkg_filter):
@@ -232,90 +1593,421 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         Get a list of package ids, based on a package pkg_filterer
         :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
         '''
-        if pkg_filter in ['installed','available','updates','obsoletes','recent','extras']:
-            yh = self.yumbase.doPackageLists(pkgnarrow=pkg_filter)
-            pkgs = getattr(yh,pkg_filter)
-            value = self._to_package_id_list(pkgs)
-        else:
-            value = []
-        return value
-    
+        pkgs = self._get_package_list(pkg_filter)
+        return self._to_package_id_list(pkgs)
+
     def _get_package_with_attributes(self, pkg_filter, fields):
         '''
         Get a list of package ids, based on a package pkg_filterer
         :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
         '''
-        value = []
-        if pkg_filter in ['installed','available','updates','obsoletes','recent','extras']:
-            yh = self.yumbase.doPackageLists(pkgnarrow=pkg_filter)
-            pkgs = getattr(yh,pkg_filter)
-            value = [self._get_po_list(po,fields) for po in pkgs]
-        return value
+        pkgs = self._get_package_list(pkg_filter)
+        return [self._get_po_list(po,fields) for po in pkgs]
+
+    def _get_package_columns(self, pkg_filter, fields):
+        '''
+        Get the packages for a package filter with attributes in a column format
+        return a dict with a native DBus array for each column, the repo & arch names is
+        stored in the 'repos' & 'arches' lists and the 'repo' & 'arch' columns is index
+        into them. attribute values is stored as variants in a column named by the attribute
+        :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+        :param fields: package attributes to get for each package
+        '''
+        pkgs = self._get_package_list(pkg_filter)
+        repos = {}
+        arches = {}
+        columns = dict([(col, []) for col in ('name', 'epoch', 'version', 'release', 'arch', 'repo')])
+        values = dict([(field, []) for field in fields])
+        for po in pkgs:
+            columns['name'].append(po.name)
+            columns['epoch'].append(po.epoch)
+            columns['version'].append(po.ver)
+            columns['release'].append(po.rel)
+            columns['arch'].append(arches.setdefault(po.arch, len(arches)))
+            columns['repo'].append(repos.setdefault(po.ui_from_repo, len(repos)))
+            for field in fields:
+                values[field].append(to_dbus_variant(self._get_po_attribute(po, field)))
+        result = dbus.Dictionary({}, signature='sv')
+        for col in ('name', 'epoch', 'version', 'release'):
+            result[col] = dbus.Array(columns[col], signature='s')
+        result['arch'] = dbus.Array(columns['arch'], signature='i')
+        result['arches'] = dbus.Array(sorted(arches, key=arches.get), signature='s')
+        result['repo'] = dbus.Array(columns['repo'], signature='i')
+        result['repos'] = dbus.Array(sorted(repos, key=repos.get), signature='s')
+        result['fields'] = dbus.Array(fields, signature='s')
+        for field in fields:
+            result['attr:%s' % field] = dbus.Array(values[field], signature='v')
+        return result
+
+    def _open_package_cursor(self, pkg_filter, fields, sender):
+        '''
+        Open a cursor for a package list, so it can be fetched a page at the time
+        it will return a (handle, number of packages) pair
+        the cursor can only be used by the sender, and it is closed when the sender leaves the bus
+        :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+        :param fields: package attributes to get for each package
+        :param sender: the DBus sender owning the cursor
+        '''
+        self._expire_cursors()
+        pkgs = self._get_cursor_list(pkg_filter)
+        self._cursor_count += 1
+        handle = 'cursor-%i' % self._cursor_count
+        self._cursors[handle] = [pkgs, fields, time.time(), sender]
+        if sender and not sender in self._cursor_watches:
+            gobject.idle_add(self._watch_cursor_owner, sender) # the watch is added from the mainloop
+        return (handle, len(pkgs))
+
+    def _get_cursor_list(self, pkg_filter):
+        '''
+        Get the sorted package list for a package filter, it is sorted once for each
+        metadata & rpmdb generation and shared by the cursors (they never change it)
+        :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+        '''
+        generation = (self._cache_generation, self._get_rpmdb_generation())
+        if self._cursor_lists_generation != generation:
+            self._cursor_lists = {}
+            self._cursor_lists_generation = generation
+        if not pkg_filter in self._cursor_lists:
+            self._cursor_lists[pkg_filter] = sorted(self._get_package_list(pkg_filter))
+        return self._cursor_lists[pkg_filter]
+
+    def _fetch_cursor(self, handle, offset, limit, sender):
+        '''
+        Get a page of [pkg_id, field,....] lists from an open cursor
+        it will return the list, or None if the cursor is not open or owned by another sender
+        cursor_error is raised if the cursor of the sender has been closed by the daemon
+        :param handle: cursor handle
+        :param offset: index of the first package to get (a negative offset is handled as 0)
+        :param limit: max number of packages to get (-1 = no limit)
+        :param sender: the DBus sender
+        '''
+        self._expire_cursors()
+        cursor = self._cursors.get(handle)
+        if cursor is None and handle in self._expired_cursors and self._expired_cursors[handle] == sender:
+            raise self.cursor_error('%s has expired' % handle)
+        if cursor is None or cursor[3] != sender:
+            return None
+        pkgs, fields = cursor[0], cursor[1]
+        cursor[2] = time.time()
+        offset = max(offset, 0)
+        if limit < 0:
+            pkgs = pkgs[offset:]
+        else:
+            pkgs = pkgs[offset:offset+limit]
+        return [self._get_po_list(po,fields) for po in pkgs]
+
+    def _close_cursor(self, handle, sender):
+        '''
+        Close an open cursor
+        return False if the cursor is not open or owned by another sender
+        (closing a cursor already closed by the daemon return False too)
+        :param handle: cursor handle
+        :param sender: the DBus sender
+        '''
+        if self._expired_cursors.get(handle) == sender:
+            del self._expired_cursors[handle]
+        cursor = self._cursors.get(handle)
+        if cursor is None or cursor[3] != sender:
+            return False
+        del self._cursors[handle]
+        return True
+
+    def _close_sender_cursors(self, sender):
+        '''
+        Close the cursors owned by a sender
+        '''
+        for handle, cursor in self._cursors.items():
+            if cursor[3] == sender:
+                del self._cursors[handle]
+        for handle, owner in self._expired_cursors.items():
+            if owner == sender:
+                del self._expired_cursors[handle]
+
+    def _watch_cursor_owner(self, sender):
+        '''
+        Watch a sender with open cursors, so the cursors is closed if it leave the bus
+        (mainloop idle callback)
+        '''
+        if not sender in self._cursor_watches:
+            self._cursor_watches[sender] = self.connection.watch_name_owner(sender,
+                                           lambda owner: self._on_cursor_owner_changed(sender, owner))
+        return False
+
+    def _on_cursor_owner_changed(self, sender, owner):
+        '''
+        NameOwnerChanged callback for a sender with open cursors
+        '''
+        if not owner:
+            watch = self._cursor_watches.pop(sender, None)
+            if watch:
+                watch.cancel()
+            self.logger.debug('closing the cursors for %s, it has left the bus' % sender)
+            self._worker.add(self._close_sender_cursors, (sender,), {}, None)
+
+    def _close_all_cursors(self):
+        '''
+        Close all the open cursors, they can't be used when the YumBase is changed
+        '''
+        for handle in self._cursors.keys():
+            self.logger.debug('cursor closed : %s' % handle)
+            self._drop_cursor(handle)
+
+    def _expire_cursors(self):
+        '''
+        Close the cursors there has not been used for _timeout_cursor seconds
+        '''
+        now = time.time()
+        for handle, cursor in self._cursors.items():
+            if now - cursor[2] > self._timeout_cursor:
+                self.logger.debug('cursor expired : %s' % handle)
+                self._drop_cursor(handle)
+
+    def _drop_cursor(self, handle):
+        '''
+        Close a cursor from the daemon side, the handle is keept so the owner
+        get a cursor_error and not an unknown cursor, when it is used again
+        '''
+        self._expired_cursors[handle] = self._cursors.pop(handle)[3]
 
     def _get_attribute(self, id, attr):
         '''
         Get an attribute from a yum package id
-        it will return a python repr string of the attribute
+        it will return the value of the attribute or None if the package is not found
         :param id: yum package id
         :param attr: name of attribute (summary, size, description, changelog etc..)
         '''
         po = self._get_po(id)
         if po:
-            if attr in FAKE_ATTR: # is this a fake attr:
-                value = json.dumps(self._get_fake_attributes(po, attr))
-            elif hasattr(po, attr):
-                value = json.dumps(getattr(po,attr))
-            else:
-                value = json.dumps(None)
+            value = self._get_po_attribute(po, attr)
         else:
-            value = json.dumps(None)
+            value = None
         return value
 
+    def _get_attribute_slice(self, id, attr, offset, limit):
+        '''
+        Get a part of a list attribute (changelog, filelist etc..) from a yum package id
+        it will return a (total, [item,...]) pair or None if the package is not found
+        :param id: yum package id
+        :param attr: name of attribute (changelog, filelist etc..)
+        :param offset: index of the first item to return
+        :param limit: max number of items to return (-1 = no limit)
+        '''
+        po = self._get_po(id)
+        if not po:
+            return None
+        offset = max(offset, 0)
+        if attr == 'changelog':
+            result = self._get_changelog_slice(po, offset, limit)
+            if result is not None:
+                return result
+        elif attr in FILE_TYPES:
+            result = self._get_filelist_slice(po, attr, offset, limit)
+            if result is not None:
+                return result
+        values = self._get_po_attribute(po, attr)
+        if values is None:
+            values = []
+        elif not isinstance(values, (list, tuple)):
+            values = [values]
+        if limit < 0:
+            return (len(values), list(values[offset:]))
+        else:
+            return (len(values), list(values[offset:offset+limit]))
+
+    def _get_changelog_slice(self, po, offset, limit):
+        '''
+        Get a part of the changelog for a package from a repo, it is read directly
+        from the other metadata, so only the entries asked for is loaded
+        return a (total, [(date, author, text),...]) pair or None if the changelog can't be read this way
+        '''
+        sack = getattr(po, 'sack', None)
+        pkgKey = getattr(po, 'pkgKey', None)
+        if pkgKey is None or not hasattr(sack, 'otherdb') or getattr(po, '_changelog', None):
+            return None
+        try:
+            if not po.repo in sack.otherdb:
+                sack.populate(po.repo, mdtype='otherdata')
+            cur = sack.otherdb[po.repo].cursor()
+            # the pkgKey is local to each metadata db, so find the package by pkgId like yum does
+            cur.execute('SELECT count(*) FROM changelog JOIN packages USING(pkgKey) '
+                        'WHERE pkgId = ?', (po.pkgId,))
+            total = cur.fetchone()[0]
+            cur.execute('SELECT date, author, changelog FROM changelog JOIN packages USING(pkgKey) '
+                        'WHERE pkgId = ? ORDER BY date DESC LIMIT ? OFFSET ?', (po.pkgId, limit, offset))
+            entries = [(int(date), to_unicode(author), to_unicode(text)) for (date, author, text) in cur]
+            return (total, entries)
+        except Exception, e: # no other metadata or not a sqlite sack
+            self.logger.debug('changelog not read from metadata : %s' % str(e))
+            return None
+
+    def _get_filelist_slice(self, po, attr, offset, limit):
+        '''
+        Get a part of the file list (filelist, dirlist or ghostlist) for a package from a repo,
+        the files are read directly from the filelists metadata, and the reading stops
+        when the entries asked for is found, the total is counted by sqlite.
+        return a (total, [filename,...]) pair or None if the file list can't be read this way
+        '''
+        sack = getattr(po, 'sack', None)
+        pkgKey = getattr(po, 'pkgKey', None)
+        if pkgKey is None or not hasattr(sack, 'filelistsdb') or getattr(po, '_loadedfiles', False):
+            return None
+        ftype = FILE_TYPES[attr]
+        try:
+            if not po.repo in sack.filelistsdb:
+                sack.populate(po.repo, mdtype='filelists')
+            cur = sack.filelistsdb[po.repo].cursor()
+            cur.execute("SELECT sum(length(filetypes) - length(replace(filetypes, ?, ''))) "
+                        "FROM filelist JOIN packages USING(pkgKey) WHERE pkgId = ?", (ftype, po.pkgId))
+            total = cur.fetchone()[0] or 0
+            cur.execute('SELECT dirname, filetypes, filenames FROM filelist JOIN packages USING(pkgKey) '
+                        'WHERE pkgId = ?', (po.pkgId,))
+            if limit < 0:
+                stop = None
+            else:
+                stop = offset + limit
+            files = list(islice(self._iter_filelist(cur, ftype), offset, stop))
+            return (total, files)
+        except Exception, e: # no filelists metadata or not a sqlite sack
+            self.logger.debug('file list not read from metadata : %s' % str(e))
+            return None
+
+    def _iter_filelist(self, rows, ftype):
+        '''
+        Generate the files of a given type from filelist metadata rows,
+        in the same order as the yum package object file lists
+        :param rows: (dirname, filetypes, filenames) rows
+        :param ftype: file type ('f','d' or 'g')
+        '''
+        for (dirname, filetypes, filenames) in rows:
+            if dirname == '.':
+                dirname = ''
+            elif dirname != '/':
+                dirname += '/'
+            filenames = filenames.replace('//', '/').split('/')
+            # yum pops the entries from the end of each row
+            for filetype, filename in reversed(zip(filetypes, filenames)):
+                if filetype == ftype:
+                    yield to_unicode(dirname + filename)
+
+    def _get_attributes(self, ids, attrs):
+        '''
+        Get a list of attributes from a list of yum package ids
+        it will return a {pkg_id : {attr : value}} dict,
+        the value for a pkg_id not found is None
+        :param ids: list of yum package ids
+        :param attrs: list of attribute names (summary, size, action etc..)
+        '''
+        result = {}
+        for id in ids:
+            po = self._get_po(id) # resolve the po once for all the attributes
+            if po:
+                result[id] = dict([(attr, self._get_po_attribute(po, attr)) for attr in attrs])
+            else:
+                result[id] = None
+        return result
+
     def _get_updateInfo(self, id):
         '''
         Get an Update Infomation e from a yum package id
-        it will return a python repr string of the attribute
+        it will return a list of notices or None if the package is not found
         :param id: yum package id
         '''
         po = self._get_po(id)
         if po:
-            md = self.update_metadata
-            notices = md.get_notices(po.name)
-            result = []
-            for notice in notices:
-                result.append(notice._md)
-            value = json.dumps(result)
+            value = self._get_advisory_index().get(po.name, [])
         else:
-            value = json.dumps(None)
+            value = None
         return value
 
+    def _get_updateInfos(self, ids):
+        '''
+        Get the Update Infomation for a list of yum package ids
+        it will return a {pkg_id : [notice,...]} dict
+        :param ids: list of yum package ids
+        '''
+        index = self._get_advisory_index()
+        result = {}
+        for id in ids:
+            po = self._get_po(id)
+            if po:
+                result[id] = index.get(po.name, [])
+            else:
+                result[id] = None
+        return result
+
+    def _get_advisory_index(self):
+        '''
+        Get the package name -> [notice metadata,...] index, it is build
+        from the update metadata the first time it is used
+        '''
+        if self._advisory_index is None:
+            index = {}
+            for notice in self.update_metadata.notices:
+                names = set()
+                for upd in notice['pkglist']:
+                    for pkg in upd['packages']:
+                        names.add(pkg['name'])
+                for name in names:
+                    index.setdefault(name, []).append(notice._md)
+            self._advisory_index = index
+        return self._advisory_index
+
 
 
     def _get_group_pkgs(self, grp_id, grp_flt):
         '''
         Get packages for a given grp_id and group filter
         '''
-        pkgs = []
+        return self._get_groups_pkgs([grp_id], grp_flt)[grp_id]
+
+    def _get_groups_pkgs(self, grp_ids, grp_flt):
+        '''
+        Get packages for a list of grp_ids and a group filter
+        the package names of all the groups is resolved in one sack query
+        return a grp_id -> [pkg_id,...] dict
+        '''
+        result = {}
+        group_names = {}
         try:
-            grp = self.yumbase.comps.return_group(grp_id)
-            if grp:
-                if grp_flt == 'all':
-                    best_pkgs = self._group_names2aipkgs(grp.packages)
-                else:
-                    best_pkgs = self._group_names2aipkgs(grp.mandatory_packages.keys() + grp.default_packages.keys())
-                for key in best_pkgs:
-                    # Sort the matching packages and take the last one (the best match for current arch)
-                    (apkg, ipkg) = sorted(best_pkgs[key], key=lambda x: x[1] or x[0])[-1]
-                    if ipkg:
-                        pkgs.append(ipkg)
-                    else:
-                        pkgs.append(apkg)
-            else:
-                pass
+            cache = self._get_groups_cache()
         except Errors.GroupsError, e:
-            print str(e)
-        pkg_ids = self._to_package_id_list(pkgs)
-        return pkg_ids
+            self.logger.error('could not load the groups : %s' % str(e))
+            cache = None
+        if cache:
+            # the package names is taken from the cache too, so the comps is not compiled for a cache miss
+            for grp_id in grp_ids:
+                if (grp_id, grp_flt) in cache.group_pkgs:
+                    result[grp_id] = cache.group_pkgs[(grp_id, grp_flt)]
+                elif grp_id in cache.groups:
+                    name, desc, mandatory, default, optional, conditional = cache.groups[grp_id]
+                    if grp_flt == 'all':
+                        group_names[grp_id] = mandatory + optional + default + conditional # same order as grp.packages
+                    else:
+                        group_names[grp_id] = mandatory + default
+        all_names = set()
+        for names in group_names.itervalues():
+            all_names.update(names)
+        best_pkgs = {}
+        if all_names:
+            best_pkgs = self._group_names2aipkgs(list(all_names))
+        for grp_id, names in group_names.iteritems():
+            pkgs = []
+            for key in names:
+                if not key in best_pkgs:
+                    continue
+                # Sort the matching packages and take the last one (the best match for current arch)
+                (apkg, ipkg) = sorted(best_pkgs[key], key=lambda x: x[1] or x[0])[-1]
+                if ipkg:
+                    pkgs.append(ipkg)
+                else:
+                    pkgs.append(apkg)
+            pkg_ids = list(self._to_package_id_list(pkgs))
+            if grp_flt in ('all', 'default'):
+                cache.group_pkgs[(grp_id, grp_flt)] = pkg_ids
+            result[grp_id] = pkg_ids
+        for grp_id in grp_ids: # groups not found
+            result.setdefault(grp_id, [])
+        return result
 
 #===============================================================================
 # Helper methods
@@ -327,6 +2019,143 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
                 self.yumbase.repos.enableRepo(repo.id)
             else:
                 self.yumbase.repos.disableRepo(repo.id)
+        self._reset_caches() # the enabled sacks has changed
+
+    def _reset_caches(self):
+        '''
+        Clear the package caches, they contain po's from the current YumBase
+        and must be cleared when the YumBase or the enabled repos are changed
+        '''
+        self._po_index = {}
+        self._installed_index = None
+        self._installed_rpmdb = None
+        self._close_all_cursors()
+        self._cursor_lists = {}
+        self._search_index = {}
+        self._search_index_rpmdb = None
+        self._search_tags = None
+        self._pkgtags_map = None
+        self._provides_cache = {}
+        self._dep_graph = None
+        self._updates_list = None
+        self._obsoletes_list = None
+        self._obsoleted = None
+        self._update_tups = None
+        self._obsolete_tups = None
+        self._narrows = None
+        self._recent = None
+        self._updateMetadata = None
+        self._advisory_index = None
+        self._ladders = None
+        self._rpmdb_generation = None
+        self._cache_generation += 1
+
+    def _get_rpmdb_generation(self):
+        '''
+        Get a value there is changed every time the rpmdb is changed
+        (the mtime of the rpmdb Packages file, or the newest mtime in the rpmdb directory
+        if there is no Packages file, else the rpmdb version)
+        it is only found once for each worker job and YumBase
+        '''
+        if self._rpmdb_generation is None:
+            self._rpmdb_generation = self._find_rpmdb_generation()
+        return self._rpmdb_generation
+
+    def _find_rpmdb_generation(self):
+        '''
+        Find the current rpmdb generation (see _get_rpmdb_generation)
+        '''
+        dbpath = os.path.join(self.yumbase.conf.installroot, rpm.expandMacro('%{_dbpath}').lstrip('/'))
+        try:
+            return os.stat(os.path.join(dbpath, 'Packages')).st_mtime
+        except OSError: # sqlite rpmdb or another backend
+            pass
+        try:
+            mtimes = [os.stat(dbpath).st_mtime]
+            for name in os.listdir(dbpath):
+                mtimes.append(os.stat(os.path.join(dbpath, name)).st_mtime)
+            return max(mtimes)
+        except OSError:
+            return str(self.yumbase.rpmdb.simpleVersion(main_only=True)[0])
+
+    def _get_package_list(self, pkg_filter):
+        '''
+        Get a list of yum package objects, based on a package filter
+        :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+        '''
+        if pkg_filter == 'recent':
+            return self._get_recent()
+        elif pkg_filter == 'updates':
+            return self._get_updates()
+        elif pkg_filter == 'obsoletes':
+            return self._get_obsoletes()
+        elif pkg_filter in NARROW_FILTERS:
+            return self._get_narrows().get(pkg_filter)
+        else:
+            return []
+
+    def _get_narrows(self):
+        '''
+        Get the PackageNarrows, it is build once for each metadata & rpmdb generation
+        by classifying all the installed & available packages in one pass
+        (the updates & obsoletes is not classified here, they come from the update lists)
+        '''
+        generation = (self._cache_generation, self._get_rpmdb_generation())
+        if self._narrows is None or self._narrows_generation != generation:
+            narrows = PackageNarrows()
+            installed, names = self._get_installed_index()
+            showdups = self.yumbase.conf.showdupesfromrepos
+            # the newest available version of each name.arch (all versions with showdupesfromrepos)
+            try:
+                sack = self.yumbase.pkgSack
+                if showdups:
+                    avail = sack.returnPackages()
+                else:
+                    avail = sack.returnNewestByNameArch()
+                avail_tups = set(sack.simplePkgList())
+            except (Errors.RepoError, PackageSackError), e: # repos failing to load
+                self.logger.debug('no available packages : %s' % str(e))
+                avail = []
+                avail_tups = None
+            newest_inst = {} # name.arch -> newest installed po
+            for po in installed.itervalues():
+                narrows.add('installed', po)
+                key = (po.name, po.arch)
+                if not key in newest_inst or po.verGT(newest_inst[key]):
+                    newest_inst[key] = po
+            # same rules as yum doPackageLists('available')
+            for po in avail:
+                key = (po.name, po.arch)
+                if po.pkgtup in installed: # reinstall available
+                    continue
+                elif (showdups or self.yumbase.allowedMultipleInstalls(po) or # installonly (ex. kernel)
+                      not key in newest_inst or po.verGT(newest_inst[key])):
+                    narrows.add('available', po)
+            # installed packages not in any repo (unknown, if the repos failed to load)
+            if avail_tups is not None:
+                for po in installed.itervalues():
+                    if not po.pkgtup in avail_tups:
+                        narrows.add('extras', po)
+            self._narrows = narrows
+            self._narrows_generation = generation
+        return self._narrows
+
+    def _get_recent(self):
+        '''
+        Get the packages added to the repos in the last conf.recent days
+        it is only calculated when asked for, because the filetime is loaded
+        for each package in the sack
+        '''
+        generation = (self._cache_generation, self._get_rpmdb_generation())
+        if self._recent is None or self._recent_generation != generation:
+            recentlimit = time.time() - (self.yumbase.conf.recent * 86400)
+            try:
+                avail = self.yumbase.pkgSack.returnNewestByNameArch()
+            except PackageSackError:
+                avail = []
+            self._recent = [po for po in avail if int(po.filetime) > recentlimit]
+            self._recent_generation = generation
+        return self._recent
 
     def _get_po_list(self, pkg, fields):
 
@@ -362,6 +2191,19 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         return result
 
 
+    def _get_po_attribute(self, po, attr):
+        '''
+        Get the value of an attribute (real or fake) from a yum package object
+        :param po: yum package object
+        :param attr: name of attribute
+        '''
+        if attr in FAKE_ATTR: # is this a fake attr:
+            return self._get_fake_attributes(po, attr)
+        elif hasattr(po, attr):
+            return getattr(po, attr)
+        else:
+            return None
+
     def _get_fake_attributes(self,po, attr):
         '''
         Get Fake Attributes, a whey to useful stuff for a package there is not real
@@ -375,16 +2217,30 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
             return self._get_downgrades(po)
         elif attr == 'pkgtags':
             return self._get_pkgtags(po)
+        elif attr == 'obsoleted':
+            return self._get_obsoleted(po)
+        elif attr == 'newer':
+            return [self._get_id(lpo) for lpo in self._get_ladder_versions(po, newer=True)]
+        elif attr == 'older':
+            return [self._get_id(lpo) for lpo in self._get_ladder_versions(po, newer=False)]
+
+    def _get_obsoleted(self, po):
+        '''
+        Get the ids of the installed packages obsoleted by a given po
+        '''
+        self._check_update_lists()
+        return [self._get_id(ipo) for ipo in self._obsoleted.get(po.pkgtup, [])]
 
     def _get_downgrades(self,pkg):
         pkg_ids = []
         if self._is_installed(pkg): # is installed , we must find available downgrade
-            apkgs = self.yumbase.pkgSack.returnPackages(patterns=[pkg.name], ignore_case=False)
-            for po in apkgs:
-                if self._is_valid_downgrade(pkg, po):
-                    pkg_ids.append(self._get_id(po))
+            if not self.yumbase.allowedMultipleInstalls(pkg): # multiple installable (ex. kernels ) has no downgrades
+                for po in self._get_ladder_versions(pkg, newer=False):
+                    if po.repoid != 'installed':
+                        pkg_ids.append(self._get_id(po))
         else: # Not installed, this is the package to downgrade to, find the installed one
-            ipkgs = self.yumbase.rpmdb.searchNevra(name=pkg.name, arch = pkg.arch)
+            installed, names = self._get_installed_index()
+            ipkgs = [po for po in names.get(pkg.name, []) if po.arch == pkg.arch]
             if ipkgs:
                 pkg_ids.append(self._get_id(ipkgs[0]))
         return pkg_ids
@@ -393,12 +2249,20 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         '''
         Get pkgtags from a given po
         '''
-        pkgtags = self.yumbase.pkgtags
-        po_dict = pkgtags.search_names(po.name)
-        if po.name in po_dict:
-            return po_dict[po.name]
-        else:
-            return []
+        return self._get_pkgtags_map().get(po.name, [])
+
+    def _get_pkgtags_map(self):
+        '''
+        Get the pkg name -> [tag,...] map, the whole pkgtags db is loaded
+        with one query the first time it is used
+        '''
+        if self._pkgtags_map is None:
+            try:
+                self._pkgtags_map = dict(self.yumbase.pkgtags.search_tags('').iteritems())
+            except Errors.YumBaseError, e: # no pkgtags metadata
+                self.logger.debug('pkgtags not available : %s' % str(e))
+                self._pkgtags_map = {}
+        return self._pkgtags_map
 
 
 
@@ -407,12 +2271,8 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         Check if a package is installed
         :param po: package to check for
         '''
-        (n, a, e, v, r) = po.pkgtup
-        po = self.yumbase.rpmdb.searchNevra(name=n, arch=a, ver=v, rel=r, epoch=e)
-        if po:
-            return True
-        else:
-            return False
+        installed, names = self._get_installed_index()
+        return po.pkgtup in installed
 
     def _is_valid_downgrade(self, po, down_po):
         '''
@@ -423,12 +2283,65 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         valid = True
         if not po.verGT(down_po):   # po must be > down_po
             valid = False
-        elif canCoinstall(po.arch, down_po.arch): # po must not be coinstallable with down_po
+        elif self._can_coinstall(po.arch, down_po.arch): # po must not be coinstallable with down_po
             valid = False
         elif self.yumbase.allowedMultipleInstalls(po): # po must not be a multiple installable (ex. kernels )
             valid = False
         return valid
 
+    def _can_coinstall(self, arch1, arch2):
+        '''
+        Cached version of canCoinstall, there is only a few arch combinations
+        '''
+        key = (arch1, arch2)
+        if not key in self._coinstall:
+            self._coinstall[key] = canCoinstall(arch1, arch2)
+        return self._coinstall[key]
+
+    def _get_ladders(self):
+        '''
+        Get the version ladders, a pkg name -> [po,...] dict with the installed and
+        available packages sorted by EVR, it is build once for each metadata & rpmdb generation
+        '''
+        generation = (self._cache_generation, self._get_rpmdb_generation())
+        if self._ladders is None or self._ladders_generation != generation:
+            ladders = {}
+            installed, names = self._get_installed_index()
+            for po in installed.itervalues():
+                ladders.setdefault(po.name, []).append(po)
+            for po in self.yumbase.pkgSack.returnPackages():
+                ladders.setdefault(po.name, []).append(po)
+            for ladder in ladders.itervalues():
+                ladder.sort(cmp=lambda po1, po2: po1.verCMP(po2))
+            self._ladders = ladders
+            self._ladders_generation = generation
+        return self._ladders
+
+    def _get_ladder_versions(self, po, newer):
+        '''
+        Get the installed & available versions of a package there is newer or older
+        than a given po, packages there can be coinstalled with po is skipped
+        :param po: package to compare with
+        :param newer: return the newer versions if True else the older ones
+        '''
+        ladder = self._get_ladders().get(po.name, [])
+        # find the first entry with a EVR >= po
+        low, high = 0, len(ladder)
+        while low < high:
+            mid = (low + high) // 2
+            if ladder[mid].verCMP(po) < 0:
+                low = mid + 1
+            else:
+                high = mid
+        if newer:
+            while low < len(ladder) and ladder[low].verCMP(po) == 0: # skip the same EVR
+                low += 1
+            versions = ladder[low:]
+        else:
+            versions = ladder[:low]
+            versions.reverse() # nearest version first
+        return [lpo for lpo in versions if not self._can_coinstall(po.arch, lpo.arch)]
+
     def _limit_package_list(self, pkgs, skip_old=False):
         '''
         Limit a list of packages so we dont get the one twice
@@ -439,18 +2352,18 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         :param skip_old: skip older packages (default = False)
         :type skip_old: boolean
         '''
+        installed, names = self._get_installed_index()
         good_pkgs = set()
         good_tups = {}
         for po in pkgs:
             valid = True
             if po.pkgtup in good_tups: # dont process the same po twice
                 continue
-            elif self.yumbase.rpmdb.contains(po=po): # if the po is installed, then return the installed po
-                (n, a, e, v, r) = po.pkgtup
-                po = self.yumbase.rpmdb.searchNevra(name=n, arch=a, ver=v, rel=r, epoch=e)[0]
+            elif po.pkgtup in installed: # if the po is installed, then return the installed po
+                po = installed[po.pkgtup]
                 self.logger.info("%s is installed " % str(po))
             elif skip_old:
-                ipkgs = self.yumbase.rpmdb.searchNevra(name=po.name)
+                ipkgs = names.get(po.name)
                 if ipkgs:
                     ipkg = ipkgs[0]
                     if ipkg.verGT(po) and not self.yumbase.allowedMultipleInstalls(po): # inst > po
@@ -473,11 +2386,11 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         if and po is installed, the installed po id will be returned
         :param pkgs:
         '''
+        installed, names = self._get_installed_index()
         result = set()
         for po in sorted(pkgs):
-            if self.yumbase.rpmdb.contains(po=po): # if the po is installed, then return the installed po
-                (n, a, e, v, r) = po.pkgtup
-                po = self.yumbase.rpmdb.searchNevra(name=n, arch=a, ver=v, rel=r, epoch=e)[0]
+            # if the po is installed, then return the installed po
+            po = installed.get(po.pkgtup, po)
             result.add(self._get_id(po))
         return result
 
@@ -485,17 +2398,52 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         ''' find the real package from an package id'''
         n, e, v, r, a, repo_id = id.split(',')
         if repo_id == 'installed' or repo_id.startswith('@'):
-            pkgs = self.yumbase.rpmdb.searchNevra(n, e, v, r, a)
-        else:
-            repo = self.yumbase.repos.getRepo(repo_id) # Used the repo sack, it will be faster
-            if repo:
-                pkgs = repo.sack.searchNevra(n, e, v, r, a)
-            else: # fallback to the use the pkgSack, just in case
-                pkgs = self.pkgSack.searchNevra(n, e, v, r, a)
-        if pkgs:
-            return pkgs[0]
+            installed, names = self._get_installed_index()
+            return installed.get((n, a, e, v, r), None)
         else:
-            return None
+            index = self._get_po_index(repo_id)
+            if index is None: # unknown or disabled repo
+                return None
+            return index.get((n, e, v, r, a), None)
+
+    def _get_po_index(self, repo_id):
+        '''
+        Get the (n,e,v,r,a) -> po index for a given repo sack, the index is build
+        the first time the sack is used.
+        return None if the repo is not found or not enabled (nothing is cached for it)
+        :param repo_id: repo id
+        '''
+        if not repo_id in self._po_index:
+            try:
+                repo = self.yumbase.repos.getRepo(repo_id)
+            except Errors.RepoError:
+                return None
+            if not repo.isEnabled():
+                return None
+            self.yumbase.pkgSack # make sure the repo sacks is populated
+            sack = repo.sack
+            index = {}
+            for po in sack.returnPackages():
+                index[(po.name, po.epoch, po.ver, po.rel, po.arch)] = po
+            self._po_index[repo_id] = index
+        return self._po_index[repo_id]
+
+    def _get_installed_index(self):
+        '''
+        Get the installed packages as a (pkgtup -> po, name -> [po,...]) pair of dicts
+        the dicts are build once for each rpmdb generation, so the helpers can
+        lookup installed packages without doing rpmdb queries
+        '''
+        rpmdb_gen = self._get_rpmdb_generation()
+        if self._installed_index is None or rpmdb_gen != self._installed_rpmdb:
+            installed = {}
+            names = {}
+            for po in self.yumbase.rpmdb.returnPackages():
+                installed[po.pkgtup] = po
+                names.setdefault(po.name, []).append(po)
+            self._installed_index = (installed, names)
+            self._installed_rpmdb = rpmdb_gen
+        return self._installed_index
 
     def _get_id(self,pkg):
         '''
@@ -507,17 +2455,148 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
 
 
     def _get_updates(self):
-        if not self._updates_list:
-            ygh = self.yumbase.doPackageLists(pkgnarrow='updates')
-            self._updates_list = ygh.updates
+        self._check_update_lists()
         return self._updates_list
 
     def _get_obsoletes(self):
-        if not self._obsoletes_list:
-            ygh = self.yumbase.doPackageLists(pkgnarrow='obsoletes')
-            self._obsoletes_list = ygh.obsoletes
+        self._check_update_lists()
         return self._obsoletes_list
 
+    def _check_update_lists(self):
+        '''
+        Load the updates & obsoletes lists, if they are not loaded in the current
+        metadata & rpmdb generation
+        '''
+        generation = (self._cache_generation, self._get_rpmdb_generation())
+        if self._updates_list is None or self._update_lists_generation != generation:
+            self._load_update_lists()
+            self._update_lists_generation = generation
+
+    def _load_update_lists(self):
+        '''
+        Get the updates & obsoletes lists, they are read from the disk cache if it is made from the
+        same rpmdb & metadata, else they are calculated by doPackageLists and written to the disk cache
+        '''
+        key = self._get_update_cache_key()
+        path = os.path.join(self.yumbase.conf.cachedir, 'yumdaemon-updates.json')
+        lists = self._read_update_cache(path, key)
+        if lists is None:
+            updates = self.yumbase.doPackageLists(pkgnarrow='updates').updates
+            self._worker.check_cancelled()
+            ygh = self.yumbase.doPackageLists(pkgnarrow='obsoletes')
+            obsoleted = {}
+            for (po, instpo) in ygh.obsoletesTuples:
+                obsoleted.setdefault(po.pkgtup, []).append(instpo)
+            self._write_update_cache(path, key, updates, ygh.obsoletes, obsoleted)
+            lists = (updates, ygh.obsoletes, obsoleted)
+        self._updates_list, self._obsoletes_list, self._obsoleted = lists
+        self._update_tups = set([po.pkgtup for po in self._updates_list])
+        self._obsolete_tups = set([po.pkgtup for po in self._obsoletes_list])
+
+    def _get_update_cache_key(self):
+        '''
+        Get the key there identify the state the updates & obsoletes is calculated from
+        (the rpmdb version, the repomd checksums of the enabled repos and the config used)
+        '''
+        rpmdb_version = str(self.yumbase.rpmdb.simpleVersion(main_only=True)[0])
+        repos = self._get_repo_checksums()
+        if repos is None:
+            return None
+        conf = self.yumbase.conf
+        return [UPDATE_CACHE_VERSION, rpmdb_version, repos, bool(conf.obsoletes), sorted(conf.exclude)]
+
+    def _get_repo_checksums(self):
+        '''
+        Get a [[repo id, repomd checksum],...] list for the enabled repos
+        or None if the metadata is not known
+        '''
+        repos = []
+        for repo in sorted(self.yumbase.repos.listEnabled(), key=lambda r: r.id):
+            try:
+                checksum = repo.repoXML.checksums.get('sha256') or str(repo.repoXML.timestamp)
+            except Exception: # we dont know the metadata, dont use the cache
+                return None
+            repos.append([repo.id, checksum])
+        return repos
+
+    def _read_update_cache(self, path, key):
+        '''
+        Read the updates & obsoletes from the disk cache, the packages is checked to
+        exist in the current sacks.
+        :return: (updates, obsoletes, obsoleted) or None if the cache can't be used
+        '''
+        if key is None:
+            return None
+        try:
+            f = open(path, 'r')
+            try:
+                data = json.load(f)
+            finally:
+                f.close()
+        except (IOError, OSError, ValueError):
+            return None
+        if data.get('key') != json.loads(json.dumps(key)): # compare as loaded from json
+            return None
+        self.yumbase.pkgSack # make sure the repo sacks is populated
+        installed, names = self._get_installed_index()
+        lists = []
+        for name in ('updates', 'obsoletes'):
+            pkgs = []
+            for (repo_id, n, e, v, r, a) in data.get(name, []):
+                po = self._find_available_po(repo_id, n, e, v, r, a)
+                if po is None: # the cache dont match the metadata
+                    self.logger.debug('update cache is invalid : %s not found' % n)
+                    return None
+                pkgs.append(po)
+            lists.append(pkgs)
+        obsoleted = {}
+        for (pkgtup, obs_tups) in data.get('obsoleted', []):
+            inst_pkgs = []
+            for inst_tup in obs_tups:
+                inst_tup = tuple(inst_tup)
+                if not inst_tup in installed: # the cache dont match the rpmdb
+                    return None
+                inst_pkgs.append(installed[inst_tup])
+            obsoleted[tuple(pkgtup)] = inst_pkgs
+        self.logger.debug('updates & obsoletes read from cache : %s' % path)
+        return (lists[0], lists[1], obsoleted)
+
+    def _write_update_cache(self, path, key, updates, obsoletes, obsoleted):
+        '''
+        Write the updates & obsoletes to the disk cache
+        '''
+        if key is None:
+            return
+        data = {'key': key}
+        for name, pkgs in (('updates', updates), ('obsoletes', obsoletes)):
+            data[name] = [(po.repoid, po.name, po.epoch, po.ver, po.rel, po.arch) for po in pkgs]
+        data['obsoleted'] = [(pkgtup, [ipo.pkgtup for ipo in inst_pkgs])
+                             for pkgtup, inst_pkgs in obsoleted.iteritems()]
+        try:
+            tmp = path + '.tmp'
+            f = open(tmp, 'w')
+            try:
+                json.dump(data, f)
+            finally:
+                f.close()
+            os.rename(tmp, path)
+        except (IOError, OSError), e:
+            self.logger.debug('could not write update cache %s : %s' % (path, str(e)))
+
+    def _find_available_po(self, repo_id, n, e, v, r, a):
+        '''
+        find an available package in a given repo, without building the po index for the repo
+        '''
+        if repo_id in self._po_index:
+            return self._po_index[repo_id].get((n, e, v, r, a))
+        try:
+            pkgs = self.yumbase.repos.getRepo(repo_id).sack.searchNevra(n, e, v, r, a)
+        except Errors.RepoError:
+            return None
+        if pkgs:
+            return pkgs[0]
+        return None
+
     def _get_action(self, po):
         '''
         Return the available action for a given pkg_id
@@ -530,21 +2609,19 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         :return: action (remove, install, update, downgrade, obsolete)
         :rtype: string
         '''
-        updates = self._get_updates()
-        obsoletes = self._get_obsoletes()
+        installed, names = self._get_installed_index()
         action = 'install'
-        if self.yumbase.rpmdb.contains(po=po): # if the best po is installed, then return the installed po
-            (n, a, e, v, r) = po.pkgtup
-            po = self.yumbase.rpmdb.searchNevra(name=n, arch=a, ver=v, rel=r, epoch=e)[0]
+        if po.pkgtup in installed: # if the best po is installed, then return the installed po
             action = 'remove'
         else:
-            if po in updates:
+            self._check_update_lists()
+            if po.pkgtup in self._update_tups:
                 action = 'update'
-            elif po in obsoletes:
+            elif po.pkgtup in self._obsolete_tups:
                 action = 'obsolete'
             else:
                 # Check if po is and older version of a installed package
-                ipkgs = self.yumbase.rpmdb.searchNevra(name=po.name)
+                ipkgs = names.get(po.name)
                 if ipkgs:
                     ipkg = ipkgs[0]
                     if ipkg.verGT(po) and not self.yumbase.allowedMultipleInstalls(po): # inst > po
@@ -556,6 +2633,7 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         '''
         Get a YumBase object to work with
         '''
+        self._reset_caches()
         self._yumbase = yum.YumBase()
         # make yum silent
         self._yumbase.preconf.errorlevel=0
@@ -563,10 +2641,12 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
         self._yumbase.setCacheDir()
         # setup the download callback handler
         self._yumbase.repos.setProgressBar( DownloadCallback(self) )
-        # Disable parallel down for this repo, we dont support it
+        # only the single file callback is setup here, so keep serial downloads
+        # (the system daemon setup parallel downloads in its own _get_yumbase)
         for repo in self._yumbase.repos.listEnabled():
             repo._async = False
         self.logger.debug(' --> YUM LOCKED: Lockfile = %s' % self._yumbase._lockfile)
+        self._start_search_index()
 
 
     def _reset_yumbase(self):
@@ -580,6 +2660,7 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
             self.logger.debug(' --> YUM UNLOCKED : Lockfile = %s' % self._yumbase._lockfile)
             del self._yumbase
             self._yumbase = None
+        self._reset_caches()
 
 
     def _setup_watchdog(self):
@@ -590,8 +2671,9 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
 
     def _watchdog(self):
         terminate = False
-        if self._watchdog_disabled or self._is_working: # is working
+        if self._watchdog_disabled or self._is_working or self._worker.pending: # is working
             return True
+        self._expire_cursors()
         if not self._lock: # is locked
             if self._watchdog_count > self._timeout_idle:
                 terminate = True
@@ -632,7 +2714,319 @@ class YumDaemonBase(dbus.service.Object, DownloadBaseCallback):
             pkg = apkg or ipkg
             ret.setdefault(pkg.name, []).append((apkg, ipkg))
         return ret
-        
+
+
+#------------------------------------------------------------------------------ v2 interface
+def make_v2_interface(interface, daemon_version):
+    '''
+    Make the v2 DBus interface base class shared by the system & session daemon,
+    the methods returning JSON strings in the v1 interface is returned as native DBus types
+    None values inside the returned variants is returned as a (b) struct (V2_NONE)
+    :param interface: name of the v2 DBus interface
+    :param daemon_version: the daemon version returned by GetVersion
+    '''
+
+    class YumDaemonV2Base(YumDaemonBase):
+
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='',
+                                              out_signature='i')
+        def GetVersion(self):
+            '''
+            Get the daemon version
+            '''
+            return daemon_version
+
+        @Worker
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='s',
+                                              out_signature='(bv)',
+                                              sender_keyword='sender')
+        def GetConfig(self, setting ,sender=None):
+            '''
+            Get the value of a yum config setting
+            it will return a (found, value) pair
+            :param setting: name of setting (debuglevel etc..)
+            :param sender:
+            '''
+            self.working_start(sender)
+            value = self._get_config(setting)
+            return self.working_ended((value is not None, to_dbus_variant(value)))
+
+        @Worker
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='s',
+                                              out_signature='(ba{sv})',
+                                              sender_keyword='sender')
+        def GetRepo(self, repo_id ,sender=None):
+            '''
+            Get information about a give repo_id
+            it will return a (found, repo settings) pair
+            :param repo_id:
+            :param sender:
+            '''
+            self.working_start(sender)
+            value = self._get_repo(repo_id)
+            return self.working_ended((value is not None, to_dbus_variant(value or {})))
+
+        @Worker
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='ss',
+                                              out_signature='(bv)',
+                                              sender_keyword='sender')
+        def GetAttribute(self, id, attr,sender=None):
+            '''
+            Get an attribute from a yum package id
+            it will return a (found, value) pair
+            :param id: yum package id
+            :param attr: name of attribute (summary, size, description, changelog etc..)
+            :param sender:
+            '''
+            self.working_start(sender)
+            value = self._get_attribute( id, attr)
+            return self.working_ended((value is not None, to_dbus_variant(value)))
+
+        @Worker
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='ssii',
+                                              out_signature='(biav)',
+                                              sender_keyword='sender')
+        def GetAttributeSlice(self, id, attr, offset, limit, sender=None):
+            '''
+            Get a part of a list attribute (changelog, filelist etc..) from a yum package id
+            it will return a (found, total, [item,...]) tuple
+            :param id: yum package id
+            :param attr: name of attribute (changelog, filelist etc..)
+            :param offset: index of the first item to return
+            :param limit: max number of items to return (-1 = no limit)
+            :param sender:
+            '''
+            self.working_start(sender)
+            value = self._get_attribute_slice(id, attr, offset, limit)
+            if value is None:
+                return self.working_ended((False, 0, dbus.Array([], signature='v')))
+            total, items = value
+            return self.working_ended((True, total, to_dbus_variant(items)))
+
+        @Worker
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='asas',
+                                              out_signature='a{sa{sv}}',
+                                              sender_keyword='sender')
+        def GetAttributes(self, ids, attrs, sender=None):
+            '''
+            Get a list of attributes from a list of yum package ids
+            it will return a {pkg_id : {attr : value}} dict, pkg_ids not found
+            and attributes with a None value is left out
+            :param ids: list of yum package ids
+            :param attrs: list of attribute names (summary, size, action etc..)
+            :param sender:
+            '''
+            self.working_start(sender)
+            result = dbus.Dictionary({}, signature='sa{sv}')
+            for id, values in self._get_attributes(ids, attrs).iteritems():
+                if values is not None:
+                    result[id] = dbus.Dictionary(dict([(attr, to_dbus_variant(value)) for attr, value in values.iteritems()
+                                                       if value is not None]), signature='sv')
+            return self.working_ended(result)
+
+        @Worker
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='s',
+                                              out_signature='(bav)',
+                                              sender_keyword='sender')
+        def GetUpdateInfo(self, id,sender=None):
+            '''
+            Get an Update Infomation e from a yum package id
+            it will return a (found, [notice,...]) pair
+            :param id: yum package id
+            :param sender:
+            '''
+            self.working_start(sender)
+            value = self._get_updateInfo(id)
+            return self.working_ended((value is not None, to_dbus_variant(value or [])))
+
+        @Worker
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='as',
+                                              out_signature='a{sav}',
+                                              sender_keyword='sender')
+        def GetUpdateInfos(self, ids,sender=None):
+            '''
+            Get the Update Infomation for a list of yum package ids
+            it will return a {pkg_id : [notice,...]} dict, pkg_ids not found is left out
+            :param ids: list of yum package ids
+            :param sender:
+            '''
+            self.working_start(sender)
+            result = dbus.Dictionary({}, signature='sav')
+            for id, notices in self._get_updateInfos(ids).iteritems():
+                if notices is not None:
+                    result[id] = to_dbus_variant(notices)
+            return self.working_ended(result)
+
+        @Worker
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='sas',
+                                              out_signature='aav',
+                                              sender_keyword='sender')
+        def GetPackageWithAttributes(self, pkg_filter, fields, sender=None):
+            '''
+            Get a list of [pkg_id, field,....] lists, based on a package pkg_filterer
+            :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+            :param fields: package attributes to get for each package
+            :param sender:
+            '''
+            self.working_start(sender)
+            value = self._get_package_with_attributes(pkg_filter, fields)
+            return self.working_ended(to_dbus_rows(value))
+
+        @Worker
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='',
+                                              out_signature='a((sss)a(sssb))',
+                                              sender_keyword='sender')
+        def GetGroups(self, sender=None ):
+            '''
+            Return a category/group tree
+            '''
+            self.working_start(sender)
+            value = self._get_groups()
+            return self.working_ended(value)
+
+        @Worker
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='ass',
+                                              out_signature='a{sas}',
+                                              sender_keyword='sender')
+        def GetGroupsPackages(self, grp_ids, grp_flt, sender=None ):
+            '''
+            Get packages for a list of groups by grp_ids and grp_flt
+            it will return a {grp_id : [pkg_id,...]} dict
+            :param grp_ids: The Group ids
+            :param grp_flt: Group Filter (all or default)
+            :param sender:
+            '''
+            self.working_start(sender)
+            value = dbus.Dictionary(self._get_groups_pkgs(grp_ids, grp_flt), signature='sas')
+            return self.working_ended(value)
+
+        @Worker
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='as',
+                                              out_signature='a{sas}',
+                                              sender_keyword='sender')
+        def GetRequires(self, ids, sender=None):
+            '''
+            Get the packages providing the requirements for a list of yum package ids
+            it will return a {pkg_id : [pkg_id,...]} dict, pkg_ids not found is left out
+            :param ids: list of yum package ids
+            :param sender:
+            '''
+            self.working_start(sender)
+            value = dict([(id, deps) for id, deps in self._get_requires(ids).iteritems() if deps is not None])
+            return self.working_ended(dbus.Dictionary(value, signature='sas'))
+
+        @Worker
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='as',
+                                              out_signature='a{sas}',
+                                              sender_keyword='sender')
+        def GetRequiredBy(self, ids, sender=None):
+            '''
+            Get the installed packages requiring the packages for a list of yum package ids
+            it will return a {pkg_id : [pkg_id,...]} dict, pkg_ids not found is left out
+            :param ids: list of yum package ids
+            :param sender:
+            '''
+            self.working_start(sender)
+            value = dict([(id, deps) for id, deps in self._get_required_by(ids).iteritems() if deps is not None])
+            return self.working_ended(dbus.Dictionary(value, signature='sas'))
+
+        @Worker
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='sas',
+                                              out_signature='(si)',
+                                              sender_keyword='sender')
+        def OpenPackageCursor(self, pkg_filter, fields, sender=None):
+            '''
+            Open a cursor for a package list, so it can be fetched a page at the time with FetchCursor
+            it will return a (handle, number of packages) pair
+            :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+            :param fields: package attributes to get for each package
+            :param sender:
+            '''
+            self.working_start(sender)
+            value = self._open_package_cursor(pkg_filter, fields, sender)
+            return self.working_ended(value)
+
+        @Worker
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='sii',
+                                              out_signature='(baav)',
+                                              sender_keyword='sender')
+        def FetchCursor(self, handle, offset, limit, sender=None):
+            '''
+            Get a page of packages from an open cursor
+            it will return a (found, [[pkg_id, field,....],...]) pair, found is False
+            if the cursor is not open or owned by another client
+            :param handle: cursor handle from OpenPackageCursor
+            :param offset: index of the first package to get (a negative offset is handled as 0)
+            :param limit: max number of packages to get (-1 = no limit)
+            :param sender:
+            '''
+            self.working_start(sender)
+            value = self._fetch_cursor(handle, offset, limit, sender)
+            return self.working_ended((value is not None, to_dbus_rows(value or [])))
+
+        @Worker
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='',
+                                              out_signature='a{sv}',
+                                              sender_keyword='sender')
+        def GetSearchCacheStats(self, sender=None ):
+            '''
+            Get the search result cache counters (for tuning)
+            it will return a dict with hits, misses, narrowed, size & max_size
+            :param sender:
+            '''
+            self.working_start(sender)
+            value = self._get_search_cache_stats()
+            return self.working_ended(to_dbus_variant(value))
+
+        @Logger
+        @dbus.service.method(interface,
+                                              in_signature='',
+                                              out_signature='a{sv}',
+                                              sender_keyword='sender')
+        def GetProgressStats(self, sender=None ):
+            '''
+            Get the progress signal counters, the signals suppressed by the rate limit (for tuning)
+            it is answered right away, also while a download is running
+            it will return a dict with max_rate, sent & suppressed
+            :param sender:
+            '''
+            self.check_permission(sender)
+            return to_dbus_variant(self._get_progress_stats())
+
+    return YumDaemonV2Base
+
 
 def doTextLoggerSetup(logroot='yumdaemon', logfmt='%(asctime)s: %(message)s', loglvl=logging.INFO):
     ''' Setup Python logging  '''
@@ -36,11 +36,12 @@ from yum.Errors import *
 
 import argparse
 
-from common import YumDaemonBase, doTextLoggerSetup, Logger, DownloadCallback, FAKE_ATTR, NONE
+from common import YumDaemonBase, doTextLoggerSetup, Logger, Worker, SharedLock, DownloadCallback, make_v2_interface, FAKE_ATTR, NONE
 
 version = 902 #  (00.09.02) must be integer
 DAEMON_ORG = 'org.baseurl.YumSession'
 DAEMON_INTERFACE = DAEMON_ORG
+DAEMON_INTERFACE_V2 = DAEMON_ORG + '.v2'
 FAKE_ATTR = ['downgrades','action','pkgtags']
 NONE = json.dumps(None)
 
@@ -54,20 +55,38 @@ class AccessDeniedError(dbus.DBusException):
 class YumLockedError(dbus.DBusException):
     _dbus_error_name = DAEMON_ORG+'.YumLockedError'
 
+class YumCancelledError(dbus.DBusException):
+    _dbus_error_name = DAEMON_ORG+'.YumCancelledError'
+
+class YumCursorExpiredError(dbus.DBusException):
+    _dbus_error_name = DAEMON_ORG+'.YumCursorExpiredError'
+
 class YumNotImplementedError(dbus.DBusException):
     _dbus_error_name = DAEMON_ORG+'.YumNotImplementedError'
 
 
 logger = logging.getLogger('yumdaemon.session')
 
+#------------------------------------------------------------------------------ v2 interface
+class YumDaemonV2(make_v2_interface(DAEMON_INTERFACE_V2, version)):
+    '''
+    The v2 DBus interface (DAEMON_INTERFACE_V2), the methods are shared with the system daemon (see common.make_v2_interface)
+    '''
+
 #------------------------------------------------------------------------------ Main class
-class YumDaemon(YumDaemonBase):
+class YumDaemon(YumDaemonV2):
 
     def __init__(self, mainloop):
         YumDaemonBase.__init__(self,  mainloop)
         self.logger = logging.getLogger('yumdaemon-session')
         bus_name = dbus.service.BusName(DAEMON_ORG, bus = dbus.SessionBus())
         dbus.service.Object.__init__(self, bus_name, '/')
+        self._worker.cancel_error = YumCancelledError
+        self.cursor_error = YumCursorExpiredError
+        # all methods are read-only, so the lock is shared by the clients
+        # only SetEnabledRepos need exclusive access
+        self._lock = SharedLock()
+        self._client_watches = {}   # sender -> NameOwnerChanged watch
 
 #===============================================================================
 # DBus Methods
@@ -83,6 +102,7 @@ class YumDaemon(YumDaemonBase):
         '''
         return version
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='',
@@ -95,7 +115,9 @@ class YumDaemon(YumDaemonBase):
         '''
         if self._can_quit:
             self._reset_yumbase()
-            self.mainloop.quit()
+            # this run in the worker thread, the reply is send from a mainloop idle callback,
+            # so quit the mainloop from a lower priority idle callback, after the reply is send
+            gobject.idle_add(self.mainloop.quit, priority=gobject.PRIORITY_LOW)
             return True
         else:
             return False
@@ -107,12 +129,13 @@ class YumDaemon(YumDaemonBase):
                                           sender_keyword='sender')
     def Lock(self, sender=None):
         '''
-        Get the yum lock
+        Get the yum lock, the lock is shared with the other clients using the daemon
         :param sender:
         '''
-        if not self._lock:
-            self._lock = sender
-            self.logger.info('LOCK: Locked by : %s' % sender)
+        if self._lock.acquire(sender):
+            self._client_watches[sender] = self.connection.watch_name_owner(sender,
+                                           lambda owner: self._on_client_owner_changed(sender, owner))
+            self.logger.info('LOCK: Locked by : %s (%i clients)' % (sender, len(self._lock)))
             return True
         return False
 
@@ -131,7 +154,51 @@ class YumDaemon(YumDaemonBase):
         self._watchdog_disabled = not state
         return state
 
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='',
+                                          out_signature='a(is)',
+                                          sender_keyword='sender')
+    def GetOperations(self, sender=None):
+        '''
+        Get the running and queued operations started by the sender
+        :return: list of (handle, method name) pairs
+        :param sender:
+        '''
+        return self._worker.get_operations(sender)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='sd',
+                                          out_signature='',
+                                          sender_keyword='sender')
+    def SetDeadline(self, method, seconds, sender=None):
+        '''
+        Set a deadline for the next call of a method from the sender
+        the operation is cancelled in the daemon, when the deadline is reached
+        :param method: name of the method there is called next
+        :param seconds: seconds from the call is received to it is cancelled
+        :param sender:
+        '''
+        self._worker.set_deadline(sender, method, seconds)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='i',
+                                          out_signature='b',
+                                          sender_keyword='sender')
+    def Cancel(self, handle, sender=None):
+        '''
+        Cancel an operation started by the sender
+        the operation return a YumCancelledError
+        :param handle: operation handle (from GetOperations)
+        :return: False if the operation is not found or can't be cancelled
+        :param sender:
+        '''
+        return self._worker.cancel(handle, sender)
+
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -152,19 +219,40 @@ class YumDaemon(YumDaemonBase):
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='as',
                                           out_signature='',
+                                          async_callbacks=('reply_handler', 'error_handler'),
                                           sender_keyword='sender')
-
-    def SetEnabledRepos(self, repo_ids, sender=None):
+    def SetEnabledRepos(self, repo_ids, reply_handler, error_handler, sender=None):
         '''
         Enabled a list of repositories, disabled all other repos
+        it need exclusive access, so it wait until the other clients has released the lock
         :param repo_ids: list of repo ids to enable
         :param sender:
         '''
+        self.check_lock(sender)
+        def on_exclusive(granted):
+            if granted:
+                self._worker.add(self._set_enabled_repos, (repo_ids, sender), {},
+                                 lambda value: reply_handler(), error_handler,
+                                 name='SetEnabledRepos', sender=sender)
+            elif sender in self._lock:
+                error_handler(YumLockedError('Timeout while waiting for the other clients to release the lock'))
+            else:
+                error_handler(YumLockedError('Lock released while waiting for exclusive access'))
+        if not self._lock.acquire_exclusive(sender, on_exclusive):
+            raise YumLockedError('Another client is waiting for exclusive access')
+
+    def _set_enabled_repos(self, repo_ids, sender):
+        '''
+        SetEnabledRepos worker job
+        '''
         self.working_start(sender)
+        self._close_all_cursors() # the cursors of all the clients has po's from the old YumBase
+        self._reset_yumbase() # close the rpmdb & sqlite handles of the old YumBase
         self._get_yumbase(repo_ids) # we need a new instance of YumBase, with the selected repos
         return self.working_ended()
 
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -178,9 +266,10 @@ class YumDaemon(YumDaemonBase):
         :param sender:
         '''
         self.working_start(sender)
-        value = self._get_config(setting)
+        value = json.dumps(self._get_config(setting))
         return self.working_ended(value)
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -194,9 +283,10 @@ class YumDaemon(YumDaemonBase):
         :param sender:
         '''
         self.working_start(sender)
-        value = self._get_repo(repo_id)
+        value = json.dumps(self._get_repo(repo_id))
         return self.working_ended(value)
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -212,6 +302,7 @@ class YumDaemon(YumDaemonBase):
         value = self._get_packages(pkg_filter)
         return self.working_ended(value)
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='sas',
@@ -227,6 +318,78 @@ class YumDaemon(YumDaemonBase):
         value = self._get_package_with_attributes(pkg_filter, fields)
         return self.working_ended(json.dumps(value))
 
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='sas',
+                                          out_signature='a{sv}',
+                                          sender_keyword='sender')
+    def GetPackageColumns(self, pkg_filter, fields, sender=None):
+        '''
+        Get the packages for a package filter with attributes, in a column format
+        with a native DBus array for each column and the repo & arch names as index
+        :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+        :param fields: package attributes to get for each package
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = self._get_package_columns(pkg_filter, fields)
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='sas',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def OpenPackageCursor(self, pkg_filter, fields, sender=None):
+        '''
+        Open a cursor for a package list, so it can be fetched a page at the time with FetchCursor
+        :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+        :param fields: package attributes to get for each package
+        :return: (handle, number of packages) pair (JSON)
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._open_package_cursor(pkg_filter, fields, sender))
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='sii',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def FetchCursor(self, handle, offset, limit, sender=None):
+        '''
+        Get a page of packages from an open cursor
+        :param handle: cursor handle from OpenPackageCursor
+        :param offset: index of the first package to get (a negative offset is handled as 0)
+        :param limit: max number of packages to get (-1 = no limit)
+        :return: list of [pkg_id, field,....] lists, None if the cursor is not open or owned by another client (JSON)
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._fetch_cursor(handle, offset, limit, sender))
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='s',
+                                          out_signature='b',
+                                          sender_keyword='sender')
+    def CloseCursor(self, handle, sender=None):
+        '''
+        Close an open cursor
+        :param handle: cursor handle from OpenPackageCursor
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = self._close_cursor(handle, sender)
+        return self.working_ended(value)
+
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='sb',
@@ -243,7 +406,76 @@ class YumDaemon(YumDaemonBase):
         pkg_ids = self._get_packages_by_name(name, newest_only)
         return self.working_ended(pkg_ids)
 
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='as',
+                                          out_signature='as',
+                                          sender_keyword='sender')
+    def WhatProvides(self, patterns, sender=None):
+        '''
+        Get a list of the installed & available packages providing some capabilities or files
+        :param patterns: list of capabilities/files (ex. /usr/bin/foo, libssl.so.10()(64bit))
+        :param sender:
+        '''
+        self.working_start(sender)
+        pkg_ids = self._what_provides(patterns)
+        return self.working_ended(pkg_ids)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='as',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetRequires(self, ids, sender=None):
+        '''
+        Get the packages providing the requirements for a list of yum package ids
+        it will return a JSON string with a {pkg_id : [pkg_id,...]} dict
+        :param ids: list of yum package ids
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_requires(ids))
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='as',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetRequiredBy(self, ids, sender=None):
+        '''
+        Get the installed packages requiring the packages for a list of yum package ids
+        it will return a JSON string with a {pkg_id : [pkg_id,...]} dict
+        :param ids: list of yum package ids
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_required_by(ids))
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='asb',
+                                          out_signature='as',
+                                          sender_keyword='sender')
+    def GetDependencyClosure(self, ids, reverse, sender=None):
+        '''
+        Get all the packages needed by a list of yum package ids (all levels)
+        or if reverse is True, the installed packages there need them (what a remove will remove too)
+        :param ids: list of yum package ids
+        :param reverse: get the installed packages there need them
+        :param sender:
+        '''
+        self.working_start(sender)
+        pkg_ids = self._get_dependency_closure(ids, reverse)
+        return self.working_ended(pkg_ids)
+
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='ss',
@@ -258,9 +490,48 @@ class YumDaemon(YumDaemonBase):
         :param sender:
         '''
         self.working_start(sender)
-        value = self._get_attribute( id, attr)
+        value = json.dumps(self._get_attribute( id, attr))
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='ssii',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetAttributeSlice(self, id, attr, offset, limit, sender=None):
+        '''
+        Get a part of a list attribute (changelog, filelist etc..) from a yum package id
+        it will return a JSON string with a (total, [item,...]) pair or None if the package is not found
+        :param id: yum package id
+        :param attr: name of attribute (changelog, filelist etc..)
+        :param offset: index of the first item to return
+        :param limit: max number of items to return (-1 = no limit)
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_attribute_slice(id, attr, offset, limit))
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='asas',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetAttributes(self, ids, attrs, sender=None):
+        '''
+        Get a list of attributes from a list of yum package ids
+        it will return a JSON string with a {pkg_id : {attr : value}} dict
+        :param ids: list of yum package ids
+        :param attrs: list of attribute names (summary, size, action etc..)
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_attributes(ids, attrs))
         return self.working_ended(value)
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -274,7 +545,24 @@ class YumDaemon(YumDaemonBase):
         :param sender:
         '''
         self.working_start(sender)
-        value = self._get_updateInfo(id)
+        value = json.dumps(self._get_updateInfo(id))
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='as',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetUpdateInfos(self, ids,sender=None):
+        '''
+        Get the Update Infomation for a list of yum package ids
+        it will return a JSON string with a {pkg_id : [notice,...]} dict
+        :param ids: list of yum package ids
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_updateInfos(ids))
         return self.working_ended(value)
 
     @Logger
@@ -285,11 +573,10 @@ class YumDaemon(YumDaemonBase):
     def Unlock(self, sender=None):
         ''' release the lock'''
         if self.check_lock(sender):
-            self._reset_yumbase()
-            self.logger.info('UNLOCK: Lock Release by %s' % self._lock)
-            self._lock = None
+            self._release_lock(sender)
             return True
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='asasbbb',
@@ -308,6 +595,37 @@ class YumDaemon(YumDaemonBase):
         result = self._search(fields, keys, match_all, newest_only, tags)
         return self.working_ended(result)
 
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetSearchCacheStats(self, sender=None ):
+        '''
+        Get the search result cache counters (for tuning)
+        :return: dict with hits, misses, narrowed, size & max_size (JSON)
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_search_cache_stats())
+        return self.working_ended(value)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetProgressStats(self, sender=None ):
+        '''
+        Get the progress signal counters, the signals suppressed by the rate limit (for tuning)
+        it is answered right away, also while a download is running
+        :return: dict with max_rate, sent & suppressed (JSON)
+        :param sender:
+        '''
+        return json.dumps(self._get_progress_stats())
+
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='',
@@ -318,9 +636,10 @@ class YumDaemon(YumDaemonBase):
         Return a category/group tree
         '''
         self.working_start(sender)
-        value = self._get_groups()
+        value = json.dumps(self._get_groups())
         return self.working_ended(value)
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='ss',
@@ -337,11 +656,31 @@ class YumDaemon(YumDaemonBase):
         pkg_ids = self._get_group_pkgs(grp_id, grp_flt)
         return self.working_ended(pkg_ids)
 
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='ass',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetGroupsPackages(self, grp_ids, grp_flt, sender=None ):
+        '''
+        Get packages for a list of groups by grp_ids and grp_flt
+        it will return a JSON string with a {grp_id : [pkg_id,...]} dict
+        :param grp_ids: The Group ids
+        :param grp_flt: Group Filter (all or default)
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_groups_pkgs(grp_ids, grp_flt))
+        return self.working_ended(value)
+
 
 
 #
 #  Template for new method
 #
+#    @Worker
+#    @Logger
 #    @dbus.service.method(DAEMON_INTERFACE,
 #                                          in_signature='',
 #                                          out_signature='',
@@ -388,16 +727,40 @@ class YumDaemon(YumDaemonBase):
         Check that the current sender is owning the yum lock
         :param sender:
         '''
-        if self._lock == sender:
+        if sender in self._lock:
             return True
         else:
-            raise YumLockedError('Yum is locked by another application')
+            raise YumLockedError('Yum is not locked by this application')
+
+    def _release_lock(self, sender):
+        '''
+        Release the lock for a sender, the YumBase is reset when
+        the last client has released the lock
+        :param sender:
+        '''
+        watch = self._client_watches.pop(sender, None)
+        if watch:
+            watch.cancel()
+        self._lock.release(sender)
+        self.logger.info('UNLOCK: Lock Release by %s (%i clients)' % (sender, len(self._lock)))
+        if not self._lock:
+            self._worker.add(self._reset_yumbase, (), {}, None)
+
+    def _on_client_owner_changed(self, sender, owner):
+        '''
+        NameOwnerChanged callback for a client holding the lock
+        release the lock if the client has left the bus without unlocking
+        '''
+        if not owner and sender in self._lock:
+            self.logger.info('LOCK: %s has left the bus' % sender)
+            self._release_lock(sender)
     
 
     def _get_yumbase(self, repos = []):
         '''
         Get a YumBase object to work with
         '''
+        self._reset_caches()
         self._yumbase = yum.YumBase()
         # make yum silent
         self._yumbase.preconf.errorlevel=0
@@ -407,10 +770,11 @@ class YumDaemon(YumDaemonBase):
         self._yumbase.repos.setProgressBar( DownloadCallback(self) )
         if repos:
             self._enable_repos_from_list(repos)                    
-        # Disable parallel down for this repo, we dont support it
+        # the session daemon only download metadata, so it keeps serial downloads
         for repo in self._yumbase.repos.listEnabled():
             repo._async = False
         self.logger.debug(' --> YUM LOCKED: Lockfile = %s' % self._yumbase._lockfile)
+        self._start_search_index()
 
 
     def _reset_yumbase(self):
@@ -424,6 +788,7 @@ class YumDaemon(YumDaemonBase):
             self.logger.debug(' --> YUM UNLOCKED : Lockfile = %s' % self._yumbase._lockfile)
             del self._yumbase
             self._yumbase = None
+        self._reset_caches()
 
 
 def main():
@@ -431,6 +796,8 @@ def main():
     parser.add_argument('-v', '--verbose', action='store_true')
     parser.add_argument('-d', '--debug', action='store_true')
     parser.add_argument('--notimeout', action='store_true')
+    parser.add_argument('--progress-rate', type=float, default=10.0,
+                        help='max progress signals pr. second for each file (0 = no limit)')
     args = parser.parse_args()
     if args.verbose:
         if args.debug:
@@ -438,10 +805,13 @@ def main():
         else:
             doTextLoggerSetup(logroot='yumdaemon')
 
-    # setup the DBus mainloop
+    # setup the DBus mainloop (the DBus methods using yum is running in a worker thread)
+    gobject.threads_init()
+    dbus.mainloop.glib.threads_init()
     dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
     mainloop = gobject.MainLoop()
     yd = YumDaemon(mainloop)
+    yd._progress_throttle.max_rate = args.progress_rate
     if not args.notimeout:
         yd._setup_watchdog()
     mainloop.run()
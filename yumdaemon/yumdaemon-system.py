@@ -22,7 +22,7 @@ import dbus.glib
 import gobject
 import json
 import logging
-from datetime import datetime
+import time
 import yum
 import yum.Errors as Errors
 from urlgrabber.progress import format_number
@@ -30,15 +30,17 @@ from yum.callbacks import *
 from yum.rpmtrans import RPMBaseCallback
 from yum.constants import *
 from yum.packageSack import packagesNewestByName
+from yum.sqlutils import executeSQL
 from yum.Errors import *
 
 import argparse
 
-from common import YumDaemonBase, doTextLoggerSetup, Logger, DownloadCallback, NONE, FAKE_ATTR
+from common import YumDaemonBase, doTextLoggerSetup, Logger, Worker, DownloadCallback, MultiDownloadCallback, TransactionProgress, to_dbus_variant, to_dbus_rows, make_v2_interface, NONE, FAKE_ATTR
 
 version = 902 #  (00.09.02) must be integer
 DAEMON_ORG = 'org.baseurl.YumSystem'
 DAEMON_INTERFACE = DAEMON_ORG
+DAEMON_INTERFACE_V2 = DAEMON_ORG + '.v2'
 
 def _(msg):
     return msg
@@ -50,9 +52,15 @@ class AccessDeniedError(dbus.DBusException):
 class YumLockedError(dbus.DBusException):
     _dbus_error_name = DAEMON_ORG+'.YumLockedError'
 
+class YumCancelledError(dbus.DBusException):
+    _dbus_error_name = DAEMON_ORG+'.YumCancelledError'
+
 class YumTransactionError(dbus.DBusException):
     _dbus_error_name = DAEMON_ORG+'.YumTransactionError'
 
+class YumCursorExpiredError(dbus.DBusException):
+    _dbus_error_name = DAEMON_ORG+'.YumCursorExpiredError'
+
 class YumNotImplementedError(dbus.DBusException):
     _dbus_error_name = DAEMON_ORG+'.YumNotImplementedError'
 
@@ -69,6 +77,9 @@ class ProcessTransCallback:
         self.base = base
 
     def event(self,state,data=NONE):
+        self.base._worker.check_cancelled()
+        if state in (PT_TEST_TRANS, PT_TRANSACTION): # the rpm transaction can't be cancelled
+            self.base._worker.set_cancellable(False) # raise if cancelled since the check above
         if state in ProcessTransCallback.STATES:
             if data != NONE:
                 data = [self.base._get_id(po) for po in data]
@@ -90,6 +101,7 @@ class RPMCallback(RPMBaseCallback):
     def __init__(self, base):
         RPMBaseCallback.__init__(self)
         self.base = base
+        self.progress = TransactionProgress(base.yumbase.tsInfo)
 
     def event(self, package, action, te_current, te_total, ts_current, ts_total):
         """
@@ -105,11 +117,17 @@ class RPMCallback(RPMBaseCallback):
         """
         if not isinstance(package, str): # package can be both str or yum package object
             id = self.base._get_id(package)
+            name = package.name
         else:
             id = package
+            name = package
+        frac = self.progress.update(name, action, te_current, te_total)
         if action in RPMCallback.ACTIONS:
             action = RPMCallback.ACTIONS[action]
-        self.base.RPMProgress(id, action, te_current, te_total, ts_current, ts_total)
+        if self.base._rpm_progress_clients: # the raw rpm progress is only send if a client has asked for it
+            self.base.RPMProgress(id, action, te_current, te_total, ts_current, ts_total)
+        if self.base._progress_throttle.allow(self, frac >= 1.0):
+            self.base.TransactionProgress(frac, id, action, ts_current, ts_total, self.progress.eta())
 
     def scriptout(self, package, msgs):
         """package is the package.  msgs is the messages that were
@@ -140,15 +158,220 @@ class DaemonYumBase(yum.YumBase):
 
 logger = logging.getLogger('yumdaemon')
 
+#------------------------------------------------------------------------------ v2 interface
+class YumDaemonV2(make_v2_interface(DAEMON_INTERFACE_V2, version)):
+    '''
+    The v2 DBus interface (DAEMON_INTERFACE_V2), the methods shared with the session daemon
+    is in common.make_v2_interface, only the history & transaction methods is added here
+    '''
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE_V2,
+                                          in_signature='i',
+                                          out_signature='aav',
+                                          sender_keyword='sender')
+    def GetHistoryPackages(self, tid,sender=None):
+        '''
+        Get packages from a given yum history transaction id
+        it will return a list of [pkg_id, tx_state, installed_state] lists
+        :param tid: history transaction id
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = self._get_history_transaction_pkgs(tid)
+        return self.working_ended(to_dbus_rows(value))
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE_V2,
+                                          in_signature='ai',
+                                          out_signature='a{iaav}',
+                                          sender_keyword='sender')
+    def GetHistoryTransactionsPackages(self, tids,sender=None):
+        '''
+        Get packages from a list of yum history transaction ids
+        it will return a {tid : [[pkg_id, tx_state, installed_state],...]} dict
+        :param tids: list of history transaction ids
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = self._get_history_transactions_pkgs(tids)
+        result = dbus.Dictionary(dict([(tid, to_dbus_rows(pkgs)) for tid, pkgs in value.iteritems()]), signature='iaav')
+        return self.working_ended(result)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE_V2,
+                                          in_signature='ii',
+                                          out_signature='a(is)',
+                                          sender_keyword='sender')
+    def GetHistoryByDays(self, start_days, end_days ,sender=None):
+        '''
+        Get History transaction in a interval of days from today
+        it will return a list of (transaction id, date-time) pairs
+        :param start_days: start of interval in days from now (0 = today)
+        :param end_days:end of interval in days from now
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = self._get_history_by_days(start_days, end_days)
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE_V2,
+                                          in_signature='iiii',
+                                          out_signature='a(is)',
+                                          sender_keyword='sender')
+    def GetHistoryByDaysPaged(self, start_days, end_days, offset, limit, sender=None):
+        '''
+        Get a page of the History transaction in a interval of days from today (newest first)
+        it will return a list of (transaction id, date-time) pairs
+        :param start_days: start of interval in days from now (0 = today)
+        :param end_days:end of interval in days from now
+        :param offset: number of transactions to skip
+        :param limit: max number of transactions (-1 = no limit)
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = self._get_history_by_days(start_days, end_days, offset, limit)
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE_V2,
+                                          in_signature='as',
+                                          out_signature='a(is)',
+                                          sender_keyword='sender')
+    def HistorySearch(self, pattern ,sender=None):
+        '''
+        Search the history for transaction matching a pattern
+        it will return a list of (transaction id, date-time) pairs
+        :param pattern: patterne to match
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = self._history_search(pattern)
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE_V2,
+                                          in_signature='',
+                                          out_signature='(iv)',
+                                          sender_keyword='sender')
+    def BuildTransaction(self, sender):
+        '''
+        Resolve dependencies of current transaction
+        it will return a (rc, output) pair, output is the transaction list or the error messages
+        '''
+        self.working_start(sender)
+        rc, output = self._build_transaction()
+        return self.working_ended((rc, to_dbus_variant(output)))
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE_V2,
+                                          in_signature='s',
+                                          out_signature='(iv)',
+                                          sender_keyword='sender')
+    def Install(self, cmds, sender=None):
+        '''
+        Install packages based on command patterns separated by spaces
+        sinulate what 'yum install <arguments>' does
+        it will return a (rc, output) pair, output is the transaction list or the error messages
+        :param cmds: command patterns separated by spaces
+        :param sender:
+        '''
+        self.working_start(sender)
+        rc, output = self._install(cmds)
+        return self.working_ended((rc, to_dbus_variant(output)))
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE_V2,
+                                          in_signature='s',
+                                          out_signature='(iv)',
+                                          sender_keyword='sender')
+    def Remove(self, cmds, sender=None):
+        '''
+        Remove packages based on command patterns separated by spaces
+        sinulate what 'yum remove <arguments>' does
+        it will return a (rc, output) pair, output is the transaction list or the error messages
+        :param cmds: command patterns separated by spaces
+        :param sender:
+        '''
+        self.working_start(sender)
+        rc, output = self._remove(cmds)
+        return self.working_ended((rc, to_dbus_variant(output)))
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE_V2,
+                                          in_signature='s',
+                                          out_signature='(iv)',
+                                          sender_keyword='sender')
+    def Update(self, cmds, sender=None):
+        '''
+        Update packages based on command patterns separated by spaces
+        sinulate what 'yum update <arguments>' does
+        it will return a (rc, output) pair, output is the transaction list or the error messages
+        :param cmds: command patterns separated by spaces
+        :param sender:
+        '''
+        self.working_start(sender)
+        rc, output = self._update(cmds)
+        return self.working_ended((rc, to_dbus_variant(output)))
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE_V2,
+                                          in_signature='s',
+                                          out_signature='(iv)',
+                                          sender_keyword='sender')
+    def Reinstall(self, cmds, sender=None):
+        '''
+        Reinstall packages based on command patterns separated by spaces
+        sinulate what 'yum reinstall <arguments>' does
+        it will return a (rc, output) pair, output is the transaction list or the error messages
+        :param cmds: command patterns separated by spaces
+        :param sender:
+        '''
+        self.working_start(sender)
+        rc, output = self._reinstall(cmds)
+        return self.working_ended((rc, to_dbus_variant(output)))
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE_V2,
+                                          in_signature='s',
+                                          out_signature='(iv)',
+                                          sender_keyword='sender')
+    def Downgrade(self, cmds, sender=None):
+        '''
+        Downgrade packages based on command patterns separated by spaces
+        sinulate what 'yum downgrade <arguments>' does
+        it will return a (rc, output) pair, output is the transaction list or the error messages
+        :param cmds: command patterns separated by spaces
+        :param sender:
+        '''
+        self.working_start(sender)
+        rc, output = self._downgrade(cmds)
+        return self.working_ended((rc, to_dbus_variant(output)))
+
 #------------------------------------------------------------------------------ Main class
-class YumDaemon(YumDaemonBase):
+class YumDaemon(YumDaemonV2):
 
     def __init__(self, mainloop):
         YumDaemonBase.__init__(self,  mainloop)
         self.logger = logging.getLogger('yumdaemon.system')
         bus_name = dbus.service.BusName(DAEMON_ORG, bus = dbus.SystemBus())
         dbus.service.Object.__init__(self, bus_name, '/')
+        self._worker.cancel_error = YumCancelledError
+        self.cursor_error = YumCursorExpiredError
         self._gpg_confirm = {}
+        self._rpm_progress_clients = {} # senders there want the raw RPMProgress signals -> NameOwnerChanged watch
 
 #===============================================================================
 # DBus Methods
@@ -164,6 +387,7 @@ class YumDaemon(YumDaemonBase):
         '''
         return version
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='',
@@ -177,11 +401,14 @@ class YumDaemon(YumDaemonBase):
         self.check_permission(sender)
         if self._can_quit:
             self._reset_yumbase()
-            self.mainloop.quit()
+            # this run in the worker thread, the reply is send from a mainloop idle callback,
+            # so quit the mainloop from a lower priority idle callback, after the reply is send
+            gobject.idle_add(self.mainloop.quit, priority=gobject.PRIORITY_LOW)
             return True
         else:
             return False
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='',
@@ -218,7 +445,75 @@ class YumDaemon(YumDaemonBase):
         self._watchdog_disabled = not state
         return state
 
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='b',
+                                          out_signature='b',
+                                          sender_keyword='sender')
+    def SetRPMProgress(self,state, sender=None):
+        '''
+        Enable the raw RPMProgress signals for every rpm callback (default disabled),
+        the TransactionProgress signals with the progress for the whole transaction is always send
+        :param state: True = RPMProgress signals enabled, False = disabled
+        :type state: boolean (b)
+        '''
+        self.check_permission(sender)
+        if state:
+            if not sender in self._rpm_progress_clients:
+                self._rpm_progress_clients[sender] = self.connection.watch_name_owner(sender,
+                                                     lambda owner: self._on_rpm_progress_owner_changed(sender, owner))
+        else:
+            self._stop_rpm_progress(sender)
+        return state
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='',
+                                          out_signature='a(is)',
+                                          sender_keyword='sender')
+    def GetOperations(self, sender=None):
+        '''
+        Get the running and queued operations started by the sender
+        :return: list of (handle, method name) pairs
+        :param sender:
+        '''
+        self.check_permission(sender)
+        return self._worker.get_operations(sender)
 
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='sd',
+                                          out_signature='',
+                                          sender_keyword='sender')
+    def SetDeadline(self, method, seconds, sender=None):
+        '''
+        Set a deadline for the next call of a method from the sender
+        the operation is cancelled in the daemon, when the deadline is reached
+        :param method: name of the method there is called next
+        :param seconds: seconds from the call is received to it is cancelled
+        :param sender:
+        '''
+        self.check_permission(sender)
+        self._worker.set_deadline(sender, method, seconds)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='i',
+                                          out_signature='b',
+                                          sender_keyword='sender')
+    def Cancel(self, handle, sender=None):
+        '''
+        Cancel an operation started by the sender
+        the operation return a YumCancelledError
+        :param handle: operation handle (from GetOperations)
+        :return: False if the operation is not found or can't be cancelled
+        :param sender:
+        '''
+        self.check_permission(sender)
+        return self._worker.cancel(handle, sender)
+
+
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -236,6 +531,7 @@ class YumDaemon(YumDaemonBase):
         return self.working_ended(repos)
 
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='as',
@@ -253,6 +549,7 @@ class YumDaemon(YumDaemonBase):
         return self.working_ended()
 
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -266,9 +563,10 @@ class YumDaemon(YumDaemonBase):
         :param sender:
         '''
         self.working_start(sender)
-        value = self._get_config(setting)
+        value = json.dumps(self._get_config(setting))
         return self.working_ended(value)
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='ss',
@@ -285,6 +583,7 @@ class YumDaemon(YumDaemonBase):
         rc = self._set_option(setting, json.loads(value))
         return self.working_ended(rc)
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -298,9 +597,10 @@ class YumDaemon(YumDaemonBase):
         :param sender:
         '''
         self.working_start(sender)
-        value = self._get_repo(repo_id)
+        value = json.dumps(self._get_repo(repo_id))
         return self.working_ended(value)
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -316,6 +616,7 @@ class YumDaemon(YumDaemonBase):
         value = self._get_packages(pkg_filter)
         return self.working_ended(value)
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='sas',
@@ -331,6 +632,78 @@ class YumDaemon(YumDaemonBase):
         value = self._get_package_with_attributes(pkg_filter, fields)
         return self.working_ended(json.dumps(value))
 
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='sas',
+                                          out_signature='a{sv}',
+                                          sender_keyword='sender')
+    def GetPackageColumns(self, pkg_filter, fields, sender=None):
+        '''
+        Get the packages for a package filter with attributes, in a column format
+        with a native DBus array for each column and the repo & arch names as index
+        :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+        :param fields: package attributes to get for each package
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = self._get_package_columns(pkg_filter, fields)
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='sas',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def OpenPackageCursor(self, pkg_filter, fields, sender=None):
+        '''
+        Open a cursor for a package list, so it can be fetched a page at the time with FetchCursor
+        :param pkg_filter: pkg pkg_filter string ('installed','updates' etc)
+        :param fields: package attributes to get for each package
+        :return: (handle, number of packages) pair (JSON)
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._open_package_cursor(pkg_filter, fields, sender))
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='sii',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def FetchCursor(self, handle, offset, limit, sender=None):
+        '''
+        Get a page of packages from an open cursor
+        :param handle: cursor handle from OpenPackageCursor
+        :param offset: index of the first package to get (a negative offset is handled as 0)
+        :param limit: max number of packages to get (-1 = no limit)
+        :return: list of [pkg_id, field,....] lists, None if the cursor is not open or owned by another client (JSON)
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._fetch_cursor(handle, offset, limit, sender))
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='s',
+                                          out_signature='b',
+                                          sender_keyword='sender')
+    def CloseCursor(self, handle, sender=None):
+        '''
+        Close an open cursor
+        :param handle: cursor handle from OpenPackageCursor
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = self._close_cursor(handle, sender)
+        return self.working_ended(value)
+
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='sb',
@@ -347,7 +720,76 @@ class YumDaemon(YumDaemonBase):
         pkg_ids = self._get_packages_by_name(name, newest_only)
         return self.working_ended(pkg_ids)
 
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='as',
+                                          out_signature='as',
+                                          sender_keyword='sender')
+    def WhatProvides(self, patterns, sender=None):
+        '''
+        Get a list of the installed & available packages providing some capabilities or files
+        :param patterns: list of capabilities/files (ex. /usr/bin/foo, libssl.so.10()(64bit))
+        :param sender:
+        '''
+        self.working_start(sender)
+        pkg_ids = self._what_provides(patterns)
+        return self.working_ended(pkg_ids)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='as',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetRequires(self, ids, sender=None):
+        '''
+        Get the packages providing the requirements for a list of yum package ids
+        it will return a JSON string with a {pkg_id : [pkg_id,...]} dict
+        :param ids: list of yum package ids
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_requires(ids))
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='as',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetRequiredBy(self, ids, sender=None):
+        '''
+        Get the installed packages requiring the packages for a list of yum package ids
+        it will return a JSON string with a {pkg_id : [pkg_id,...]} dict
+        :param ids: list of yum package ids
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_required_by(ids))
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='asb',
+                                          out_signature='as',
+                                          sender_keyword='sender')
+    def GetDependencyClosure(self, ids, reverse, sender=None):
+        '''
+        Get all the packages needed by a list of yum package ids (all levels)
+        or if reverse is True, the installed packages there need them (what a remove will remove too)
+        :param ids: list of yum package ids
+        :param reverse: get the installed packages there need them
+        :param sender:
+        '''
+        self.working_start(sender)
+        pkg_ids = self._get_dependency_closure(ids, reverse)
+        return self.working_ended(pkg_ids)
+
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='ss',
@@ -362,9 +804,48 @@ class YumDaemon(YumDaemonBase):
         :param sender:
         '''
         self.working_start(sender)
-        value = self._get_attribute( id, attr)
+        value = json.dumps(self._get_attribute( id, attr))
         return self.working_ended(value)
 
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='ssii',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetAttributeSlice(self, id, attr, offset, limit, sender=None):
+        '''
+        Get a part of a list attribute (changelog, filelist etc..) from a yum package id
+        it will return a JSON string with a (total, [item,...]) pair or None if the package is not found
+        :param id: yum package id
+        :param attr: name of attribute (changelog, filelist etc..)
+        :param offset: index of the first item to return
+        :param limit: max number of items to return (-1 = no limit)
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_attribute_slice(id, attr, offset, limit))
+        return self.working_ended(value)
+
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='asas',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetAttributes(self, ids, attrs, sender=None):
+        '''
+        Get a list of attributes from a list of yum package ids
+        it will return a JSON string with a {pkg_id : {attr : value}} dict
+        :param ids: list of yum package ids
+        :param attrs: list of attribute names (summary, size, action etc..)
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_attributes(ids, attrs))
+        return self.working_ended(value)
+
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -378,10 +859,28 @@ class YumDaemon(YumDaemonBase):
         :param sender:
         '''
         self.working_start(sender)
-        value = self._get_updateInfo(id)
+        value = json.dumps(self._get_updateInfo(id))
         return self.working_ended(value)
 
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='as',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetUpdateInfos(self, ids,sender=None):
+        '''
+        Get the Update Infomation for a list of yum package ids
+        it will return a JSON string with a {pkg_id : [notice,...]} dict
+        :param ids: list of yum package ids
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_updateInfos(ids))
+        return self.working_ended(value)
 
+
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='i',
@@ -400,7 +899,25 @@ class YumDaemon(YumDaemonBase):
         value = json.dumps(self._get_history_transaction_pkgs(tid))
         return self.working_ended(value)
 
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='ai',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetHistoryTransactionsPackages(self, tids,sender=None):
+        '''
+        Get packages from a list of yum history transaction ids
+        it will return a JSON string with a {tid : [(pkg_id, tx_state, installed_state),...]} dict
+        :param tids: list of history transaction ids
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_history_transactions_pkgs(tids))
+        return self.working_ended(value)
+
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='ii',
@@ -421,6 +938,30 @@ class YumDaemon(YumDaemonBase):
         value = json.dumps(self._get_history_by_days(start_days, end_days))
         return self.working_ended(value)
 
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='iiii',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetHistoryByDaysPaged(self, start_days, end_days, offset, limit, sender=None):
+        '''
+        Get a page of the History transaction in a interval of days from today (newest first)
+
+        :param start_days: start of interval in days from now (0 = today)
+        :type start_days: integer
+        :param end_days:end of interval in days from now
+        :type end_days: integer
+        :param offset: number of transactions to skip
+        :param limit: max number of transactions (-1 = no limit)
+        :return: a list of (transaction is, date-time) pairs
+        :type sender: json encoded string
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_history_by_days(start_days, end_days, offset, limit))
+        return self.working_ended(value)
+
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='as',
@@ -439,6 +980,7 @@ class YumDaemon(YumDaemonBase):
         return self.working_ended(value)
 
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='',
@@ -448,11 +990,13 @@ class YumDaemon(YumDaemonBase):
         ''' release the lock'''
         self.check_permission(sender)
         if self.check_lock(sender):
+            gobject.idle_add(self._stop_rpm_progress, sender) # the watch is removed from the mainloop
             self._reset_yumbase()
             self.logger.info('UNLOCK: Lock Release by %s' % self._lock)
             self._lock = None
             return True
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -466,14 +1010,10 @@ class YumDaemon(YumDaemonBase):
         :param sender:
         '''
         self.working_start(sender)
-        for cmd in cmds.split(' '):
-            if cmd.endswith('.rpm'):
-                self.yumbase.installLocal(cmd)
-            else:        
-                self.yumbase.install(pattern=cmd)
-        value = self._build_transaction()
+        value = json.dumps(self._install(cmds))
         return self.working_ended(value)
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -487,11 +1027,10 @@ class YumDaemon(YumDaemonBase):
         :param sender:
         '''
         self.working_start(sender)
-        for cmd in cmds.split(' '):
-            self.yumbase.remove(pattern=cmd)
-        value = self._build_transaction()
+        value = json.dumps(self._remove(cmds))
         return self.working_ended(value)
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -505,15 +1044,10 @@ class YumDaemon(YumDaemonBase):
         :param sender:
         '''
         self.working_start(sender)
-        if cmds == "":
-            txmbrs = self.yumbase.update()
-            self.logger.debug([str(txmbr.po) for txmbr in txmbrs])
-        else:
-            for cmd in cmds.split(' '):
-                self.yumbase.update(pattern=cmd)
-        value = self._build_transaction()
+        value = json.dumps(self._update(cmds))
         return self.working_ended(value)
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -527,11 +1061,10 @@ class YumDaemon(YumDaemonBase):
         :param sender:
         '''
         self.working_start(sender)
-        for cmd in cmds.split(' '):
-            self.yumbase.reinstall(pattern=cmd)
-        value = self._build_transaction()
+        value = json.dumps(self._reinstall(cmds))
         return self.working_ended(value)
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='s',
@@ -545,12 +1078,11 @@ class YumDaemon(YumDaemonBase):
         :param sender:
         '''
         self.working_start(sender)
-        for cmd in cmds.split(' '):
-            self.yumbase.downgrade(pattern=cmd)
-        value = self._build_transaction()
+        value = json.dumps(self._downgrade(cmds))
         return self.working_ended(value)
 
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='ss',
@@ -584,6 +1116,7 @@ class YumDaemon(YumDaemonBase):
         value = self._to_transaction_id_list(txmbrs)
         return self.working_ended(value)
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='',
@@ -599,6 +1132,7 @@ class YumDaemon(YumDaemonBase):
         return self.working_ended()
 
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='',
@@ -615,6 +1149,7 @@ class YumDaemon(YumDaemonBase):
         return self.working_ended(value)
 
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='',
@@ -625,23 +1160,83 @@ class YumDaemon(YumDaemonBase):
         Resolve dependencies of current transaction
         '''
         self.working_start(sender)
-        value = self._build_transaction()
+        value = json.dumps(self._build_transaction())
         return self.working_ended(value)
 
 
+    def _install(self, cmds):
+        '''
+        Add packages to the transaction like 'yum install <arguments>' and resolve the dependencies
+        return a (rc, output) pair like _build_transaction
+        :param cmds: command patterns separated by spaces
+        '''
+        for cmd in cmds.split(' '):
+            if cmd.endswith('.rpm'):
+                self.yumbase.installLocal(cmd)
+            else:
+                self.yumbase.install(pattern=cmd)
+        return self._build_transaction()
+
+    def _remove(self, cmds):
+        '''
+        Add packages to the transaction like 'yum remove <arguments>' and resolve the dependencies
+        return a (rc, output) pair like _build_transaction
+        :param cmds: command patterns separated by spaces
+        '''
+        for cmd in cmds.split(' '):
+            self.yumbase.remove(pattern=cmd)
+        return self._build_transaction()
+
+    def _update(self, cmds):
+        '''
+        Add packages to the transaction like 'yum update <arguments>' and resolve the dependencies
+        return a (rc, output) pair like _build_transaction
+        :param cmds: command patterns separated by spaces
+        '''
+        if cmds == "":
+            txmbrs = self.yumbase.update()
+            self.logger.debug([str(txmbr.po) for txmbr in txmbrs])
+        else:
+            for cmd in cmds.split(' '):
+                self.yumbase.update(pattern=cmd)
+        return self._build_transaction()
+
+    def _reinstall(self, cmds):
+        '''
+        Add packages to the transaction like 'yum reinstall <arguments>' and resolve the dependencies
+        return a (rc, output) pair like _build_transaction
+        :param cmds: command patterns separated by spaces
+        '''
+        for cmd in cmds.split(' '):
+            self.yumbase.reinstall(pattern=cmd)
+        return self._build_transaction()
+
+    def _downgrade(self, cmds):
+        '''
+        Add packages to the transaction like 'yum downgrade <arguments>' and resolve the dependencies
+        return a (rc, output) pair like _build_transaction
+        :param cmds: command patterns separated by spaces
+        '''
+        for cmd in cmds.split(' '):
+            self.yumbase.downgrade(pattern=cmd)
+        return self._build_transaction()
+
     def _build_transaction(self):
         '''
         Resolve dependencies of current transaction
+        return a (rc, output) pair, output is the transaction list or the error messages
         '''
         self.TransactionEvent('start-build',NONE)
         rc, msgs = self.yumbase.buildTransaction()
+        self._worker.check_cancelled()
         if rc == 2: # OK
             output = self._get_transaction_list()
         else:
             output = msgs
         self.TransactionEvent('end-build',NONE)
-        return json.dumps((rc,output))
+        return (rc,output)
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='',
@@ -659,6 +1254,7 @@ class YumDaemon(YumDaemonBase):
             self._can_quit = False
             callback = ProcessTransCallback(self)
             rpmDisplay = RPMCallback(self)
+            self._set_changed_names()
             result = self.yumbase.processTransaction(callback=callback, rpmDisplay=rpmDisplay)
             self._can_quit = True
             self._reset_yumbase()
@@ -666,6 +1262,10 @@ class YumDaemon(YumDaemonBase):
             return self.working_ended(0)
         except Errors.YumGPGCheckError, errmsg: # GPG Key import needed
             return self.working_ended(1)       # return 1 to tell the client we need a ask the user for gpg import confirmation and run again           
+        except (YumCancelledError, KeyboardInterrupt): # cancelled before the rpm transaction was started
+            self._can_quit = True
+            self.TransactionEvent('fail',NONE)
+            raise
         except Errors.YumBaseError, e:
             self._can_quit = True
             if str(e) == "Didn't install any keys": #FIXME: This is crap, find a better way
@@ -675,6 +1275,7 @@ class YumDaemon(YumDaemonBase):
             return self.working_ended(2)
             #raise YumTransactionError(str(e))
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='asasbbb',
@@ -694,6 +1295,38 @@ class YumDaemon(YumDaemonBase):
         result = self._search(fields, keys, match_all, newest_only, tags)
         return self.working_ended(result)
 
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetSearchCacheStats(self, sender=None ):
+        '''
+        Get the search result cache counters (for tuning)
+        :return: dict with hits, misses, narrowed, size & max_size (JSON)
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_search_cache_stats())
+        return self.working_ended(value)
+
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetProgressStats(self, sender=None ):
+        '''
+        Get the progress signal counters, the signals suppressed by the rate limit (for tuning)
+        it is answered right away, also while a download is running
+        :return: dict with max_rate, sent & suppressed (JSON)
+        :param sender:
+        '''
+        self.check_permission(sender)
+        return json.dumps(self._get_progress_stats())
+
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='',
@@ -704,10 +1337,11 @@ class YumDaemon(YumDaemonBase):
         Return a category/group tree
         '''
         self.working_start(sender)
-        value = self._get_groups()
+        value = json.dumps(self._get_groups())
         return self.working_ended(value)
 
 
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='ss',
@@ -724,6 +1358,25 @@ class YumDaemon(YumDaemonBase):
         pkg_ids = self._get_group_pkgs(grp_id, grp_flt)
         return self.working_ended(pkg_ids)
 
+    @Worker
+    @Logger
+    @dbus.service.method(DAEMON_INTERFACE,
+                                          in_signature='ass',
+                                          out_signature='s',
+                                          sender_keyword='sender')
+    def GetGroupsPackages(self, grp_ids, grp_flt, sender=None ):
+        '''
+        Get packages for a list of groups by grp_ids and grp_flt
+        it will return a JSON string with a {grp_id : [pkg_id,...]} dict
+        :param grp_ids: The Group ids
+        :param grp_flt: Group Filter (all or default)
+        :param sender:
+        '''
+        self.working_start(sender)
+        value = json.dumps(self._get_groups_pkgs(grp_ids, grp_flt))
+        return self.working_ended(value)
+
+    @Worker
     @Logger
     @dbus.service.method(DAEMON_INTERFACE,
                                           in_signature='sb',
@@ -745,6 +1398,8 @@ class YumDaemon(YumDaemonBase):
 #
 #  Template for new method
 #
+#    @Worker
+#    @Logger
 #    @dbus.service.method(DAEMON_INTERFACE,
 #                                          in_signature='',
 #                                          out_signature='',
@@ -774,6 +1429,20 @@ class YumDaemon(YumDaemonBase):
         '''
         pass
 
+    @dbus.service.signal(DAEMON_INTERFACE, signature='dttddii')
+    def DownloadProgress(self, frac, read, total, rate, eta, files, total_files):
+        '''
+        DBus signal with the progress for all the files in a parallel download
+        :param frac: Progress fracment for all files (0 -> 1)
+        :param read: bytes downloaded
+        :param total: total bytes to download
+        :param rate: average download rate (bytes/s)
+        :param eta: estimated remaining time (seconds)
+        :param files: number of files downloaded
+        :param total_files: number of files to download
+        '''
+        pass
+
     @dbus.service.signal(DAEMON_INTERFACE)
     def TransactionEvent(self,event,data):
         '''
@@ -788,10 +1457,24 @@ class YumDaemon(YumDaemonBase):
         pass
 
 
+    @dbus.service.signal(DAEMON_INTERFACE, signature='dssiid')
+    def TransactionProgress(self, frac, package, action, ts_current, ts_total, eta):
+        '''
+        DBus signal with the progress for the whole rpm transaction (rate limited)
+        the progress is weighted by the package sizes in the transaction
+        :param frac: Progress fracment for the whole transaction (0 -> 1)
+        :param package: pkg_id (or name) of the current transaction element
+        :param action: action for the current element (install, update, erase, cleanup etc.)
+        :param ts_current: number of elements completed in the transaction
+        :param ts_total: number of elements in the transaction
+        :param eta: estimated remaining time (seconds)
+        '''
+        pass
+
     @dbus.service.signal(DAEMON_INTERFACE)
     def RPMProgress(self, package, action, te_current, te_total, ts_current, ts_total):
         """
-        RPM Progress DBus signal
+        RPM Progress DBus signal (only send when a client has enabled it with SetRPMProgress)
         :param package: A yum package object or simple string of a package name
         :param action: A yum.constant transaction set state or in the obscure
                        rpm repackage case it could be the string 'repackaging'
@@ -821,6 +1504,24 @@ class YumDaemon(YumDaemonBase):
 #===============================================================================
 # Helper methods
 #===============================================================================
+    def _stop_rpm_progress(self, sender):
+        '''
+        Stop the raw RPMProgress signals for a sender (mainloop)
+        '''
+        watch = self._rpm_progress_clients.pop(sender, None)
+        if watch:
+            watch.cancel()
+        return False
+
+    def _on_rpm_progress_owner_changed(self, sender, owner):
+        '''
+        NameOwnerChanged callback for a sender there want the raw RPMProgress signals
+        the signals is stopped if the sender has left the bus
+        '''
+        if not owner:
+            self.logger.debug('RPMProgress: %s has left the bus' % sender)
+            self._stop_rpm_progress(sender)
+
     def working_start(self,sender):
         self.check_permission(sender)
         self.check_lock(sender)
@@ -865,28 +1566,56 @@ class YumDaemon(YumDaemonBase):
             return False
 
 
-    def _get_history_by_days(self, start, end):
+    def _get_history_by_days(self, start, end, offset=0, limit=-1):
         '''
         Get the yum history transaction member located in a date interval from today
         :param start: start days from today
         :param end: end days from today
-        '''
-        now = datetime.now()
-        history = self.yumbase.history.old()
-        i = 0
-        result = []
-        while i < len(history):
-            ht = history[i]
-            i += 1
-            tm = datetime.fromtimestamp(ht.end_timestamp)
-            delta = now-tm
-            if delta.days < start: # before start days
-                continue
-            elif delta.days > end: # after end days
-                break
-            result.append(ht)
+        :param offset: number of transactions to skip (newest first)
+        :param limit: max number of transactions (-1 = no limit)
+        '''
+        now = time.time()
+        # a transaction is <days> old, if it ended between days and days+1 days ago
+        first = now - (end + 1) * 86400
+        last = now - start * 86400
+        offset = max(offset, 0)
+        tids = self._get_history_tids_by_time(first, last, offset, limit)
+        if tids is None: # use the public history API, it load the whole history
+            result = [ht for ht in self.yumbase.history.old() if first < ht.end_timestamp <= last]
+            result.sort(key=lambda ht: (ht.end_timestamp, ht.tid), reverse=True)
+            if limit < 0:
+                result = result[offset:]
+            else:
+                result = result[offset:offset+limit]
+        else:
+            found = {}
+            for i in range(0, len(tids), 100): # yum only use the tid index for up to 128 tids
+                for ht in self.yumbase.history.old(tids[i:i+100]):
+                    found[ht.tid] = ht
+            result = [found[tid] for tid in tids if tid in found]
         return self._get_id_time_list(result)
 
+    def _get_history_tids_by_time(self, first, last, offset, limit):
+        '''
+        Get a page of the tids for the transactions ended in a time interval (newest first)
+        yum history has no public query for this, so the trans_end table of the yum 3 history db
+        is read with the private history cursor, it return None if that fails with the current yum
+        :param first: the transactions must end after this time
+        :param last: the transactions must end before or at this time
+        :param offset: number of transactions to skip
+        :param limit: max number of transactions (-1 = no limit)
+        '''
+        try:
+            cur = self.yumbase.history._get_cursor()
+            if cur is None: # no history db
+                return []
+            executeSQL(cur, '''SELECT tid FROM trans_end WHERE timestamp > ? AND timestamp <= ?
+                               ORDER BY timestamp DESC, tid DESC LIMIT ? OFFSET ?''', (first, last, limit, offset))
+            return [row[0] for row in cur]
+        except Exception, e: # another yum version or history db schema
+            self.logger.debug('history db query failed : %s' % str(e))
+            return None
+
     def _history_search(self, pattern):
         '''
         search in yum history
@@ -902,13 +1631,24 @@ class YumDaemon(YumDaemonBase):
         return a list of (pkg_id, tx_state, installed_state) pairs from a given
         yum history transaction id
         '''
-        tx = self.yumbase.history.old([tid])
-        result = []
-        for pkg in tx[0].trans_data:
-            values = [pkg.name, pkg.epoch, pkg.version, pkg.release, pkg.arch, pkg.ui_from_repo]
-            id = ",".join(values)
-            elem = (id, pkg.state, pkg.state_installed)
-            result.append(elem)
+        return self._get_history_transactions_pkgs([tid]).get(tid, [])
+
+    def _get_history_transactions_pkgs(self, tids):
+        '''
+        return a {tid : [(pkg_id, tx_state, installed_state),...]} dict for a list of
+        yum history transaction ids, the transactions is loaded in one history query
+        '''
+        result = {}
+        if not tids:
+            return result
+        for tx in self.yumbase.history.old(tids):
+            pkgs = []
+            for pkg in tx.trans_data:
+                values = [pkg.name, pkg.epoch, pkg.version, pkg.release, pkg.arch, pkg.ui_from_repo]
+                id = ",".join(values)
+                elem = (id, pkg.state, pkg.state_installed)
+                pkgs.append(elem)
+            result[tx.tid] = pkgs
         return result
 
     def _get_transaction_list(self):
@@ -1006,22 +1746,24 @@ class YumDaemon(YumDaemonBase):
         '''
         Get a YumBase object to work with
         '''
+        self._reset_caches()
         self._yumbase = DaemonYumBase(self)
         # make yum silent
         self._yumbase.preconf.errorlevel=0
         self._yumbase.preconf.debuglevel=0
         #self._yumbase.doConfigSetup()
-        # setup the download callback handler
-        self._yumbase.repos.setProgressBar( DownloadCallback(self) )
+        # setup the download callback handlers, the multi file one is used for parallel downloads
+        try:
+            self._yumbase.repos.setProgressBar( DownloadCallback(self), MultiDownloadCallback(self) )
+        except TypeError: # yum without parallel downloads
+            self._yumbase.repos.setProgressBar( DownloadCallback(self) )
         if repos:
             self._enable_repos_from_list(repos)            
-        # Disable parallel down for this repo, we dont support it
-        for repo in self._yumbase.repos.listEnabled():
-            repo._async = False
 
         self._yumbase.doLock()
         self.logger.debug(' --> YUM LOCKED: Lockfile = %s' % self._yumbase._lockfile)
-        ygh = self._yumbase.doPackageLists("updates") # make sure the basic stuff is up and running
+        self._get_updates() # make sure the basic stuff is up and running (and the updates is cached)
+        self._start_search_index()
 
     def _reset_yumbase(self):
         '''
@@ -1034,6 +1776,7 @@ class YumDaemon(YumDaemonBase):
             self.logger.debug(' --> YUM UNLOCKED : Lockfile = %s' % self._yumbase._lockfile)
             del self._yumbase
             self._yumbase = None
+        self._reset_caches()
 
 
 
@@ -1042,6 +1785,8 @@ def main():
     parser.add_argument('-v', '--verbose', action='store_true')
     parser.add_argument('-d', '--debug', action='store_true')
     parser.add_argument('--notimeout', action='store_true')
+    parser.add_argument('--progress-rate', type=float, default=10.0,
+                        help='max progress signals pr. second for each file (0 = no limit)')
     args = parser.parse_args()
     if args.verbose:
         if args.debug:
@@ -1049,10 +1794,13 @@ def main():
         else:
             doTextLoggerSetup(logroot='yumdaemon')
 
-    # setup the DBus mainloop
+    # setup the DBus mainloop (the DBus methods using yum is running in a worker thread)
+    gobject.threads_init()
+    dbus.mainloop.glib.threads_init()
     dbus.mainloop.glib.DBusGMainLoop(set_as_default=True)
     mainloop = gobject.MainLoop()
     yd = YumDaemon(mainloop)
+    yd._progress_throttle.max_rate = args.progress_rate
     if not args.notimeout:
         yd._setup_watchdog()
     mainloop.run()